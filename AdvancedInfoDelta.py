@@ -0,0 +1,178 @@
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import zlib
+from os.path import exists
+
+from AdvancedInfoSchema import ADVANCED_INFO_COLUMNS
+
+# Series of the bhavcopy whose close price is used, in order of preference.
+BHAVCOPY_SERIES = ('EQ', 'BE')
+# Columns which move with the price and are rescaled when only the CMP is refreshed, with their rounding.
+PRICE_SCALED_COLUMNS = {'PE': 2, 'PRICETOSALES': 2, 'MARKETCAP': 0}
+# Columns compared to decide whether a row changed. DATENUM/DATE change every run and are left out.
+DELTA_COMPARE_COLUMNS = [column for column in ADVANCED_INFO_COLUMNS if column not in ('DATENUM', 'DATE')]
+
+
+def ParseBhavcopyClosePrices(content):
+    '''
+    Parse an NSE full bhavcopy (sec_bhavdata_full_DDMMYYYY.csv) into a SYMBOL -> CLOSE_PRICE dictionary.
+    The headers and values of the file are padded with spaces. Only the BHAVCOPY_SERIES are used.
+    '''
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', errors='replace')
+    prices = {}
+    series = {}
+    for row in csv.DictReader(io.StringIO(content), skipinitialspace=True):
+        row = {str(key).strip(): (value or '').strip() for key, value in row.items()}
+        if row.get('SERIES') not in BHAVCOPY_SERIES:
+            continue
+        rank = BHAVCOPY_SERIES.index(row['SERIES'])
+        if row['SYMBOL'] in series and series[row['SYMBOL']] <= rank:
+            continue
+        try:
+            prices[row['SYMBOL']] = float(row['CLOSE_PRICE'])
+        except (KeyError, ValueError):
+            continue
+        series[row['SYMBOL']] = rank
+    return prices
+
+
+def _ToFloat(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def ApplyClosePrice(row, close, runColumns):
+    '''
+    Return a copy of an Advanced Info row for the run with its CMP set to the close price. PE, PRICETOSALES and
+    MARKETCAP are scaled by the price change, every other column is carried over.
+    '''
+    newRow = dict(row)
+    newRow.update(runColumns)
+    cmp = _ToFloat(row.get('CMP'))
+    newRow['CMP'] = close
+    if not cmp:
+        return newRow
+    ratio = close / cmp
+    if ratio == 1:
+        return newRow
+    for column, digits in PRICE_SCALED_COLUMNS.items():
+        value = _ToFloat(row.get(column))
+        if value is not None:
+            newRow[column] = round(value * ratio, digits) if digits else int(round(value * ratio))
+    return newRow
+
+
+def _SameValue(previousValue, value):
+    # dlevels reports numbers as text ("1.60"), the rescaled columns are floats, so numbers are compared as numbers.
+    previousNumber, number = _ToFloat(previousValue), _ToFloat(value)
+    if previousNumber is not None and number is not None:
+        return previousNumber == number
+    return str(previousValue) == str(value)
+
+
+def RowChanged(previousRow, row):
+    return previousRow is None or not all(_SameValue(previousRow.get(column), row.get(column)) for column in DELTA_COMPARE_COLUMNS)
+
+
+class AdvancedInfoState:
+    def __init__(self, state_file_path, refresh_days=7, price_change_threshold=0.05):
+        """
+        Per symbol state of the delta runs: the last Advanced Info row of every symbol, the day its fundamentals
+        were last fetched from dlevels and the CMP at that time. Decides which symbols need their fundamentals
+        refreshed and which only get their price updated from the bhavcopy.
+
+        :param state_file_path: Path of the JSON file holding the state.
+        :param refresh_days: Fundamentals of a symbol are refreshed at least every refresh_days days. The refreshes
+                             are spread over the days, so about 1/refresh_days of the symbols are refreshed per run.
+        :param price_change_threshold: Fundamentals are also refreshed when the price moved by more than this
+                                       fraction since they were last fetched, as the valuation may have changed.
+        """
+        self.logger = logging.getLogger('AdvancedInfoState')
+        self.state_file_path = state_file_path
+        self.refresh_days = max(1, refresh_days)
+        self.price_change_threshold = price_change_threshold
+        self.symbols = self._load_state()
+
+    def _load_state(self):
+        if exists(self.state_file_path):
+            try:
+                with open(self.state_file_path, 'r') as file:
+                    return json.load(file)['symbols']
+            except (IOError, ValueError, KeyError) as e:
+                self.logger.error(f"Could not read delta state '{self.state_file_path}': {e}. Starting with an empty state.")
+        return {}
+
+    def save(self):
+        temp_file_path = self.state_file_path + '.tmp'
+        with open(temp_file_path, 'w') as file:
+            json.dump({'symbols': self.symbols}, file)
+        os.replace(temp_file_path, self.state_file_path)
+        self.logger.info(f"Saved the delta state of {len(self.symbols)} symbols to '{self.state_file_path}'.")
+
+    def row(self, symbol):
+        """Return the last Advanced Info row of the symbol, or None."""
+        entry = self.symbols.get(symbol)
+        return entry['row'] if entry else None
+
+    def refresh_reason(self, symbol, close, datenum):
+        """
+        Return why the fundamentals of the symbol have to be fetched in the run of datenum (YYYYMMDD), or None when
+        applying the close price to its last row is enough.
+
+        :param symbol: The NSE symbol.
+        :param close: Close price of the symbol from the bhavcopy, None when it is not available.
+        :param datenum: DATENUM of the run.
+        """
+        entry = self.symbols.get(symbol)
+        if entry is None:
+            return 'new'
+        if close is None:
+            return 'no price'
+        day = datetime.datetime.strptime(str(datenum), '%Y%m%d').date()
+        refreshed = datetime.datetime.strptime(str(entry['refreshed']), '%Y%m%d').date()
+        if (day - refreshed).days >= self.refresh_days:
+            return 'stale'
+        if day != refreshed and (day.toordinal() + zlib.crc32(symbol.encode())) % self.refresh_days == 0:
+            return 'scheduled'
+        refresh_cmp = _ToFloat(entry.get('refresh_cmp'))
+        if not refresh_cmp or abs(close / refresh_cmp - 1) > self.price_change_threshold:
+            return 'price moved'
+        return None
+
+    def update(self, row, refreshed):
+        """
+        Record the row of a symbol. Returns True when it differs from the previous row of the symbol.
+
+        :param row: The Advanced Info row.
+        :param refreshed: True when the row was built from freshly fetched fundamentals.
+        """
+        entry = self.symbols.get(row['SYMBOL'])
+        changed = RowChanged(entry['row'] if entry else None, row)
+        if refreshed or entry is None:
+            entry = {'refreshed': int(row['DATENUM']), 'refresh_cmp': row['CMP']}
+            self.symbols[row['SYMBOL']] = entry
+        entry['row'] = dict(row)
+        return changed
+
+    def write_snapshot(self, file_path, symbols, runColumns):
+        """
+        Write the full Advanced Info snapshot of the given symbols (those without a row are skipped) with the DATENUM
+        and DATE of the run. Returns the number of rows written.
+        """
+        rowsWritten = 0
+        with open(file_path, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=ADVANCED_INFO_COLUMNS)
+            writer.writeheader()
+            for symbol in symbols:
+                row = self.row(symbol)
+                if row is not None:
+                    writer.writerow(dict(row, **runColumns))
+                    rowsWritten += 1
+        return rowsWritten
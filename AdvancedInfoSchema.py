@@ -0,0 +1,138 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+# Columns of the Advanced Info CSV, in file order.
+ADVANCED_INFO_COLUMNS = ["DATENUM", "DATE", "SYMBOL", "NAME", "SECTOR", "CMP", "VALUATION", "FAIRRANGE", "PE", "SECTORPE",
+                         "MARKETCAP", "MKCAPTYPE", "TREND", "FUNDAMENTAL", "MOMENTUM", "DERATIO", "PRICETOSALES", "PLEDGE",
+                         "QBS", "QBS%", "AGS", "AGS%", "VALUATION_DCF", "VALUATION_GRAHAM", "VALUATION_EARNING",
+                         "VALUATION_BOOKVALUE", "VALUATION_SALES"]
+
+# Advanced Info column -> field of the DLevel Basic Info row merged with its Fundamental Report.
+FIELD_MAPPING = {
+    "SYMBOL": "SYMBOL",
+    "NAME": "NAME",
+    "SECTOR": "SECTOR",
+    "CMP": "LastClose",
+    "VALUATION": "valuation",
+    "PE": "Pe",
+    "MARKETCAP": "MarketCap",
+    "MKCAPTYPE": "MkCapType",
+    "TREND": "technical_trend",
+    "FUNDAMENTAL": "stock_fundamental",
+    "MOMENTUM": "price_momentum",
+    "DERATIO": "Deratio",
+    "PRICETOSALES": "PriceToSales",
+    "PLEDGE": "Pledge",
+    "QBS": "Qbs",
+    "QBS%": "qbs_perc",
+    "AGS": "Ags",
+    "AGS%": "ags_perc",
+}
+# Columns which are no longer published by dlevels and are written with a fixed value.
+CONSTANT_COLUMNS = {
+    "FAIRRANGE": "0-0",
+    "SECTORPE": "0",
+    "VALUATION_DCF": "0",
+    "VALUATION_GRAHAM": "0",
+    "VALUATION_EARNING": "0",
+    "VALUATION_BOOKVALUE": "0",
+    "VALUATION_SALES": "0",
+}
+# Columns holding a score reported as "8/10", written as "8(10)".
+SCORE_COLUMNS = ("QBS", "AGS")
+
+_REQUIRED_FIELDS = frozenset(FIELD_MAPPING.values())
+
+# Explicit dtypes of an Advanced Info DataFrame. The text columns with few distinct values are categoricals.
+NUMERIC_COLUMNS = ['CMP', 'PE', 'SECTORPE', 'MARKETCAP', 'DERATIO', 'PRICETOSALES', 'PLEDGE',
+                   'VALUATION_DCF', 'VALUATION_GRAHAM', 'VALUATION_EARNING', 'VALUATION_BOOKVALUE', 'VALUATION_SALES']
+CATEGORICAL_COLUMNS = ['DATE', 'SECTOR', 'VALUATION', 'FAIRRANGE', 'MKCAPTYPE', 'TREND', 'FUNDAMENTAL', 'MOMENTUM',
+                       'QBS', 'QBS%', 'AGS', 'AGS%']
+STRING_COLUMNS = ['SYMBOL', 'NAME']
+# Numeric columns parsed from every score column: "8(10)" -> score 8 and max 10, its percent column "80%" -> 80.
+SCORE_VALUE_COLUMNS = {
+    'QBS': ('QBS_SCORE', 'QBS_MAX', 'QBS_PCT'),
+    'AGS': ('AGS_SCORE', 'AGS_MAX', 'AGS_PCT'),
+}
+_SCORE_PATTERN = r'^\s*(-?\d+(?:\.\d+)?)\s*[(/]\s*(\d+(?:\.\d+)?)\s*\)?\s*$'
+_PERCENT_PATTERN = r'^\s*(-?\d+(?:\.\d+)?)\s*%?\s*$'
+
+
+def RunDateColumns(now=None):
+    '''
+    Return the DATENUM and DATE columns shared by every row of a run. Computed once when the run starts.
+    '''
+    now = now or datetime.datetime.now()
+    return {"DATENUM": now.strftime('%Y%m%d'), "DATE": now.strftime('%d-%b-%Y')}
+
+
+def FormatScore(value):
+    # "8/10" -> "8(10)", empty (or missing) scores are kept as they are.
+    return value.replace("/", "(") + ")" if isinstance(value, str) and len(value) > 0 else value
+
+
+def TransformAdvancedInfoRow(record, runColumns):
+    '''
+    Transform one Basic Info row merged with its Fundamental Report into an Advanced Info row.
+    Raises KeyError when the record misses one of the mapped fields.
+    '''
+    row = dict(runColumns)
+    row.update(CONSTANT_COLUMNS)
+    for column, field in FIELD_MAPPING.items():
+        row[column] = record[field]
+    for column in SCORE_COLUMNS:
+        row[column] = FormatScore(row[column])
+    return {column: row[column] for column in ADVANCED_INFO_COLUMNS}
+
+
+def TransformAdvancedInfoRecords(records, runColumns):
+    '''
+    TransformAdvancedInfoRow over a list of records. Returns a list aligned with the records, holding the
+    Advanced Info row of every record or None for records which miss one of the mapped fields.
+    '''
+    return [TransformAdvancedInfoRow(record, runColumns) if _REQUIRED_FIELDS <= record.keys() else None
+            for record in records]
+
+
+def _ParseNumbers(series, pattern):
+    # Extract the groups of the pattern as float32 columns. A categorical column is parsed once per distinct value and
+    # the result is expanded through its codes.
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        parsed = _ParseNumbers(pd.Series(series.cat.categories.astype(str), dtype='string'), pattern).to_numpy()
+        parsed = np.vstack([parsed, np.full((1, parsed.shape[1]), np.nan, dtype='float32')])
+        # Missing values have the code -1, which picks the row of NaNs appended above.
+        return pd.DataFrame(parsed[series.cat.codes.to_numpy()], index=series.index)
+    parts = series.astype('string').str.extract(pattern)
+    return parts.apply(pd.to_numeric, errors='coerce').astype('float32')
+
+
+def ParseScoreColumns(df):
+    '''
+    Add the SCORE_VALUE_COLUMNS parsed from the QBS/AGS columns ("8(10)") and their percent columns ("80%") to an
+    Advanced Info DataFrame. Values which cannot be parsed (e.g. "New Listing") become NaN.
+    '''
+    for column, (scoreColumn, maxColumn, percentColumn) in SCORE_VALUE_COLUMNS.items():
+        scores = _ParseNumbers(df[column], _SCORE_PATTERN)
+        df[scoreColumn] = scores[0]
+        df[maxColumn] = scores[1]
+        df[percentColumn] = _ParseNumbers(df[column + '%'], _PERCENT_PATTERN)[0]
+    return df
+
+
+def LoadAdvancedInfoCsv(csv_file_path, parse_scores=True):
+    '''
+    Read an Advanced Info CSV with explicit dtypes instead of letting pandas guess them: DATENUM as int32, the
+    NUMERIC_COLUMNS as float64 (values which are not numbers become NaN), the CATEGORICAL_COLUMNS as categoricals
+    and, unless parse_scores is False, the numeric SCORE_VALUE_COLUMNS.
+    '''
+    dtypes = {column: 'string' for column in STRING_COLUMNS + NUMERIC_COLUMNS}
+    dtypes.update({column: 'category' for column in CATEGORICAL_COLUMNS})
+    df = pd.read_csv(csv_file_path, dtype=dtypes)
+    df['DATENUM'] = df['DATENUM'].astype('int32')
+    for column in NUMERIC_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce').astype('float64')
+    if parse_scores:
+        ParseScoreColumns(df)
+    return df
@@ -0,0 +1,75 @@
+import csv
+import logging
+import os
+
+from AdvancedInfoSchema import ADVANCED_INFO_COLUMNS
+
+# Columns of the failure CSV, the DLevel Basic Info row of every symbol which could not be fetched.
+FAILURE_COLUMNS = ["SYMBOL", "NAME", "DLEVEL_KEY"]
+
+
+class AdvancedInfoWriter:
+    def __init__(self, Dlevel_Advanced_info, Dlevel_Failed_Info, append=False, sync=True):
+        """
+        Streams the rows of an Advanced Info run into its CSV and the symbols which could not be fetched into the
+        failure CSV, which is only created by the first failure. Every row is flushed as it is written, so the CSV
+        can be tailed while the run is in progress. Used as a context manager by VSParse and VSParseAsync.
+
+        :param Dlevel_Advanced_info: Path of the Advanced Info CSV.
+        :param Dlevel_Failed_Info: Path of the failure CSV.
+        :param append: Append to an existing Advanced Info CSV (a resumed run) instead of starting a new one.
+        :param sync: Also fsync every row, so an interrupted run loses at most the row being written. Needed when the
+                     CSV is the journal of a RunCheckpoint, unless the caller syncs batches of rows with fsync().
+        """
+        self.logger = logging.getLogger('AdvancedInfoWriter')
+        self.Dlevel_Advanced_info = Dlevel_Advanced_info
+        self.Dlevel_Failed_Info = Dlevel_Failed_Info
+        self.append = append
+        self.sync = sync
+        self.rows_written = 0
+        self.failures = 0
+        self.csv_file = None
+        self.failure_file = None
+
+    def __enter__(self):
+        self.csv_file = open(self.Dlevel_Advanced_info, 'a' if self.append else 'w', newline='')
+        self.writer = csv.DictWriter(self.csv_file, fieldnames=ADVANCED_INFO_COLUMNS)
+        if not self.append:
+            self.writer.writeheader()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write_row(self, dLevelInfoRow):
+        """Write an Advanced Info row."""
+        self.writer.writerow(dLevelInfoRow)
+        self.csv_file.flush()
+        if self.sync:
+            os.fsync(self.csv_file.fileno())
+        self.rows_written += 1
+
+    def fsync(self):
+        """Sync the rows written so far to disk."""
+        self.csv_file.flush()
+        os.fsync(self.csv_file.fileno())
+
+    def write_failure(self, row):
+        """Write the DLevel Basic Info row of a symbol which could not be fetched to the failure CSV."""
+        if self.failure_file is None:
+            self.failure_file = open(self.Dlevel_Failed_Info, 'w', newline='')
+            self.failure_writer = csv.DictWriter(self.failure_file, fieldnames=FAILURE_COLUMNS)
+            self.failure_writer.writeheader()
+        self.failure_writer.writerow(row)
+        self.failure_file.flush()
+        self.failures += 1
+
+    def close(self):
+        if self.csv_file is not None:
+            self.csv_file.close()
+            self.csv_file = None
+            self.logger.debug(f"{self.rows_written} Advanced Info rows have been written to: {self.Dlevel_Advanced_info}")
+        if self.failure_file is not None:
+            self.failure_file.close()
+            self.failure_file = None
+            self.logger.debug(f"{self.failures} failures have been written to: {self.Dlevel_Failed_Info}")
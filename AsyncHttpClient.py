@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+import random
+import time
+
+import aiohttp
+from requests.structures import CaseInsensitiveDict
+
+from PipelineMetrics import EndpointName
+
+
+class AsyncResponse:
+    def __init__(self, url, status_code, headers, content, from_cache=False, throttled=False):
+        """
+        The parts of a response used by the pipeline, with the names of requests.Response.
+
+        :param url: The url which was requested.
+        :param status_code: The HTTP status code.
+        :param headers: The response headers.
+        :param content: The decoded response body.
+        :param from_cache: True if the response was served from the ResponseCache.
+        :param throttled: True if the rate limiter treated the response as throttled (429/5xx).
+        """
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.from_cache = from_cache
+        self.throttled = throttled
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncHttpSession:
+    def __init__(self, cache=None, rate_limiter=None, pool_size=10, connect_timeout=5, read_timeout=30, max_retries=3,
+                 backoff_factor=0.5, backoff_jitter=0.5, metrics=None):
+        """
+        asyncio counterpart of HttpClient.CreateHttpSession on top of aiohttp, used as an async context manager.
+        GET requests are served from the ResponseCache like HttpCache.CachingAdapter does, connection errors are
+        retried with jittered exponential backoff and every request that goes to the network first waits for the
+        HostRateLimiter of its host without blocking the event loop. Like HttpClient.BuildRetryPolicy, responses are
+        never retried on their status code: the status is fed back into the HostRateLimiter and throttled responses
+        are retried by the caller (see VSParseAsync.GetWithThrottleRetriesAsync).
+
+        :param cache: Optional. The HttpCache.ResponseCache shared with the requests session.
+        :param rate_limiter: Optional. The RateLimiter.HostRateLimiter pacing the requests.
+        :param pool_size: Maximum number of concurrent connections per host.
+        :param connect_timeout: Seconds to wait for the connection to be established.
+        :param read_timeout: Seconds to wait between bytes of the response.
+        :param max_retries: Maximum number of retries of a single request.
+        :param backoff_factor: Base of the exponential backoff in seconds (factor * 2 ** (retry - 1)).
+        :param backoff_jitter: Maximum random number of seconds added to every backoff.
+        :param metrics: Optional. PipelineMetrics recording every request.
+        """
+        self.logger = logging.getLogger('AsyncHttpSession')
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        self.metrics = metrics
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit_per_host=self.pool_size), timeout=self.timeout)
+        self.logger.debug(f"Created async HTTP session: pool_size={self.pool_size}, max_retries={self.max_retries}.")
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+
+    async def get(self, url):
+        """
+        GET the url, from the cache when a fresh copy is cached. Stale entries carrying an ETag or Last-Modified
+        header are revalidated with a conditional request.
+
+        :param url: The url to request.
+        :return: The AsyncResponse. Raises aiohttp.ClientError / asyncio.TimeoutError once the retries are used up.
+        """
+        if self.cache is None or self.cache.ttl_for(url) <= 0:
+            return await self._send(url)
+
+        entry = await asyncio.to_thread(self.cache.get, url)
+        if entry is not None and entry['fresh']:
+            self.cache.record_lookup(hit=True)
+            return self._cached_response(url, entry)
+
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = await self._send(url, headers)
+        if response.status_code == 304 and entry is not None:
+            await asyncio.to_thread(self.cache.refresh, url)
+            self.cache.record_lookup(hit=True, revalidated=True)
+            return self._cached_response(url, entry)
+
+        self.cache.record_lookup(hit=False)
+        if response.status_code == 200 and 'no-store' not in response.headers.get('Cache-Control', ''):
+            await asyncio.to_thread(self.cache.put, url, response.status_code, response.headers, response.content)
+        return response
+
+    def _cached_response(self, url, entry):
+        if self.metrics is not None:
+            self.metrics.record_request(EndpointName(url), 0.0, entry['status'], len(entry['content']), from_cache=True)
+        return AsyncResponse(url, entry['status'], CaseInsensitiveDict(entry['headers']), entry['content'], from_cache=True)
+
+    async def _acquire(self, url):
+        if self.rate_limiter is None:
+            return
+        wait_time = self.rate_limiter.try_acquire(url)
+        while wait_time > 0:
+            await asyncio.sleep(wait_time)
+            wait_time = self.rate_limiter.try_acquire(url)
+
+    def _backoff(self, retry):
+        return self.backoff_factor * 2 ** (retry - 1) + random.uniform(0, self.backoff_jitter)
+
+    async def _send(self, url, headers=None):
+        retries = 0
+        while True:
+            await self._acquire(url)
+            start = time.monotonic()
+            try:
+                async with self.session.get(url, headers=headers) as response:
+                    content = await response.read()
+                    status = response.status
+                    responseHeaders = CaseInsensitiveDict(response.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if retries >= self.max_retries:
+                    if self.metrics is not None:
+                        self.metrics.record_request(EndpointName(url), time.monotonic() - start, retries=retries, error=True)
+                    raise
+                retries += 1
+                self.logger.debug(f"Retry {retries} of '{url}' after {type(e).__name__}: {e}")
+                await asyncio.sleep(self._backoff(retries))
+                continue
+            seconds = time.monotonic() - start
+            throttled = self.rate_limiter.record_response(url, status) if self.rate_limiter is not None else False
+            if self.metrics is not None:
+                self.metrics.record_request(EndpointName(url), seconds, status, len(content), retries)
+            return AsyncResponse(url, status, responseHeaders, content, throttled=throttled)
@@ -0,0 +1,114 @@
+import argparse
+import glob
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from ImportValueStocksToSqlLite import OpenValueStocksDB, ImportValueStocksRows, ReadValueStocksCsv, ImportDateIds
+from ValueStocksQueries import RefreshDailyChanges
+
+logging.basicConfig(filename="ValueStocksBackfill.Log",level=logging.DEBUG,format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',datefmt='%d-%b-%y %H:%M:%S')
+
+# Full snapshots and the delta CSVs of VS_DELTA_MODE runs, which only hold the rows that changed.
+SNAPSHOT_FILE_PATTERNS = ('*-3.DLEVEL_ADVANCED_INFO.CSV', '*-3.DLEVEL_ADVANCED_INFO_DELTA.CSV')
+
+def FindSnapshotFiles(path_or_glob):
+    # A directory is searched for Advanced Info snapshots, anything else is treated as a glob pattern.
+    if os.path.isdir(path_or_glob):
+        return sorted(set(csv_file_path for pattern in SNAPSHOT_FILE_PATTERNS
+                          for csv_file_path in glob.glob(os.path.join(path_or_glob, pattern))))
+    return sorted(glob.glob(path_or_glob))
+
+def IsDeltaFile(csv_file_path):
+    return os.path.basename(csv_file_path).upper().endswith('_DELTA.CSV')
+
+def DateNumFromFileName(csv_file_path):
+    # Snapshots are named YYYYMMDD-HHMMSS-3.DLEVEL_ADVANCED_INFO[_DELTA].CSV, returns the DATENUM or None.
+    match = re.match(r'(\d{8})-', os.path.basename(csv_file_path))
+    return int(match.group(1)) if match else None
+
+def SelectSnapshotFiles(csv_file_paths, importedDateNums):
+    # Keep the latest snapshot of every day which is not imported yet, oldest day first. A full snapshot is preferred
+    # over the delta CSV of the same day.
+    latestPerDay = {}
+    undated = []
+    for csv_file_path in csv_file_paths:
+        datenum = DateNumFromFileName(csv_file_path)
+        if datenum is None:
+            undated.append(csv_file_path)
+        elif datenum not in importedDateNums:
+            # The timestamp follows the date, so the last file in sorted order is the latest of the day.
+            if datenum in latestPerDay and IsDeltaFile(csv_file_path) and not IsDeltaFile(latestPerDay[datenum]):
+                continue
+            latestPerDay[datenum] = csv_file_path
+    return [latestPerDay[datenum] for datenum in sorted(latestPerDay)] + undated
+
+def ParseSnapshot(csv_file_path):
+    # Runs in a worker process.
+    return csv_file_path, ReadValueStocksCsv(csv_file_path)
+
+def BackfillValueStocks(path_or_glob, db_file_path, workers=None, filesPerTransaction=20):
+    csv_file_paths = FindSnapshotFiles(path_or_glob)
+    conn, dimensionCache = OpenValueStocksDB(db_file_path)
+    importedDateNums = set(dimensionCache.ids['IMPORTDATE'])
+    csv_file_paths = SelectSnapshotFiles(csv_file_paths, importedDateNums)
+    print("Found " + str(len(csv_file_paths)) + " snapshots to import into " + db_file_path)
+    logging.info("Found " + str(len(csv_file_paths)) + " snapshots to import into " + db_file_path)
+
+    importedFiles = 0
+    importedRows = 0
+    filesInTransaction = 0
+    # Import dates whose day-over-day transitions are refreshed when the transaction is committed.
+    pendingDateIds = set()
+    try:
+        # CSV parsing is spread over a process pool, every write goes through this single connection.
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for csv_file_path, rows in executor.map(ParseSnapshot, csv_file_paths):
+                # Guards against snapshots without a dated file name and against re-imports of a day.
+                rows = [row for row in rows if row['DATENUM'] not in importedDateNums]
+                if not rows:
+                    logging.info("Skipping " + csv_file_path + " since its DATENUM is already imported")
+                    continue
+                # Outside a transaction the savepoint would become the transaction and its release would commit the
+                # file, so the batch of filesPerTransaction snapshots is opened explicitly.
+                if not conn.in_transaction:
+                    conn.execute("BEGIN")
+                conn.execute("SAVEPOINT SNAPSHOT")
+                try:
+                    rowCount = ImportValueStocksRows(conn, dimensionCache, rows)
+                    conn.execute("RELEASE SAVEPOINT SNAPSHOT")
+                except Exception as Argument:
+                    conn.execute("ROLLBACK TO SAVEPOINT SNAPSHOT")
+                    conn.execute("RELEASE SAVEPOINT SNAPSHOT")
+                    dimensionCache.reload()
+                    print("Error importing " + csv_file_path + ". Exception: " + str(Argument))
+                    logging.error("Error importing " + csv_file_path + ". Exception: " + str(Argument))
+                    continue
+                importedDateNums.update(row['DATENUM'] for row in rows)
+                pendingDateIds.update(ImportDateIds(dimensionCache, rows))
+                importedFiles += 1
+                importedRows += rowCount
+                filesInTransaction += 1
+                logging.info("Imported " + str(rowCount) + " rows from " + csv_file_path)
+                if filesInTransaction >= filesPerTransaction:
+                    RefreshDailyChanges(conn, pendingDateIds)
+                    pendingDateIds.clear()
+                    conn.commit()
+                    filesInTransaction = 0
+                    print("Imported " + str(importedFiles) + "/" + str(len(csv_file_paths)) + " snapshots")
+        RefreshDailyChanges(conn, pendingDateIds)
+        conn.commit()
+    finally:
+        conn.close()
+    print("Backfill complete. Imported " + str(importedRows) + " rows from " + str(importedFiles) + " snapshots.")
+    logging.info("Backfill complete. Imported " + str(importedRows) + " rows from " + str(importedFiles) + " snapshots.")
+    return importedFiles
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import historical Advanced Info snapshots into the ValueStocks database.")
+    parser.add_argument('snapshots', help="Directory holding the snapshots, or a glob pattern matching them.")
+    parser.add_argument('--db', default='ValueStocksDB.db', help="Path of the SQLite database.")
+    parser.add_argument('--workers', type=int, default=None, help="Number of CSV parsing processes.")
+    parser.add_argument('--files-per-transaction', type=int, default=20, help="Number of snapshots committed per transaction.")
+    args = parser.parse_args()
+    BackfillValueStocks(args.snapshots, args.db, args.workers, args.files_per_transaction)
@@ -0,0 +1,368 @@
+'''
+Offline benchmark of the ValueStocks pipeline. A local HTTP stand-in serves the NSE master list, the dlevels
+autosearch and Fundamental Report endpoints and the parts of the Dropbox API used by the pipeline, with fixtures
+generated from a recorded Advanced Info CSV. The full pipeline and the SQLite import are run against it and the
+throughput, request latencies and peak memory are reported.
+
+Example:
+    python BenchmarkVSParse.py --symbols 500 --latency-ms 80 --jitter-ms 40 --error-rate 0.02 --workers 16 --batch-size 20
+'''
+import argparse
+import asyncio
+import contextlib
+import csv
+import datetime
+import hashlib
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+from requests.adapters import HTTPAdapter
+
+from AdvancedInfoSchema import FIELD_MAPPING
+
+SEED_CSV = '20250112-130626-3.DLEVEL_ADVANCED_INFO.CSV'
+SEED_DB = 'ValueStocksDB.db'
+NSE_MASTER_COLUMNS = ['SYMBOL', 'NAME OF COMPANY', ' SERIES', ' DATE OF LISTING', ' PAID UP VALUE', ' MARKET LOT',
+                      ' ISIN NUMBER', ' FACE VALUE']
+BHAVCOPY_COLUMNS = ['SYMBOL', ' SERIES', ' DATE1', ' PREV_CLOSE', ' OPEN_PRICE', ' HIGH_PRICE', ' LOW_PRICE', ' LAST_PRICE',
+                    ' CLOSE_PRICE', ' AVG_PRICE', ' TTL_TRD_QNTY', ' TURNOVER_LACS', ' NO_OF_TRADES', ' DELIV_QTY', ' DELIV_PER']
+
+
+def LoadFixtures(seed_csv_path, symbol_limit=0):
+    '''
+    Build the recorded responses from an Advanced Info CSV: the NSE master list and, per DLEVEL key,
+    the Fundamental Report the CSV row was created from.
+    '''
+    with open(seed_csv_path, 'r', newline='') as file:
+        rows = list(csv.DictReader(file))
+    if symbol_limit > 0:
+        rows = rows[:symbol_limit]
+
+    master = io.StringIO()
+    masterWriter = csv.writer(master, lineterminator='\n')
+    masterWriter.writerow(NSE_MASTER_COLUMNS)
+    autosearch = {}
+    reports = {}
+    for row in rows:
+        key = row['SYMBOL'].lower() + ' is equity'
+        masterWriter.writerow([row['SYMBOL'], row['NAME'], 'EQ', '01-JAN-2000', '10', '1', 'INE000000000', '10'])
+        autosearch[row['SYMBOL']] = {'EXCHANGE_NAME': row['SYMBOL'], 'Symbol_Name': key}
+        report = {field: row[column] for column, field in FIELD_MAPPING.items() if column not in ('SYMBOL', 'NAME')}
+        for field in ('Qbs', 'Ags'):
+            # "8(10)" in the CSV was "8/10" in the report.
+            report[field] = report[field].replace('(', '/').rstrip(')')
+        report['Symbol_Name'] = key
+        reports[key] = report
+    closes = {row['SYMBOL']: float(row['CMP']) for row in rows if row['CMP']}
+    return {'master': master.getvalue().encode(), 'autosearch': autosearch, 'reports': reports, 'symbols': len(rows),
+            'closes': closes, 'bhavcopy': BuildBhavcopy(closes)}
+
+
+def BuildBhavcopy(closes):
+    # NSE full bhavcopy (sec_bhavdata_full_DDMMYYYY.csv) of the given close prices, padded with spaces like the original.
+    day = datetime.date.today().strftime('%d-%b-%Y')
+    bhavcopy = io.StringIO()
+    bhavcopyWriter = csv.writer(bhavcopy, lineterminator='\n')
+    bhavcopyWriter.writerow(BHAVCOPY_COLUMNS)
+    for symbol, close in closes.items():
+        price = f' {close:.2f}'
+        bhavcopyWriter.writerow([symbol, ' EQ', ' ' + day, price, price, price, price, price, price, price, ' 1000', ' 1.00', ' 10', ' 500', ' 50.00'])
+    return bhavcopy.getvalue().encode()
+
+
+def DriftPrices(fixtures, drift):
+    # Move every close price by up to +/- drift (a fraction) and serve the new prices from the bhavcopy and the reports.
+    for symbol, close in fixtures['closes'].items():
+        fixtures['closes'][symbol] = round(close * (1 + random.uniform(-drift, drift)), 2)
+        fixtures['reports'][fixtures['autosearch'][symbol]['Symbol_Name']]['LastClose'] = fixtures['closes'][symbol]
+    fixtures['bhavcopy'] = BuildBhavcopy(fixtures['closes'])
+
+
+class MockServicesHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inject(self, endpoint):
+        # Simulated latency and errors. Returns True if an error response was sent.
+        server = self.server
+        server.count(endpoint)
+        if server.latency > 0 or server.jitter > 0:
+            time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+        if server.error_rate > 0 and random.random() < server.error_rate:
+            server.count(endpoint + ':error')
+            self._send(server.error_status, {'error': 'injected'})
+            return True
+        return False
+
+    def _query_value(self, query, name, end=None):
+        # Symbols like M&M are sent unencoded, so the query string is split by hand instead of with parse_qs.
+        value = query.split(name + '=', 1)[1] if name + '=' in query else ''
+        return unquote(value.split(end, 1)[0] if end else value)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        fixtures = self.server.fixtures
+        if url.path.endswith('/EQUITY_L.csv'):
+            if not self._inject('nse/EQUITY_L.csv'):
+                self._send(200, fixtures['master'], 'text/csv')
+        elif '/products/content/sec_bhavdata_full_' in url.path:
+            if not self._inject('nse/bhavcopy'):
+                self._send(200, fixtures['bhavcopy'], 'text/csv')
+        elif url.path == '/get-autosearch-stock':
+            if not self._inject('dlevels/get-autosearch-stock'):
+                item = fixtures['autosearch'].get(self._query_value(url.query, 'term', '&pageName='))
+                self._send(200, {'response': [item] if item else []})
+        elif url.path == '/vs-api':
+            if not self._inject('dlevels/vs-api'):
+                keys = self._query_value(url.query, 'param_list').split(self.server.batch_separator)
+                found = [fixtures['reports'][key] for key in keys if key in fixtures['reports']]
+                self._send(200, {'response': [[{}], found] if found else []})
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        path = urlparse(self.path).path
+        if path.endswith('/oauth2/token'):
+            self._send(200, {'access_token': 'benchmark', 'token_type': 'bearer', 'expires_in': 14400})
+        elif path.endswith('/2/files/upload'):
+            if not self._inject('dropbox/upload'):
+                self._send(200, self.server.store(json.loads(self.headers['Dropbox-API-Arg'])['path'], body))
+        elif path.endswith('/2/files/list_folder'):
+            if not self._inject('dropbox/list_folder'):
+                self._send(200, self.server.list_folder(json.loads(body or b'{}').get('path', '')))
+        elif path.endswith('/2/files/list_folder/continue'):
+            if not self._inject('dropbox/list_folder'):
+                self._send(200, {'entries': [], 'cursor': json.loads(body)['cursor'], 'has_more': False})
+        else:
+            self._send(404, {'error_summary': 'unsupported route', 'error': {'.tag': 'other'}})
+
+
+class MockServices(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, fixtures, latency_ms=0, jitter_ms=0, error_rate=0.0, error_status=503, batch_separator=','):
+        '''
+        Local stand-in for NSE, dlevels and Dropbox.
+
+        :param fixtures: The responses to serve, see LoadFixtures.
+        :param latency_ms: Mean latency added to every request.
+        :param jitter_ms: Maximum random deviation from the mean latency.
+        :param error_rate: Fraction of the requests answered with error_status.
+        :param error_status: The status code of the injected errors, e.g. 503 (retried by the transport) or 429 (rate limited).
+        :param batch_separator: Separator of the DLEVEL keys in a batched Fundamental Report request.
+        '''
+        super().__init__(('127.0.0.1', 0), MockServicesHandler)
+        self.fixtures = fixtures
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.batch_separator = batch_separator
+        self.files = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def count(self, endpoint):
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def store(self, path, data):
+        blocks = b''.join(hashlib.sha256(data[i:i + 4 * 1024 * 1024]).digest() for i in range(0, len(data), 4 * 1024 * 1024))
+        now = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        metadata = {
+            '.tag': 'file', 'name': os.path.basename(path), 'id': 'id:' + hashlib.md5(path.lower().encode()).hexdigest(),
+            'client_modified': now, 'server_modified': now, 'rev': '0123456789abcdef', 'size': len(data),
+            'path_lower': path.lower(), 'path_display': path, 'content_hash': hashlib.sha256(blocks).hexdigest(),
+        }
+        with self.lock:
+            self.files[path.lower()] = metadata
+        return metadata
+
+    def list_folder(self, folder_path):
+        prefix = folder_path.lower().rstrip('/') + '/'
+        with self.lock:
+            entries = [metadata for path, metadata in self.files.items() if path.startswith(prefix) and '/' not in path[len(prefix):]]
+        return {'entries': entries, 'cursor': 'cursor:' + folder_path, 'has_more': False}
+
+
+class LocalRoutingAdapter(HTTPAdapter):
+    def __init__(self, base_url, **kwargs):
+        '''Sends every request of the Dropbox SDK (which always uses https) to the local stand-in instead.'''
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        request.url = self.base_url + url.path + ('?' + url.query if url.query else '')
+        return super().send(request, **kwargs)
+
+
+def PeakRssBytes():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def RunBenchmark(args):
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    fixtures = LoadFixtures(os.path.join(repo_dir, args.seed_csv), args.symbols)
+    server = MockServices(fixtures, args.latency_ms, args.jitter_ms, args.error_rate, args.error_status)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    work_dir = tempfile.mkdtemp(prefix='vsparse-benchmark-')
+    os.chdir(work_dir)
+    # The pipeline reads its configuration from the environment when it is imported.
+    os.environ.update({
+        'NSE_ARCHIVES_BASE_URL': server.base_url,
+        'DLEVELS_BASE_URL': server.base_url,
+        'DLEVEL_MAX_WORKERS': str(args.workers),
+        'DLEVEL_REQUESTS_PER_SECOND': str(args.requests_per_second),
+        'DLEVEL_BATCH_SIZE': str(args.batch_size),
+        'DLEVEL_BATCH_SEPARATOR': ',',
+        'DROPBOX_LISTING_INDEX': os.path.join(work_dir, 'DropboxListingIndex.json'),
+        'VS_DELTA_MODE': '1' if args.delta else '0',
+    })
+    sys.path.insert(0, repo_dir)
+    import requests
+    import VSParse
+    import VSParseAsync
+    from DropboxClient import DropboxClient
+    from ImportValueStocksToSqlLite import ImportValueStocksToSqlLiteDB
+    if args.no_cache:
+        VSParse.HTTP_CACHE_TTL_RULES = []
+    elif args.price_drift > 0:
+        # The bhavcopy with the drifted prices stands for the one of the next day, it must not be served from the cache.
+        VSParse.HTTP_CACHE_TTL_RULES = [rule for rule in VSParse.HTTP_CACHE_TTL_RULES if 'sec_bhavdata_full' not in rule[0]]
+
+    dropboxSession = requests.Session()
+    dropboxSession.mount('https://', LocalRoutingAdapter(server.base_url))
+    dropboxClient = DropboxClient('benchmark', 'benchmark', 'benchmark', session=dropboxSession,
+                                  token_url=server.base_url + '/oauth2/token', metrics=VSParse.pipelineMetrics)
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    report = {'config': vars(args), 'work_dir': work_dir, 'symbols': fixtures['symbols'], 'runs': []}
+    for run in range(args.runs):
+        if not args.warm:
+            # Start every run from scratch: no master files, run state or cached responses.
+            for file_name in os.listdir(work_dir):
+                path = os.path.join(work_dir, file_name)
+                if os.path.isfile(path) and not file_name.endswith('.Log'):
+                    os.remove(path)
+                elif os.path.isdir(path):
+                    shutil.rmtree(path)
+        shutil.copy(os.path.join(repo_dir, SEED_DB), os.path.join(work_dir, SEED_DB))
+        server.counts.clear()
+        if args.price_drift > 0 and run > 0:
+            DriftPrices(fixtures, args.price_drift)
+
+        output = open(os.devnull, 'w') if args.quiet else sys.stdout
+        start = time.monotonic()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            if args.use_async:
+                advanced_info_csv = asyncio.run(VSParseAsync.RunValueStocksPipelineAsync(dropboxClient))
+            else:
+                advanced_info_csv = VSParse.RunValueStocksPipeline(dropboxClient)
+        pipeline_seconds = time.monotonic() - start
+        metrics = VSParse.pipelineMetrics.summary()
+
+        with open(advanced_info_csv, 'r', newline='') as file:
+            rows_written = sum(1 for _ in csv.DictReader(file))
+        start = time.monotonic()
+        with contextlib.redirect_stdout(output):
+            ImportValueStocksToSqlLiteDB(advanced_info_csv, SEED_DB)
+        import_seconds = time.monotonic() - start
+        if output is not sys.stdout:
+            output.close()
+
+        result = {
+            'run': run + 1,
+            'pipeline_seconds': pipeline_seconds,
+            'rows_written': rows_written,
+            'symbols_per_second': rows_written / pipeline_seconds if pipeline_seconds else 0.0,
+            'import_seconds': import_seconds,
+            'import_rows_per_second': rows_written / import_seconds if import_seconds else 0.0,
+            'stages': {name: round(stage['seconds'], 3) for name, stage in metrics['stages'].items()},
+            'endpoints': {endpoint.replace(server.base_url[len('http://'):], ''): {
+                'requests': stats['requests'], 'errors': stats['errors'], 'retries': stats['retries'],
+                'cache_hit_rate': round(stats['cache_hit_rate'], 3), 'bytes': stats['bytes'],
+                **{name: round(value * 1000, 1) for name, value in stats['latency_seconds'].items() if name.startswith('p')},
+            } for endpoint, stats in metrics['endpoints'].items()},
+            'server_requests': dict(server.counts),
+            'peak_rss_mb': round(PeakRssBytes() / (1024 * 1024), 1),
+        }
+        if args.tracemalloc:
+            result['tracemalloc_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+            tracemalloc.reset_peak()
+        report['runs'].append(result)
+        PrintRun(result)
+
+    server.shutdown()
+    if args.output:
+        with open(os.path.join(repo_dir, args.output) if not os.path.isabs(args.output) else args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
+def PrintRun(result):
+    print(f"Run {result['run']}: {result['rows_written']} rows in {result['pipeline_seconds']:.2f}s "
+          f"({result['symbols_per_second']:.1f} symbols/s), import {result['import_seconds']:.2f}s "
+          f"({result['import_rows_per_second']:.0f} rows/s), peak RSS {result['peak_rss_mb']} MB")
+    for name, seconds in result['stages'].items():
+        print(f"  stage {name:<40} {seconds:>9.3f}s")
+    for endpoint, stats in result['endpoints'].items():
+        print(f"  {endpoint:<48} requests={stats['requests']:<6} p50={stats['p50']}ms p95={stats['p95']}ms "
+              f"p99={stats['p99']}ms retries={stats['retries']} errors={stats['errors']} cache_hit_rate={stats['cache_hit_rate']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ValueStocks pipeline against a local stand-in of NSE, dlevels and Dropbox.')
+    parser.add_argument('--symbols', type=int, default=200, help='Number of symbols served (0 = all symbols of the seed CSV).')
+    parser.add_argument('--seed-csv', default=SEED_CSV, help='Advanced Info CSV the fixtures are generated from.')
+    parser.add_argument('--latency-ms', type=float, default=50, help='Mean latency of every request.')
+    parser.add_argument('--jitter-ms', type=float, default=20, help='Maximum random deviation from the mean latency.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with --error-status.')
+    parser.add_argument('--error-status', type=int, default=503, help='Status code of the injected errors.')
+    parser.add_argument('--workers', type=int, default=8, help='DLEVEL_MAX_WORKERS of the pipeline.')
+    parser.add_argument('--requests-per-second', type=float, default=100, help='DLEVEL_REQUESTS_PER_SECOND of the pipeline.')
+    parser.add_argument('--batch-size', type=int, default=1, help='DLEVEL_BATCH_SIZE of the pipeline.')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the HTTP response cache.')
+    parser.add_argument('--delta', action='store_true', help='Run the pipeline in delta mode (VS_DELTA_MODE=1), best combined with --warm.')
+    parser.add_argument('--price-drift', type=float, default=0.0, help='Maximum fraction every price moves by between runs.')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Run the asyncio pipeline of VSParseAsync.py.')
+    parser.add_argument('--runs', type=int, default=1, help='Number of runs.')
+    parser.add_argument('--warm', action='store_true', help='Keep the files, run state and cache of the previous run.')
+    parser.add_argument('--tracemalloc', action='store_true', help='Also report the peak Python heap (slows the run down).')
+    parser.add_argument('--quiet', action='store_true', help='Hide the output of the pipeline.')
+    parser.add_argument('--output', help='Write the report as JSON to this file.')
+    RunBenchmark(parser.parse_args())
@@ -0,0 +1,68 @@
+import logging
+
+# Dimension name -> (VS_META_* table, key column, additional columns inserted along with the key).
+DIMENSIONS = {
+    'IMPORTDATE': ('VS_META_IMPORTDATE', 'DATENUM', ('DATE',)),
+    'STOCKINFO': ('VS_META_STOCKINFO', 'SYMBOL_ID', ('NAME',)),
+    'SECTOR': ('VS_META_SECTOR', 'SECTOR_NAME', ()),
+    'VALUATION': ('VS_META_VALUATION', 'VALUATION', ()),
+    'MARKETCAPTYPE': ('VS_META_MARKETCAPTYPE', 'MARKETCAPTYPE', ()),
+    'TREND': ('VS_META_TREND', 'TREND', ()),
+    'FUNDAMENTAL': ('VS_META_FUNDAMENTAL', 'FUNDAMENTAL', ()),
+    'MOMEMTUM': ('VS_META_MOMEMTUM', 'MOMEMTUM', ()),
+}
+# Maximum number of host parameters used in a single SELECT ... IN (...) statement.
+_SELECT_BATCH_SIZE = 500
+
+
+class DimensionCache:
+    def __init__(self, conn):
+        """
+        In-memory cache of the VS_META_* dimension tables. Every table is preloaded into a value -> ID
+        dictionary when the cache is created, lookups are served from memory and values which are not
+        known yet are inserted in batches. One cache can be shared by every file imported over the
+        same connection.
+
+        :param conn: An open sqlite3 connection to the ValueStocks database.
+        """
+        self.logger = logging.getLogger('DimensionCache')
+        self.conn = conn
+        self.ids = {}
+        self.reload()
+
+    def reload(self):
+        """(Re)load every dimension table into memory, e.g. after a rolled back transaction."""
+        for name, (table, column, _) in DIMENSIONS.items():
+            self.ids[name] = dict(self.conn.execute(f"SELECT {column}, ID FROM {table}").fetchall())
+        self.logger.debug("Loaded dimensions: " + ", ".join(f"{name}={len(ids)}" for name, ids in self.ids.items()))
+
+    def resolve(self, name, rows):
+        """
+        Make sure every value is present in a dimension table, inserting the unseen ones in one batch.
+
+        :param name: The dimension name, one of DIMENSIONS.
+        :param rows: Iterable of tuples (key value, additional column values...). None keys are ignored.
+        :return: The value -> ID dictionary of the dimension.
+        """
+        table, column, extraColumns = DIMENSIONS[name]
+        ids = self.ids[name]
+        unseen = {}
+        for row in rows:
+            if row[0] is not None and row[0] not in ids and row[0] not in unseen:
+                unseen[row[0]] = row[:1 + len(extraColumns)]
+        if not unseen:
+            return ids
+
+        columns = (column,) + tuple(extraColumns)
+        self.conn.executemany(
+            f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            list(unseen.values())
+        )
+        keys = list(unseen)
+        for start in range(0, len(keys), _SELECT_BATCH_SIZE):
+            batch = keys[start:start + _SELECT_BATCH_SIZE]
+            ids.update(self.conn.execute(
+                f"SELECT {column}, ID FROM {table} WHERE {column} IN ({', '.join('?' * len(batch))})", batch
+            ).fetchall())
+        self.logger.debug(f"Inserted {len(unseen)} new values into {table}.")
+        return ids
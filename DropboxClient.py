@@ -5,6 +5,42 @@ from requests.auth import HTTPBasicAuth
 import os
 import time
 import fnmatch
+import hashlib
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from DropboxListingIndex import DropboxListingIndex
+
+# Dropbox content_hash: SHA-256 over the concatenated SHA-256 digests of every 4 MB block of the file.
+DROPBOX_HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def dropbox_content_hash(data):
+    """
+    Compute the Dropbox content_hash of the given bytes.
+
+    :param data: The file content.
+    :return: The hex content hash, comparable with FileMetadata.content_hash.
+    """
+    block_hashes = b''.join(
+        hashlib.sha256(data[offset:offset + DROPBOX_HASH_BLOCK_SIZE]).digest()
+        for offset in range(0, len(data), DROPBOX_HASH_BLOCK_SIZE)
+    )
+    return hashlib.sha256(block_hashes).hexdigest()
+
+
+def dropbox_file_content_hash(local_file_path):
+    """
+    Compute the Dropbox content_hash of a local file, reading it one block at a time.
+
+    :param local_file_path: Path to the local file.
+    :return: The hex content hash, comparable with FileMetadata.content_hash.
+    """
+    block_hashes = hashlib.sha256()
+    with open(local_file_path, 'rb') as file:
+        for block in iter(lambda: file.read(DROPBOX_HASH_BLOCK_SIZE), b''):
+            block_hashes.update(hashlib.sha256(block).digest())
+    return block_hashes.hexdigest()
 
 # Configure logging
 #logging.basicConfig(filename='dropbox_client.log', level=self.logger.info,
@@ -12,7 +48,9 @@ import fnmatch
 
 
 class DropboxClient:
-    def __init__(self, refresh_token=None, client_id=None, client_secret=None, max_retries=3, retry_delay=2):
+    def __init__(self, refresh_token=None, client_id=None, client_secret=None, max_retries=3, retry_delay=2, token_refresh_margin=300,
+                 chunk_size=8 * 1024 * 1024, download_block_size=1024 * 1024, listing_index_path=None, metrics=None,
+                 session=None, token_url=None):
         """
         Initialize the DropboxClient. Environment variables are used by default,
         but they can be overridden by providing values directly.
@@ -22,6 +60,15 @@ class DropboxClient:
         :param client_secret: Optional. The Dropbox client secret.
         :param max_retries: Maximum number of retries for operations.
         :param retry_delay: Initial delay in seconds between retries, with exponential backoff.
+        :param token_refresh_margin: Seconds before the access token expires at which it is refreshed proactively.
+        :param chunk_size: Files larger than this are uploaded in chunks of this size through an upload session.
+        :param download_block_size: Size of the blocks in which downloads are streamed to disk.
+        :param listing_index_path: Optional. Path of the persisted folder listing index. Defaults to the
+                                   DROPBOX_LISTING_INDEX environment variable or 'DropboxListingIndex.json'.
+        :param metrics: Optional. PipelineMetrics recording the latency, retries and bytes of every Dropbox operation.
+        :param session: Optional. The requests session used for the token refresh and the Dropbox API calls.
+        :param token_url: Optional. The OAuth token url. Defaults to the DROPBOX_TOKEN_URL environment variable
+                          or 'https://api.dropbox.com/oauth2/token'.
         """
         self.logger=logging.getLogger('DropboxClient')
         self.refresh_token = refresh_token or os.getenv('DROPBOX_REFRESH_TOKEN')
@@ -29,58 +76,73 @@ class DropboxClient:
         self.client_secret = client_secret or os.getenv('DROPBOX_CLIENT_SECRET')
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.token_refresh_margin = token_refresh_margin
+        self.chunk_size = chunk_size
+        self.download_block_size = download_block_size
+        self.listing_index = DropboxListingIndex(listing_index_path or os.getenv('DROPBOX_LISTING_INDEX', 'DropboxListingIndex.json'))
+        self.token_expires_at = 0
+        self.token_refresh_count = 0
+        self.token_lock = threading.Lock()
+        self.metrics = metrics
+        self.session = session
+        self.token_url = token_url or os.getenv('DROPBOX_TOKEN_URL', 'https://api.dropbox.com/oauth2/token')
 
         if not all([self.refresh_token, self.client_id, self.client_secret]):
             raise ValueError("Missing required environment variables or parameters for Dropbox credentials.")
 
         self.access_token = self._get_access_token()
-        self.dbx = dropbox.Dropbox(self.access_token)
+        self.dbx = dropbox.Dropbox(self.access_token, session=self.session)
         
         self.logger.info("DropboxClient initialized.")
 
     def _check_access_token(self):
-        """Ensure the access token is valid or refresh it if expired."""
-        if not self.access_token or not self._is_access_token_valid():
-            self.logger.info("Access token invalid or expired. Refreshing token...")
+        """
+        Ensure the access token has not expired, refreshing it shortly before it does.
+        This only looks at the expiry reported by the OAuth response, it never calls the Dropbox API.
+        """
+        if not self.access_token or time.time() >= self.token_expires_at - self.token_refresh_margin:
+            self.logger.info("Access token missing or about to expire. Refreshing token...")
             self._refresh_access_token()
 
-        if not self._is_access_token_valid():
-            self.logger.error("Access token could not be refreshed. Please check credentials.")
-            raise ValueError("Access token invalid, and refresh failed.")
-
-    def _is_access_token_valid(self):
-        """Validate the current access token by making a simple API call."""
-        try:
-            self.dbx.users_get_current_account()
-            return True
-        except dropbox.exceptions.AuthError:
-            self.logger.info("Access token is invalid or expired.")
-            return False
-        except Exception as e:
-            self.logger.error(f"Unexpected error while validating token: {e}")
-            return False
-
     def _get_access_token(self):
-        """Obtain a new Dropbox access token using the refresh token."""
+        """Obtain a new Dropbox access token using the refresh token and record when it expires."""
         try:
-            response = requests.post(
-                'https://api.dropbox.com/oauth2/token',
+            response = (self.session or requests).post(
+                self.token_url,
                 data={'grant_type': 'refresh_token', 'refresh_token': self.refresh_token},
                 auth=HTTPBasicAuth(self.client_id, self.client_secret)
             )
             response.raise_for_status()
             token_data = response.json()
+            # Short-lived Dropbox tokens last 4 hours, used when the response carries no expires_in.
+            self.token_expires_at = time.time() + int(token_data.get('expires_in', 14400))
+            self.token_refresh_count += 1
             return token_data.get('access_token')
         except (requests.RequestException, KeyError) as e:
             self.logger.error(f"Error obtaining access token: {e}")
             raise
 
-    def _refresh_access_token(self):
-        """Refresh the Dropbox access token and update the Dropbox client."""
-        self.access_token = self._get_access_token()
-        self.dbx = dropbox.Dropbox(self.access_token)
+    def _refresh_access_token(self, expired_token=None):
+        """
+        Refresh the Dropbox access token and update the Dropbox client.
+
+        :param expired_token: Optional. The token which was rejected. If another thread has already
+                              replaced it, no new refresh is made.
+        """
+        with self.token_lock:
+            if expired_token is not None and expired_token != self.access_token:
+                return
+            self.access_token = self._get_access_token()
+            self.dbx = dropbox.Dropbox(self.access_token, session=self.session)
         self.logger.info("Access token refreshed successfully.")
 
+    def get_token_stats(self):
+        """Return the number of token refreshes made by this client and the seconds until the token expires."""
+        return {
+            'refreshes': self.token_refresh_count,
+            'expires_in': max(0, int(self.token_expires_at - time.time())),
+        }
+
     def _retry_operation(self, operation, *args, **kwargs):
         """
         Retry wrapper for operations that might fail.
@@ -91,32 +153,63 @@ class DropboxClient:
         :param kwargs: Keyword arguments to pass to the operation.
         """
         attempt = 0
+        start = time.monotonic()
         while attempt < self.max_retries:
+            token = self.access_token
             try:
-                return operation(*args, **kwargs)
+                result = operation(*args, **kwargs)
+                self._record_operation(operation, time.monotonic() - start, attempt)
+                return result
+            except dropbox.exceptions.AuthError as e:
+                # The token was rejected before its expiry, refresh it and retry straight away.
+                attempt += 1
+                self.logger.info(f"Attempt {attempt} failed with an authentication error: {e}. Refreshing token...")
+                self._refresh_access_token(expired_token=token)
             except Exception as e:
                 attempt += 1
                 wait_time = self.retry_delay * (2 ** (attempt - 1))
                 self.logger.error(f"Attempt {attempt} failed: {e}. Retrying in {wait_time} seconds...")
                 time.sleep(wait_time)
+        self._record_operation(operation, time.monotonic() - start, attempt, error=True)
         raise Exception(f"Operation failed after {self.max_retries} attempts.")
 
+    def _record_operation(self, operation, seconds, retries, error=False):
+        """
+        Record a Dropbox operation in the metrics, named after the operation function, e.g. 'dropbox/upload' for
+        _upload. Operations are named functions rather than lambdas, which would all be recorded as 'dropbox/<lambda>'.
+        """
+        if self.metrics is not None:
+            self.metrics.record_request('dropbox/' + operation.__name__.strip('_'), seconds, retries=retries, error=error)
+
+    def _record_bytes(self, endpoint, bytes_transferred):
+        if self.metrics is not None:
+            self.metrics.record_bytes('dropbox/' + endpoint, bytes_transferred)
+
     def upload_file(self, local_file_path, dropbox_file_path):
         """
-        Upload a file to Dropbox with retries.
+        Upload a file to Dropbox with retries. Files larger than chunk_size are uploaded
+        in chunks through an upload session, so only one chunk is held in memory and a
+        failed chunk is the only data which is sent again.
 
         :param local_file_path: Path to the local file to upload.
         :param dropbox_file_path: Path in Dropbox where the file will be uploaded.
+        :return: True if the file was uploaded, False if the upload failed (the error is logged).
         """
         self._check_access_token()
 
         def _upload():
             with open(local_file_path, 'rb') as file:
                 self.dbx.files_upload(file.read(), dropbox_file_path,mode=dropbox.files.WriteMode.overwrite)
+        try:
+            file_size = os.path.getsize(local_file_path)
+            if file_size <= self.chunk_size:
+                self._retry_operation(_upload)
+            else:
+                self._upload_in_chunks(local_file_path, file_size, dropbox_file_path)
+            self._record_bytes('upload', file_size)
             self.logger.info(f"File '{local_file_path}' uploaded to '{dropbox_file_path}'.")
             print(f"File '{local_file_path}' uploaded to '{dropbox_file_path}'.")
-        try:
-            self._retry_operation(_upload)
+            return True
         except FileNotFoundError:
             self.logger.error(f"File '{local_file_path}' not found.")
             print(f"File '{local_file_path}' not found.")
@@ -126,10 +219,126 @@ class DropboxClient:
         except Exception as e:
             self.logger.error(f"Unexpected error during file upload: local_file_path={local_file_path} DropBoxFilePath={dropbox_file_path} Error: {e}")
             print(f"Unexpected error during file upload: {e}")
+        return False
+
+    def _upload_in_chunks(self, local_file_path, file_size, dropbox_file_path):
+        """
+        Upload a file through an upload session, one chunk at a time. Every chunk is retried on its own,
+        and when Dropbox reports an incorrect offset the upload resumes from the offset Dropbox has.
+
+        :param local_file_path: Path to the local file to upload.
+        :param file_size: Size of the local file in bytes.
+        :param dropbox_file_path: Path in Dropbox where the file will be uploaded.
+        """
+        def _start_session():
+            return self.dbx.files_upload_session_start(b'')
+        session = self._retry_operation(_start_session)
+        cursor = dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=0)
+        commit = dropbox.files.CommitInfo(path=dropbox_file_path, mode=dropbox.files.WriteMode.overwrite)
+
+        with open(local_file_path, 'rb') as file:
+            while True:
+                file.seek(cursor.offset)
+                chunk = file.read(self.chunk_size)
+                is_last_chunk = cursor.offset + len(chunk) >= file_size
+
+                def _send_chunk():
+                    try:
+                        if is_last_chunk:
+                            self.dbx.files_upload_session_finish(chunk, cursor, commit)
+                            return None
+                        self.dbx.files_upload_session_append_v2(chunk, cursor)
+                        return cursor.offset + len(chunk)
+                    except dropbox.exceptions.ApiError as e:
+                        correct_offset = self._get_correct_offset(e.error)
+                        if correct_offset is None:
+                            raise
+                        self.logger.info(f"Upload session of '{dropbox_file_path}' is at offset {correct_offset}, resuming from there.")
+                        return correct_offset
+
+                next_offset = self._retry_operation(_send_chunk)
+                if next_offset is None:
+                    return
+                cursor.offset = next_offset
+                self.logger.debug(f"Uploaded {cursor.offset}/{file_size} bytes of '{local_file_path}'.")
+
+    @staticmethod
+    def _get_correct_offset(error):
+        """Return the offset Dropbox expects when an upload session call failed with an incorrect offset, else None."""
+        if isinstance(error, dropbox.files.UploadSessionFinishError):
+            if not error.is_lookup_failed():
+                return None
+            error = error.get_lookup_failed()
+        if isinstance(error, (dropbox.files.UploadSessionLookupError, dropbox.files.UploadSessionAppendError)) and error.is_incorrect_offset():
+            return error.get_incorrect_offset().correct_offset
+        return None
+
+    def get_folder_content_hashes(self, folder_path):
+        """
+        List a Dropbox folder once and return the content hash of every file in it.
+
+        :param folder_path: Path in Dropbox of the folder.
+        :return: Dictionary of lower case file path to content hash. Empty if the folder does not exist.
+        """
+        content_hashes = {}
+        try:
+            result = self.dbx.files_list_folder(folder_path)
+            while True:
+                for entry in result.entries:
+                    if isinstance(entry, dropbox.files.FileMetadata):
+                        content_hashes[entry.path_lower] = entry.content_hash
+                if not result.has_more:
+                    break
+                result = self.dbx.files_list_folder_continue(result.cursor)
+        except dropbox.exceptions.ApiError as e:
+            self.logger.info(f"Could not list '{folder_path}', treating every file as changed: {e}")
+        return content_hashes
+
+    def upload_contents_if_changed(self, contents, max_workers=4):
+        """
+        Upload in-memory file contents concurrently, skipping every file whose content hash matches
+        the file already in Dropbox. Each destination folder is listed once to get the hashes.
+
+        :param contents: Dictionary of Dropbox file path to the bytes to upload.
+        :param max_workers: Maximum number of concurrent uploads.
+        :return: Dictionary of Dropbox file path to 'uploaded', 'unchanged' or 'failed'.
+        """
+        self._check_access_token()
+
+        remote_hashes = {}
+        for folder_path in set(os.path.dirname(path) for path in contents):
+            remote_hashes.update(self.get_folder_content_hashes(folder_path))
+
+        results = {}
+        changed = {}
+        for dropbox_file_path, data in contents.items():
+            if remote_hashes.get(dropbox_file_path.lower()) == dropbox_content_hash(data):
+                self.logger.info(f"'{dropbox_file_path}' is unchanged in Dropbox, skipping upload.")
+                results[dropbox_file_path] = 'unchanged'
+            else:
+                changed[dropbox_file_path] = data
+
+        def _upload(dropbox_file_path):
+            def _upload_contents():
+                self.dbx.files_upload(changed[dropbox_file_path], dropbox_file_path, mode=dropbox.files.WriteMode.overwrite)
+            try:
+                self._retry_operation(_upload_contents)
+                self._record_bytes('upload_contents', len(changed[dropbox_file_path]))
+                self.logger.info(f"Contents uploaded to '{dropbox_file_path}'.")
+                return 'uploaded'
+            except Exception as e:
+                self.logger.error(f"Error during upload DropBoxFilePath={dropbox_file_path}: {e}")
+                return 'failed'
+
+        if changed:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results.update(zip(changed, executor.map(_upload, changed)))
+        return results
 
     def download_file(self, dropbox_file_path, local_file_path=None):
         """
-        Download a file from Dropbox with retries.
+        Download a file from Dropbox with retries. The content is streamed to disk in blocks of
+        download_block_size and moved into place once complete.
 
         :param dropbox_file_path: Path in Dropbox of the file to download.
         :param local_file_path: Path where the file will be saved locally.
@@ -140,19 +349,30 @@ class DropboxClient:
             local_file_name = os.path.basename(dropbox_file_path)
             local_file_path = os.path.join(os.getcwd(), local_file_name)
             self.logger.info(f"No local_file_path provided. Using default path: {local_file_path}")
-        def _download():
-            metadata, res = self.dbx.files_download(dropbox_file_path)
-            with open(local_file_path, 'wb') as file:
-                file.write(res.content)
-            self.logger.info(f"File '{dropbox_file_path}' downloaded to '{local_file_path}'.")
-
         try:
-            self._retry_operation(_download)
+            self._download_to(dropbox_file_path, local_file_path)
         except dropbox.exceptions.ApiError as e:
             self.logger.error(f"Dropbox API error during download: {e}")
         except Exception as e:
             self.logger.error(f"Unexpected error during file download: {e}")
 
+    def _download_to(self, dropbox_file_path, local_file_path):
+        """Stream a Dropbox file to a local path with retries, without checking the access token."""
+        def _download():
+            temp_file_path = local_file_path + '.part'
+            metadata, res = self.dbx.files_download(dropbox_file_path)
+            try:
+                with open(temp_file_path, 'wb') as file:
+                    for block in res.iter_content(chunk_size=self.download_block_size):
+                        file.write(block)
+            finally:
+                res.close()
+            os.replace(temp_file_path, local_file_path)
+            self._record_bytes('download', os.path.getsize(local_file_path))
+            self.logger.info(f"File '{dropbox_file_path}' downloaded to '{local_file_path}'.")
+
+        self._retry_operation(_download)
+
     def upload_folder(self, local_folder_path, dropbox_folder_path, filename_pattern=None):
         """
         Upload a folder and its contents to Dropbox with retries, optionally filtering files by pattern.
@@ -165,7 +385,7 @@ class DropboxClient:
 
         for root, dirs, files in os.walk(local_folder_path):
             for file in files:
-                if filename_pattern is None or fnmatch(file, filename_pattern):
+                if filename_pattern is None or fnmatch.fnmatch(file, filename_pattern):
                     local_file_path = os.path.join(root, file)
                     relative_path = os.path.relpath(local_file_path, local_folder_path)
                     dropbox_file_path = f"{dropbox_folder_path}/{relative_path}".replace("\\", "/")
@@ -186,12 +406,12 @@ class DropboxClient:
             while True:
                 for entry in result.entries:
                     if isinstance(entry, dropbox.files.FileMetadata):
-                        if filename_pattern is None or fnmatch(entry.name, filename_pattern):
+                        if filename_pattern is None or fnmatch.fnmatch(entry.name, filename_pattern):
                             local_file_path = os.path.join(local_folder_path, entry.path_lower[len(dropbox_folder_path):].lstrip('/'))
                             local_dir = os.path.dirname(local_file_path)
                             if not os.path.exists(local_dir):
                                 os.makedirs(local_dir)
-                            self.download_file(entry.path_lower, local_file_path)
+                            self._download_to(entry.path_lower, local_file_path)
 
                 if not result.has_more:
                     break
@@ -203,9 +423,198 @@ class DropboxClient:
         except Exception as e:
             self.logger.error(f"Unexpected error during folder download: {e}")
 
+    def _list_folder_metadata(self, dropbox_folder_path, filename_pattern=None):
+        """Return a dictionary of lower case path relative to the folder to FileMetadata, for every file below the folder."""
+        remote_files = {}
+        try:
+            result = self.dbx.files_list_folder(dropbox_folder_path, recursive=True)
+        except dropbox.exceptions.ApiError as e:
+            if isinstance(e.error, dropbox.files.ListFolderError) and e.error.is_path() and e.error.get_path().is_not_found():
+                return remote_files
+            raise
+        while True:
+            for entry in result.entries:
+                if isinstance(entry, dropbox.files.FileMetadata):
+                    if filename_pattern is None or fnmatch.fnmatch(entry.name, filename_pattern):
+                        remote_files[entry.path_lower[len(dropbox_folder_path):].lstrip('/')] = entry
+            if not result.has_more:
+                break
+            result = self.dbx.files_list_folder_continue(result.cursor)
+        return remote_files
+
+    def _upload_small_files(self, transfers, max_workers):
+        """
+        Upload small files with one closed upload session each and commit them together with
+        files_upload_session_finish_batch_v2, which avoids contention between concurrent commits.
+
+        :param transfers: List of (local file path, dropbox file path) tuples.
+        :param max_workers: Maximum number of concurrent session uploads.
+        :return: List of booleans telling whether each file was committed.
+        """
+        def _start(transfer):
+            local_file_path, dropbox_file_path = transfer
+            with open(local_file_path, 'rb') as file:
+                data = file.read()
+            def _start_session():
+                return self.dbx.files_upload_session_start(data, close=True)
+            session = self._retry_operation(_start_session)
+            return dropbox.files.UploadSessionFinishArg(
+                cursor=dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=len(data)),
+                commit=dropbox.files.CommitInfo(path=dropbox_file_path, mode=dropbox.files.WriteMode.overwrite)
+            )
+
+        results = []
+        # A finish batch accepts at most 1000 entries.
+        for start in range(0, len(transfers), 1000):
+            batch = transfers[start:start + 1000]
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                entries = list(executor.map(_start, batch))
+            def _finish_batch():
+                return self.dbx.files_upload_session_finish_batch_v2(entries)
+            batch_result = self._retry_operation(_finish_batch)
+            for (local_file_path, dropbox_file_path), entry in zip(batch, batch_result.entries):
+                if entry.is_success():
+                    self.logger.info(f"File '{local_file_path}' uploaded to '{dropbox_file_path}'.")
+                else:
+                    self.logger.error(f"Error committing '{local_file_path}' to '{dropbox_file_path}': {entry.get_failure()}")
+                results.append(entry.is_success())
+        return results
+
+    def sync_folder(self, local_folder_path, dropbox_folder_path, direction='upload', filename_pattern=None, max_workers=4):
+        """
+        Synchronise a local folder with a Dropbox folder, transferring only the files which changed.
+        A file is unchanged when its size and Dropbox content_hash match the other side. Transfers
+        run through a bounded thread pool; small uploads are committed together in batches.
+
+        :param local_folder_path: Path to the local folder.
+        :param dropbox_folder_path: Path in Dropbox of the folder.
+        :param direction: 'upload' to make Dropbox match the local folder, 'download' for the opposite.
+        :param filename_pattern: Optional filename pattern to filter files (e.g., '*.tls').
+        :param max_workers: Maximum number of concurrent transfers.
+        :return: Dictionary with the number of 'transferred', 'unchanged' and 'failed' files.
+        """
+        if direction not in ('upload', 'download'):
+            raise ValueError(f"Unknown sync direction '{direction}'. Use 'upload' or 'download'.")
+        self._check_access_token()
+        dropbox_folder_path = dropbox_folder_path.rstrip('/')
+        remote_files = self._list_folder_metadata(dropbox_folder_path.lower(), filename_pattern)
+
+        local_files = {}
+        if os.path.isdir(local_folder_path):
+            for root, dirs, files in os.walk(local_folder_path):
+                for file in files:
+                    if filename_pattern is None or fnmatch.fnmatch(file, filename_pattern):
+                        local_file_path = os.path.join(root, file)
+                        local_files[os.path.relpath(local_file_path, local_folder_path).replace("\\", "/")] = local_file_path
+
+        def _is_unchanged(local_file_path, metadata):
+            # The size is compared first so the local file is only hashed when it could be unchanged.
+            return (metadata is not None and os.path.exists(local_file_path)
+                    and os.path.getsize(local_file_path) == metadata.size
+                    and dropbox_file_content_hash(local_file_path) == metadata.content_hash)
+
+        summary = {'transferred': 0, 'unchanged': 0, 'failed': 0}
+        if direction == 'upload':
+            small_transfers, large_transfers = [], []
+            for relative_path, local_file_path in local_files.items():
+                if _is_unchanged(local_file_path, remote_files.get(relative_path.lower())):
+                    summary['unchanged'] += 1
+                    continue
+                transfer = (local_file_path, f"{dropbox_folder_path}/{relative_path}")
+                (small_transfers if os.path.getsize(local_file_path) <= self.chunk_size else large_transfers).append(transfer)
+
+            def _upload_large(transfer):
+                try:
+                    self._upload_in_chunks(transfer[0], os.path.getsize(transfer[0]), transfer[1])
+                    self.logger.info(f"File '{transfer[0]}' uploaded to '{transfer[1]}'.")
+                    return True
+                except Exception as e:
+                    self.logger.error(f"Error uploading '{transfer[0]}' to '{transfer[1]}': {e}")
+                    return False
+
+            try:
+                results = self._upload_small_files(small_transfers, max_workers) if small_transfers else []
+            except Exception as e:
+                self.logger.error(f"Error during batch upload to '{dropbox_folder_path}': {e}")
+                results = [False] * len(small_transfers)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results += list(executor.map(_upload_large, large_transfers))
+        else:
+            transfers = []
+            for relative_path, metadata in remote_files.items():
+                local_file_path = os.path.join(local_folder_path, metadata.path_display[len(dropbox_folder_path):].lstrip('/'))
+                if _is_unchanged(local_file_path, metadata):
+                    summary['unchanged'] += 1
+                else:
+                    transfers.append((metadata.path_lower, local_file_path))
+
+            def _download(transfer):
+                try:
+                    os.makedirs(os.path.dirname(transfer[1]) or '.', exist_ok=True)
+                    self._download_to(transfer[0], transfer[1])
+                    return True
+                except Exception as e:
+                    self.logger.error(f"Error downloading '{transfer[0]}' to '{transfer[1]}': {e}")
+                    return False
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(_download, transfers))
+
+        summary['transferred'] = sum(1 for result in results if result)
+        summary['failed'] = len(results) - summary['transferred']
+        self.logger.info(f"Synced '{local_folder_path}' {direction} with '{dropbox_folder_path}': {summary}")
+        return summary
+
+    def refresh_listing(self, folder_path):
+        """
+        Bring the listing index of a folder up to date. The first call lists the folder, later calls
+        only fetch the changes since the stored cursor with files_list_folder_continue.
+
+        :param folder_path: Path in Dropbox of the folder.
+        """
+        with self.listing_index.lock:
+            cursor = self.listing_index.get_cursor(folder_path)
+            result = None
+            if cursor is not None:
+                try:
+                    result = self.dbx.files_list_folder_continue(cursor)
+                except dropbox.exceptions.ApiError as e:
+                    if isinstance(e.error, dropbox.files.ListFolderContinueError) and e.error.is_reset():
+                        self.logger.info(f"Listing cursor of '{folder_path}' was reset by Dropbox, listing it again.")
+                        self.listing_index.reset(folder_path)
+                    else:
+                        raise
+            if result is None:
+                result = self.dbx.files_list_folder(folder_path)
+            while True:
+                self.listing_index.apply(folder_path, result.entries, result.cursor)
+                if not result.has_more:
+                    break
+                result = self.dbx.files_list_folder_continue(result.cursor)
+            self.listing_index.save()
+
+    def wait_for_changes(self, folder_path, timeout=30):
+        """
+        Block until files change in a folder or the timeout expires, then update its listing index.
+
+        :param folder_path: Path in Dropbox of the folder.
+        :param timeout: Maximum number of seconds to wait (30 to 480).
+        :return: True if there were changes, False if the timeout expired.
+        """
+        self._check_access_token()
+        if self.listing_index.get_cursor(folder_path) is None:
+            self.refresh_listing(folder_path)
+        result = self.dbx.files_list_folder_longpoll(self.listing_index.get_cursor(folder_path), timeout=timeout)
+        if result.changes:
+            self.refresh_listing(folder_path)
+        elif result.backoff:
+            time.sleep(result.backoff)
+        return result.changes
+
     def list_files(self, folder_path, filename_pattern=None):
         """
         List files in a Dropbox folder with their last updated datetime.
+        Answered from the listing index, after fetching the changes since the last call.
 
         :param folder_path: Path in Dropbox of the folder to list files from.
         :param filename_pattern: Optional pattern to filter filenames (e.g., '*.txt').
@@ -213,19 +622,10 @@ class DropboxClient:
         """
         self._check_access_token()
 
-        files_list = []
         try:
-            result = self.dbx.files_list_folder(folder_path)
-            while True:
-                for entry in result.entries:
-                    if isinstance(entry, dropbox.files.FileMetadata):
-                        if filename_pattern is None or fnmatch(entry.name, filename_pattern):
-                            files_list.append((entry.name, entry.server_modified))
-
-                if not result.has_more:
-                    break
-                result = self.dbx.files_list_folder_continue(result.cursor)
-            return files_list
+            self._retry_operation(self.refresh_listing, folder_path)
+            return [(info['name'], info['server_modified']) for info in self.listing_index.files(folder_path)
+                    if filename_pattern is None or fnmatch.fnmatch(info['name'], filename_pattern)]
         except dropbox.exceptions.ApiError as e:
             self.logger.error(f"Dropbox API error during listing files: {e}")
             raise
@@ -275,23 +675,26 @@ class DropboxClient:
             self.logger.error(f"Unexpected error during file rename: {e}")
 
 
-    def get_most_recent_file(self, folder_path):
+    def get_most_recent_file(self, folder_path, filename_pattern=None):
         """
         Get the full path of the most recent file in a Dropbox folder with retries.
+        Answered from the listing index, after fetching the changes since the last call.
 
         :param folder_path: The path of the folder in Dropbox.
+        :param filename_pattern: Optional pattern to filter filenames (e.g., '*-3.DLEVEL_ADVANCED_INFO.CSV').
         :return: The path of the most recently modified file in the folder, or None if no files are found.
         """
         self._check_access_token()
 
         def _get_recent():
-            files = self.dbx.files_list_folder(folder_path).entries
-            files = [f for f in files if isinstance(f, dropbox.files.FileMetadata)]
+            self.refresh_listing(folder_path)
+            files = [info for info in self.listing_index.files(folder_path)
+                     if filename_pattern is None or fnmatch.fnmatch(info['name'], filename_pattern)]
             if not files:
                 return None
-            most_recent_file = max(files, key=lambda f: f.server_modified)
-            self.logger.info(f"Most recent file in Dropbox: {most_recent_file.path_lower}")
-            return most_recent_file.path_lower
+            most_recent_file = max(files, key=lambda f: f['server_modified'])
+            self.logger.info(f"Most recent file in Dropbox: {most_recent_file['path_lower']}")
+            return most_recent_file['path_lower']
 
         try:
             return self._retry_operation(_get_recent)
@@ -303,24 +706,29 @@ class DropboxClient:
     def file_exists(self, dropbox_path):
         """
         Check if a file exists in Dropbox with retries.
+        Answered from the listing index of the file's folder, after fetching the changes since the last call.
 
         :param dropbox_path: The path of the file in Dropbox.
         :return: True if the file exists, False otherwise.
         """
         self._check_access_token()
 
+        folder_path = posixpath.dirname(dropbox_path)
+        if folder_path == '/':
+            folder_path = ''
+
         def _check():
             try:
-                self.dbx.files_get_metadata(dropbox_path)
-                self.logger.info(f"File exists in Dropbox: {dropbox_path}")
-                return True
+                self.refresh_listing(folder_path)
             except dropbox.exceptions.ApiError as e:
-                if isinstance(e.error, dropbox.files.GetMetadataError):
+                if isinstance(e.error, dropbox.files.ListFolderError):
                     self.logger.info(f"File does not exist in Dropbox: {dropbox_path}")
                     return False
-                else:
-                    self.logger.error(f"Dropbox API error during file existence check: {e}")
-                    raise e
+                self.logger.error(f"Dropbox API error during file existence check: {e}")
+                raise e
+            exists = self.listing_index.contains(folder_path, dropbox_path)
+            self.logger.info(f"File {'exists' if exists else 'does not exist'} in Dropbox: {dropbox_path}")
+            return exists
 
         try:
             return self._retry_operation(_check)
@@ -0,0 +1,92 @@
+import datetime
+import json
+import logging
+import os
+import threading
+import dropbox
+
+
+class DropboxListingIndex:
+    def __init__(self, index_file_path='DropboxListingIndex.json'):
+        """
+        A local, persisted index of Dropbox folder listings. For every indexed folder it keeps the
+        files_list_folder cursor and the metadata of the files in it, so the index can be brought up
+        to date with the changes since the last call instead of a full listing.
+
+        :param index_file_path: Path of the JSON file the index is persisted in.
+        """
+        self.logger = logging.getLogger('DropboxListingIndex')
+        self.index_file_path = index_file_path
+        self.lock = threading.RLock()
+        self.folders = {}
+        if index_file_path and os.path.exists(index_file_path):
+            try:
+                with open(index_file_path, 'r') as file:
+                    self.folders = json.load(file)
+            except (IOError, ValueError) as e:
+                self.logger.error(f"Could not read listing index '{index_file_path}': {e}. Starting with an empty index.")
+
+    def save(self):
+        """Persist the index."""
+        if not self.index_file_path:
+            return
+        with self.lock:
+            temp_file_path = self.index_file_path + '.tmp'
+            with open(temp_file_path, 'w') as file:
+                json.dump(self.folders, file)
+            os.replace(temp_file_path, self.index_file_path)
+
+    def get_cursor(self, folder_path):
+        """Return the cursor of an indexed folder, or None when the folder is not indexed."""
+        folder = self.folders.get(folder_path.lower())
+        return folder['cursor'] if folder else None
+
+    def reset(self, folder_path):
+        """Forget a folder, e.g. after Dropbox reset its cursor."""
+        with self.lock:
+            self.folders.pop(folder_path.lower(), None)
+
+    def apply(self, folder_path, entries, cursor):
+        """
+        Apply a page of listing entries (files, folders and deletions) to a folder of the index.
+
+        :param folder_path: Path in Dropbox of the folder.
+        :param entries: Entries of a files_list_folder or files_list_folder_continue result.
+        :param cursor: The cursor of the result.
+        """
+        with self.lock:
+            folder = self.folders.setdefault(folder_path.lower(), {'cursor': None, 'files': {}})
+            files = folder['files']
+            for entry in entries:
+                if isinstance(entry, dropbox.files.FileMetadata):
+                    files[entry.path_lower] = {
+                        'name': entry.name,
+                        'path_display': entry.path_display,
+                        'server_modified': entry.server_modified.isoformat(),
+                        'size': entry.size,
+                        'content_hash': entry.content_hash,
+                    }
+                elif isinstance(entry, dropbox.files.DeletedMetadata):
+                    files.pop(entry.path_lower, None)
+                    # A deleted folder takes every file below it along.
+                    for path_lower in [path for path in files if path.startswith(entry.path_lower + '/')]:
+                        files.pop(path_lower)
+            folder['cursor'] = cursor
+
+    def files(self, folder_path):
+        """
+        Return the indexed files of a folder.
+
+        :param folder_path: Path in Dropbox of the folder.
+        :return: List of dictionaries with name, path_lower, path_display, server_modified (datetime), size and content_hash.
+        """
+        folder = self.folders.get(folder_path.lower(), {'files': {}})
+        with self.lock:
+            items = list(folder['files'].items())
+        return [dict(info, path_lower=path_lower, server_modified=datetime.datetime.fromisoformat(info['server_modified']))
+                for path_lower, info in items]
+
+    def contains(self, folder_path, dropbox_path):
+        """Return True if the file is in the index of the given folder."""
+        folder = self.folders.get(folder_path.lower(), {'files': {}})
+        return dropbox_path.lower() in folder['files']
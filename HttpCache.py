@@ -0,0 +1,218 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from fnmatch import fnmatch
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Headers which describe the wire encoding of the body. The cache stores the decoded body, so these are dropped.
+_WIRE_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+class ResponseCache:
+    def __init__(self, db_file_path='HttpCache.db', ttl_rules=None, default_ttl=0, max_size_bytes=256 * 1024 * 1024):
+        """
+        An on-disk (SQLite) cache of HTTP GET responses keyed by url.
+
+        :param db_file_path: Path of the SQLite file holding the cached responses.
+        :param ttl_rules: Optional. List of (url pattern, ttl in seconds) tuples. The first pattern which matches
+                          the url (fnmatch style, e.g. '*get-autosearch-stock*') decides the ttl.
+        :param default_ttl: TTL in seconds for urls which match no rule. 0 means such urls are not cached.
+        :param max_size_bytes: Maximum total size of the cached bodies. Least recently used entries are evicted beyond it.
+        """
+        self.logger = logging.getLogger('ResponseCache')
+        self.db_file_path = db_file_path
+        self.ttl_rules = ttl_rules or []
+        self.default_ttl = default_ttl
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file_path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS HTTP_CACHE (
+                URL TEXT PRIMARY KEY,
+                STATUS INTEGER NOT NULL,
+                HEADERS TEXT NOT NULL,
+                CONTENT BLOB NOT NULL,
+                SIZE INTEGER NOT NULL,
+                STORED_AT REAL NOT NULL,
+                LAST_ACCESS REAL NOT NULL,
+                ETAG TEXT,
+                LAST_MODIFIED TEXT
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS IX_HTTP_CACHE_LAST_ACCESS ON HTTP_CACHE (LAST_ACCESS)")
+        self.conn.commit()
+        self.total_size = self.conn.execute("SELECT COALESCE(SUM(SIZE), 0) FROM HTTP_CACHE").fetchone()[0]
+
+    def ttl_for(self, url):
+        """Return the ttl in seconds which applies to the given url."""
+        for pattern, ttl in self.ttl_rules:
+            if fnmatch(url, pattern):
+                return ttl
+        return self.default_ttl
+
+    def get(self, url):
+        """
+        Look up a cached response.
+
+        :param url: The url of the request.
+        :return: A dict with the cached response and a 'fresh' flag, or None when the url is not cached.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT STATUS, HEADERS, CONTENT, STORED_AT, ETAG, LAST_MODIFIED FROM HTTP_CACHE WHERE URL = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE HTTP_CACHE SET LAST_ACCESS = ? WHERE URL = ?", (time.time(), url))
+            self.conn.commit()
+        status, headers, content, stored_at, etag, last_modified = row
+        return {
+            'status': status,
+            'headers': json.loads(headers),
+            'content': content,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fresh': time.time() - stored_at < self.ttl_for(url),
+        }
+
+    def put(self, url, status, headers, content):
+        """
+        Store a response, evicting the least recently used entries if the cache grows beyond max_size_bytes.
+
+        :param url: The url of the request.
+        :param status: The HTTP status code.
+        :param headers: The response headers.
+        :param content: The decoded response body.
+        """
+        headers = CaseInsensitiveDict({k: v for k, v in headers.items() if k.lower() not in _WIRE_HEADERS})
+        now = time.time()
+        with self.lock:
+            previous = self.conn.execute("SELECT SIZE FROM HTTP_CACHE WHERE URL = ?", (url,)).fetchone()
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO HTTP_CACHE (URL, STATUS, HEADERS, CONTENT, SIZE, STORED_AT, LAST_ACCESS, ETAG, LAST_MODIFIED)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (url, status, json.dumps(dict(headers)), content, len(content), now, now, headers.get('ETag'),
+                 headers.get('Last-Modified'))
+            )
+            self.total_size += len(content) - (previous[0] if previous else 0)
+            self._evict()
+            self.conn.commit()
+
+    def refresh(self, url):
+        """Mark a cached response as fresh again after the server answered 304 Not Modified."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("UPDATE HTTP_CACHE SET STORED_AT = ?, LAST_ACCESS = ? WHERE URL = ?", (now, now, url))
+            self.conn.commit()
+
+    def _evict(self):
+        while self.total_size > self.max_size_bytes:
+            row = self.conn.execute("SELECT URL, SIZE FROM HTTP_CACHE ORDER BY LAST_ACCESS LIMIT 1").fetchone()
+            if row is None:
+                self.total_size = 0
+                break
+            self.conn.execute("DELETE FROM HTTP_CACHE WHERE URL = ?", (row[0],))
+            self.total_size -= row[1]
+            self.evictions += 1
+            self.logger.debug(f"Evicted '{row[0]}' from the response cache.")
+
+    def record_lookup(self, hit, revalidated=False):
+        """Count a cache lookup for the hit/miss statistics."""
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            if revalidated:
+                self.revalidations += 1
+
+    def stats(self):
+        """Return the hit/miss counters of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size_bytes': self.total_size,
+        }
+
+
+class CachingAdapter(HTTPAdapter):
+    def __init__(self, cache, rate_limiter=None, **kwargs):
+        """
+        A requests transport adapter which serves GET requests from a ResponseCache. Stale entries carrying an
+        ETag or Last-Modified header are revalidated with a conditional request instead of being re-downloaded.
+        Only the requests which go to the network wait for the HostRateLimiter and feed their status back into it,
+        every response carries a throttled attribute telling whether the limiter treated it as throttled (429/5xx).
+
+        :param cache: The ResponseCache to use.
+        :param rate_limiter: Optional. The RateLimiter.HostRateLimiter pacing the requests.
+        :param kwargs: Passed through to requests.adapters.HTTPAdapter.
+        """
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET' or self.cache.ttl_for(request.url) <= 0:
+            return self._send_to_network(request, **kwargs)
+
+        entry = self.cache.get(request.url)
+        if entry is not None and entry['fresh']:
+            self.cache.record_lookup(hit=True)
+            return self._build_cached_response(request, entry)
+
+        if entry is not None:
+            if entry['etag']:
+                request.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request.headers['If-Modified-Since'] = entry['last_modified']
+
+        response = self._send_to_network(request, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            self.cache.refresh(request.url)
+            self.cache.record_lookup(hit=True, revalidated=True)
+            return self._build_cached_response(request, entry)
+
+        self.cache.record_lookup(hit=False)
+        if response.status_code == 200 and 'no-store' not in response.headers.get('Cache-Control', ''):
+            self.cache.put(request.url, response.status_code, response.headers, response.content)
+        return response
+
+    def _send_to_network(self, request, **kwargs):
+        if self.rate_limiter is None:
+            response = super().send(request, **kwargs)
+            response.throttled = False
+            return response
+        self.rate_limiter.acquire(request.url)
+        response = super().send(request, **kwargs)
+        response.throttled = self.rate_limiter.record_response(request.url, response.status_code)
+        return response
+
+    def _build_cached_response(self, request, entry):
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = entry['content']
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.reason = 'OK'
+        response.url = request.url
+        response.request = request
+        response.from_cache = True
+        response.throttled = False
+        return response
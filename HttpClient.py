@@ -0,0 +1,86 @@
+import logging
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from PipelineMetrics import EndpointName
+
+
+class TimeoutSession(requests.Session):
+    def __init__(self, connect_timeout=5, read_timeout=30, metrics=None):
+        """
+        A requests Session which applies a default (connect, read) timeout to every request that does not
+        pass its own, so a hung socket fails the request instead of stalling the run.
+
+        :param connect_timeout: Seconds to wait for the TCP/TLS connection to be established.
+        :param read_timeout: Seconds to wait between bytes of the response.
+        :param metrics: Optional. PipelineMetrics recording every response and failed request of the session.
+        """
+        super().__init__()
+        self.timeout = (connect_timeout, read_timeout)
+        self.metrics = metrics
+        if metrics is not None:
+            self.hooks['response'].append(metrics.response_hook)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        start = time.monotonic()
+        try:
+            return super().request(method, url, **kwargs)
+        except requests.RequestException:
+            if self.metrics is not None:
+                self.metrics.record_request(EndpointName(url), time.monotonic() - start, error=True)
+            raise
+
+
+def BuildRetryPolicy(max_retries=3, backoff_factor=0.5, backoff_jitter=0.5):
+    """
+    Retry policy for idempotent requests: connection and read errors are retried with exponential backoff plus
+    random jitter. Responses are never retried on their status code, so every throttled (429/5xx) response reaches
+    the caller and the HostRateLimiter, which retry it at the pace of the host (see VSParse.GetWithThrottleRetries).
+
+    :param max_retries: Maximum number of retries of a single request.
+    :param backoff_factor: Base of the exponential backoff in seconds (factor * 2 ** (retry - 1)).
+    :param backoff_jitter: Maximum random number of seconds added to every backoff.
+    """
+    return Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status_forcelist=(),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        backoff_factor=backoff_factor,
+        backoff_jitter=backoff_jitter,
+        # urllib3 would otherwise retry 429/503 responses carrying a Retry-After header on its own.
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+
+
+def CreateHttpSession(adapter_class=HTTPAdapter, adapter_args=None, pool_size=10, pool_hosts=10, connect_timeout=5,
+                      read_timeout=30, max_retries=3, backoff_factor=0.5, backoff_jitter=0.5, metrics=None):
+    """
+    Create the shared HTTP session: a TimeoutSession with a keep-alive connection pool sized for the number of
+    concurrent workers and the jittered retry policy mounted for http and https.
+
+    :param adapter_class: The transport adapter to mount, e.g. HttpCache.CachingAdapter.
+    :param adapter_args: Optional. Positional arguments of the adapter, e.g. (ResponseCache,).
+    :param pool_size: Maximum number of kept-alive connections per host, should match the number of workers.
+    :param pool_hosts: Number of per-host connection pools kept.
+    :param connect_timeout: Default connect timeout in seconds.
+    :param read_timeout: Default read timeout in seconds.
+    :param max_retries: Maximum number of retries of a single request.
+    :param backoff_factor: Base of the exponential backoff in seconds.
+    :param backoff_jitter: Maximum random number of seconds added to every backoff.
+    :param metrics: Optional. PipelineMetrics recording the requests of the session.
+    :return: The configured session.
+    """
+    session = TimeoutSession(connect_timeout, read_timeout, metrics)
+    adapter = adapter_class(*(adapter_args or ()), pool_connections=pool_hosts, pool_maxsize=pool_size,
+                            max_retries=BuildRetryPolicy(max_retries, backoff_factor, backoff_jitter))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    logging.getLogger('HttpClient').debug(
+        f"Created HTTP session: pool_size={pool_size}, timeout=({connect_timeout}, {read_timeout}), max_retries={max_retries}.")
+    return session
@@ -1,183 +1,131 @@
 import pandas as pd
 import sqlite3
 
-def ImportValueStocksToSqlLiteDB(csv_file_path,db_file_path):
-    # Load the CSV data
-    csv_data = pd.read_csv(csv_file_path)
-
-    # Connect to the SQLite database
+from AdvancedInfoSchema import ADVANCED_INFO_COLUMNS, SCORE_VALUE_COLUMNS, LoadAdvancedInfoCsv
+from DimensionCache import DimensionCache
+from ValueStocksSchema import MigrateValueStocksSchema
+from ValueStocksQueries import RefreshDailyChanges
+
+# Dimension columns of the CSV and the DimensionCache dimension each of them is stored in.
+DIMENSION_COLUMNS = {
+    'SECTOR': 'SECTOR',
+    'VALUATION': 'VALUATION',
+    'MKCAPTYPE': 'MARKETCAPTYPE',
+    'TREND': 'TREND',
+    'FUNDAMENTAL': 'FUNDAMENTAL',
+    'MOMENTUM': 'MOMEMTUM',
+}
+# ID used for a dimension when the CSV has no value for it.
+DEFAULT_DIMENSION_ID = 1
+
+# VS_IMPORT column each Advanced Info CSV column is stored in. DATE and NAME only live in the VS_META_* tables.
+VS_IMPORT_COLUMN_OF = {
+    'DATENUM': 'IMPORT_DATE_ID', 'SYMBOL': 'SYMBOL_ID', 'SECTOR': 'SECTOR_ID', 'CMP': 'CMP', 'VALUATION': 'VALUATION_ID',
+    'FAIRRANGE': 'FAIR_RANGE', 'PE': 'PE', 'SECTORPE': 'SECTOR_PE', 'MARKETCAP': 'MARKET_CAP', 'MKCAPTYPE': 'MARKETCAPTYPEID',
+    'TREND': 'TREND_ID', 'FUNDAMENTAL': 'FUNDAMENTAL_ID', 'MOMENTUM': 'MOMEMTUM_ID', 'DERATIO': 'DERATIO',
+    'PRICETOSALES': 'PRICETOSALES', 'PLEDGE': 'PLEDGE', 'QBS': 'QBS', 'QBS%': '[QBS%]', 'AGS': 'AGS', 'AGS%': '[AGS%]',
+    'VALUATION_DCF': 'VALUATION_DCF', 'VALUATION_GRAHAM': 'VALUATION_GRAHAM', 'VALUATION_EARNING': 'VALUATION_EARNING',
+    'VALUATION_BOOKVALUE': 'VALUATION_BOOKVALUE', 'VALUATION_SALES': 'VALUATION_SALES',
+}
+# The numeric score values parsed by LoadAdvancedInfoCsv are stored in columns of the same name.
+VS_IMPORT_COLUMN_OF.update({valueColumn: valueColumn for valueColumns in SCORE_VALUE_COLUMNS.values() for valueColumn in valueColumns})
+VS_IMPORT_CSV_COLUMNS = [column for column in ADVANCED_INFO_COLUMNS + [valueColumn for valueColumns in SCORE_VALUE_COLUMNS.values()
+                                                                      for valueColumn in valueColumns]
+                         if column in VS_IMPORT_COLUMN_OF]
+VS_IMPORT_COLUMNS = [VS_IMPORT_COLUMN_OF[column] for column in VS_IMPORT_CSV_COLUMNS]
+# Re-importing a (date, symbol) updates the existing row instead of duplicating it.
+VS_IMPORT_UPSERT = (
+    "INSERT INTO VS_IMPORT (" + ",".join(VS_IMPORT_COLUMNS) + ") VALUES (" + ",".join("?" * len(VS_IMPORT_COLUMNS)) + ")"
+    " ON CONFLICT (IMPORT_DATE_ID, SYMBOL_ID) DO UPDATE SET "
+    + ",".join(column + "=excluded." + column for column in VS_IMPORT_COLUMNS[2:])
+)
+
+def ApplyBulkLoadPragmas(conn):
+    # WAL with synchronous=NORMAL only syncs at checkpoints instead of on every commit.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+
+def OpenValueStocksDB(db_file_path):
+    # Open the database for importing, returns the connection and the DimensionCache preloaded from it.
     conn = sqlite3.connect(db_file_path)
-    cursor = conn.cursor()
-
-    # Insert DATE_ID into VS_META_IMPORTDATE and fetch the ID for use in VS_IMPORT table
-    for index, row in csv_data.iterrows():
-        
-        datenum = row['DATENUM']
-        date = row['DATE']
-
-        # Insert the date into VS_META_IMPORTDATE
-        cursor.execute(
-            """
-            INSERT OR IGNORE INTO VS_META_IMPORTDATE (DATENUM, DATE)
-            VALUES (?, ?)
-            """,
-            (datenum, date)
-        )
-
-        # Fetch the DATE_ID for the inserted/updated date
-        cursor.execute("SELECT ID FROM VS_META_IMPORTDATE WHERE DATENUM = ?", (datenum,))
-        date_id = cursor.fetchone()[0]
-
-        # Handle SYMBOL and COMPANY_NAME
-        symbol = row['SYMBOL']
-        company_name = row['NAME']
-        print("Processing for " + company_name)
-        # Insert into VS_META_STOCKINFO if not exists
-        cursor.execute(
-            """
-            INSERT OR IGNORE INTO VS_META_STOCKINFO (SYMBOL_ID, NAME)
-            VALUES (?, ?)
-            """,
-            (symbol, company_name)
-        )
-
-        # Fetch the STOCK_ID for the inserted/updated stock info
-        cursor.execute("SELECT ID FROM VS_META_STOCKINFO WHERE SYMBOL_ID = ?", (symbol,))
-        stock_id = cursor.fetchone()[0]
-
-        # Handle SECTOR
-        sector = row['SECTOR']
-        if(sector is not None):
-            # Insert into VS_META_SECTOR if not exists
-            cursor.execute(
-                """
-                INSERT OR IGNORE INTO VS_META_SECTOR (SECTOR_NAME)
-                VALUES (?)
-                """,
-                (sector,)
-            )
-
-            # Fetch the SECTOR_ID for the inserted/updated sector
-            cursor.execute("SELECT ID FROM VS_META_SECTOR WHERE SECTOR_NAME = ?", (sector,))
-            sector_id = cursor.fetchone()[0]
-        else:
-            sector_id = 1
-            
-        # Handle VALUATION
-        valuation = row['VALUATION']
-        if(valuation is not None):
-            # Insert into VS_META_VALUATION if not exists
-            cursor.execute(
-                """
-                INSERT OR IGNORE INTO VS_META_VALUATION (VALUATION)
-                VALUES (?)
-                """,
-                (valuation,)
-            )
-
-            # Fetch the VALUATION_ID for the inserted/updated valuation
-            cursor.execute("SELECT ID FROM VS_META_VALUATION WHERE VALUATION = ?", (valuation,))
-            valuation_id = cursor.fetchone()[0]
-        else:
-            valuation_id = 1
-            
-        # Handle MKCAPTYPE
-        mkcaptype = row['MKCAPTYPE']
-        if(mkcaptype is not None):
-            # Insert into VS_META_MARKETCAPTYPE if not exists
-            cursor.execute(
-                """
-                INSERT OR IGNORE INTO VS_META_MARKETCAPTYPE (MARKETCAPTYPE)
-                VALUES (?)
-                """,
-                (mkcaptype,)
-            )
-
-            # Fetch the MKCAPTYPE_ID for the inserted/updated market cap type
-            cursor.execute("SELECT ID FROM VS_META_MARKETCAPTYPE WHERE MARKETCAPTYPE = ?", (mkcaptype,))
-            mkcaptype_id = cursor.fetchone()[0]
-        else:
-            mkcaptype_id = 1
-            
-        # Handle TREND
-        trend = row['TREND']
-        if(trend is not None):
-            # Insert into VS_META_TREND if not exists
-            cursor.execute(
-                """
-                INSERT OR IGNORE INTO VS_META_TREND (TREND)
-                VALUES (?)
-                """,
-                (trend,)
-            )
-
-            # Fetch the TREND_ID for the inserted/updated trend
-            cursor.execute("SELECT ID FROM VS_META_TREND WHERE TREND = ?", (trend,))
-            trend_id = cursor.fetchone()[0]
-        else:
-            trend_id=1
-        
-        # Handle FUNDAMENTAL
-        fundamental = row['FUNDAMENTAL']
-        
-        if(fundamental is not None):
-            # Insert into VS_META_FUNDAMENTAL if not exists
-            cursor.execute(
-                """
-                INSERT OR IGNORE INTO VS_META_FUNDAMENTAL (FUNDAMENTAL)
-                VALUES (?)
-                """,
-                (fundamental,)
-            )
-
-            # Fetch the FUNDAMENTAL_ID for the inserted/updated fundamental
-            cursor.execute("SELECT ID FROM VS_META_FUNDAMENTAL WHERE FUNDAMENTAL = ?", (fundamental,))
-            fundamental_id = cursor.fetchone()[0]
-        else:
-            fundamental_id = 1
-        
-        # Handle MOMENTUM
-        momentum = row['MOMENTUM']
-        if(momentum is not None):
-            # Insert into VS_META_MOMEMTUM if not exists
-            cursor.execute(
-                """
-                INSERT OR IGNORE INTO VS_META_MOMEMTUM (MOMEMTUM)
-                VALUES (?)
-                """,
-                (momentum,)
-            )
-
-            # Fetch the MOMEMTUM_ID for the inserted/updated momentum
-            cursor.execute("SELECT ID FROM VS_META_MOMEMTUM WHERE MOMEMTUM = ?", (momentum,))
-            momentum_id = cursor.fetchone()[0]
-        else:
-            momentum_id = 1
-        
-        # Insert data into VS_IMPORT table
-        cursor.execute(
-            """
-            INSERT INTO VS_IMPORT (IMPORT_DATE_ID,SYMBOL_ID,SECTOR_ID,CMP,VALUATION_ID,
-                              FAIR_RANGE,PE,SECTOR_PE,MARKET_CAP,MARKETCAPTYPEID,TREND_ID,
-                              FUNDAMENTAL_ID,MOMEMTUM_ID,DERATIO,PRICETOSALES,PLEDGE,QBS,
-                              [QBS%],AGS,[AGS%],VALUATION_DCF,VALUATION_GRAHAM,VALUATION_EARNING,VALUATION_BOOKVALUE,VALUATION_SALES)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                date_id,stock_id,sector_id,row['CMP'],valuation_id,
-                row['FAIRRANGE'],row['PE'],row['SECTORPE'],row['MARKETCAP'],mkcaptype_id,trend_id,
-                fundamental_id,momentum_id,row['DERATIO'],row['PRICETOSALES'],row['PLEDGE'],row['QBS'],
-                row['QBS%'],row['AGS'],row['AGS%'],row['VALUATION_DCF'],row['VALUATION_GRAHAM'],row['VALUATION_EARNING'],row['VALUATION_BOOKVALUE'],row['VALUATION_SALES']
-            )
-        )
-
-    # Commit the transaction and close the connection
-    conn.commit()
-    conn.execute("VACCUM")
-    conn.close()
-
-# Paths to files
-csv_file_path = '20250112-130626-3.DLEVEL_ADVANCED_INFO.CSV'
-db_file_path = 'ValueStocksDB.db'
-ImportValueStocksToSqlLiteDB(csv_file_path,db_file_path)
-print("CSV data successfully imported into VS_IMPORT table using the existing schema.")
+    ApplyBulkLoadPragmas(conn)
+    MigrateValueStocksSchema(conn)
+    return conn, DimensionCache(conn)
+
+def ImportValueStocksRows(conn, dimensionCache, rows):
+    # Resolve the dimensions of the rows through the cache and insert them into VS_IMPORT. Does not commit.
+    dateIds = dimensionCache.resolve('IMPORTDATE', ((row['DATENUM'], row['DATE']) for row in rows))
+    stockIds = dimensionCache.resolve('STOCKINFO', ((row['SYMBOL'], row['NAME']) for row in rows))
+    dimensionIds = {}
+    for csvColumn, dimension in DIMENSION_COLUMNS.items():
+        dimensionIds[csvColumn] = dimensionCache.resolve(dimension, ((row[csvColumn],) for row in rows))
+
+    # Dimension columns are stored as the ID of their value, the other columns as they are.
+    valueColumns = [(csvColumn, dimensionIds.get(csvColumn)) for csvColumn in VS_IMPORT_CSV_COLUMNS[2:]]
+
+    importRows = []
+    for row in rows:
+        stock_id = stockIds.get(row['SYMBOL'])
+        if stock_id is None:
+            print("Skipping " + str(row['SYMBOL']) + " since it could not be added to VS_META_STOCKINFO")
+            continue
+        importRows.append((dateIds[row['DATENUM']], stock_id) + tuple(
+            row[csvColumn] if ids is None else ids.get(row[csvColumn], DEFAULT_DIMENSION_ID) for csvColumn, ids in valueColumns
+        ))
+
+    # Upsert data into VS_IMPORT table
+    conn.executemany(VS_IMPORT_UPSERT, importRows)
+    return len(importRows)
+
+def ImportDateIds(dimensionCache, rows):
+    # IDs of the import dates of the rows, after ImportValueStocksRows resolved them.
+    dateIds = dimensionCache.ids['IMPORTDATE']
+    return {dateIds[row['DATENUM']] for row in rows if row['DATENUM'] in dateIds}
+
+def ReadValueStocksCsv(csv_file_path):
+    # Load the CSV data with the typed loader, so numbers are inserted as numbers. Missing values become None so they
+    # map to the default dimension ID.
+    csv_data = LoadAdvancedInfoCsv(csv_file_path)
+    return csv_data.astype(object).where(pd.notna(csv_data), None).to_dict('records')
+
+def ImportValueStocksFiles(csv_file_paths,conn,dimensionCache):
+    # Import several CSV files over one connection, sharing the DimensionCache. Each file is one transaction.
+    totalRows = 0
+    for csv_file_path in csv_file_paths:
+        rows = ReadValueStocksCsv(csv_file_path)
+        try:
+            # The dimension IDs, the rows and their VS_DAILY_CHANGES transitions are committed together, so a crash
+            # cannot leave an imported date without its transitions.
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            importedRows = ImportValueStocksRows(conn, dimensionCache, rows)
+            # Keep the day-over-day transitions of the imported dates up to date
+            RefreshDailyChanges(conn, ImportDateIds(dimensionCache, rows))
+            # Commit the whole file as a single transaction
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # IDs inserted by the rolled back transaction are gone, reload the cache from the database.
+            dimensionCache.reload()
+            raise
+        print("Imported " + str(importedRows) + " rows from " + csv_file_path)
+        totalRows += importedRows
+    return totalRows
+
+def ImportValueStocksToSqlLiteDB(csv_file_path,db_file_path,vacuum=False):
+    conn, dimensionCache = OpenValueStocksDB(db_file_path)
+    try:
+        ImportValueStocksFiles([csv_file_path], conn, dimensionCache)
+        if vacuum:
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    # Paths to files
+    csv_file_path = '20250112-130626-3.DLEVEL_ADVANCED_INFO.CSV'
+    db_file_path = 'ValueStocksDB.db'
+    ImportValueStocksToSqlLiteDB(csv_file_path,db_file_path)
+    print("CSV data successfully imported into VS_IMPORT table using the existing schema.")
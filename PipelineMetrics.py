@@ -0,0 +1,207 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import ContextDecorator
+from urllib.parse import urlparse
+
+# Quantiles reported for the request latencies.
+LATENCY_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def EndpointName(url):
+    """Return the endpoint a url belongs to (host and path, without the query), e.g. 'ws.dlevels.com/vs-api'."""
+    parsed = urlparse(url)
+    return parsed.netloc + parsed.path
+
+
+def Percentile(sorted_values, quantile):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(quantile * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class _StageTimer(ContextDecorator):
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def _recreate_cm(self):
+        # Used as a decorator the timer is shared by every call, so each call (from any thread) times itself.
+        return _StageTimer(self.metrics, self.name)
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record_stage(self.name, time.monotonic() - self.start, failed=exc_type is not None)
+        return False
+
+
+class PipelineMetrics:
+    def __init__(self, run_name=None):
+        """
+        Collects the metrics of a run: wall time per pipeline stage and, per endpoint, the number of requests,
+        latencies, bytes transferred, retries, errors and cache hits. Thread safe, so the worker threads of
+        the thread pools can record into a single instance.
+
+        :param run_name: Optional. Name of the run included in the summary.
+        """
+        self.logger = logging.getLogger('PipelineMetrics')
+        self.run_name = run_name
+        self.started = time.time()
+        self.stages = {}
+        self.endpoints = {}
+        self.info = {}
+        self.lock = threading.Lock()
+
+    def reset(self, run_name=None):
+        """Clear all the metrics to start recording a new run."""
+        with self.lock:
+            self.run_name = run_name
+            self.started = time.time()
+            self.stages = {}
+            self.endpoints = {}
+            self.info = {}
+
+    def stage(self, name):
+        """
+        Time a pipeline stage. Usable as a context manager or as a function decorator. Stages which run more
+        than once accumulate their time, nested stages include the time of the stages they contain.
+
+        :param name: Name of the stage.
+        """
+        return _StageTimer(self, name)
+
+    def record_stage(self, name, seconds, failed=False):
+        with self.lock:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'failures': 0})
+            stage['seconds'] += seconds
+            stage['calls'] += 1
+            stage['failures'] += int(failed)
+        self.logger.info(f"Stage '{name}' took {seconds:.3f} seconds.")
+
+    def _endpoint(self, endpoint):
+        return self.endpoints.setdefault(endpoint, {
+            'requests': 0, 'errors': 0, 'bytes': 0, 'retries': 0, 'cache_hits': 0, 'status': {}, 'latencies': []
+        })
+
+    def record_request(self, endpoint, seconds, status=None, bytes_transferred=0, retries=0, from_cache=False, error=False):
+        """
+        Record one request.
+
+        :param endpoint: The endpoint name, see EndpointName.
+        :param seconds: Latency of the request.
+        :param status: Optional. The status code of the response.
+        :param bytes_transferred: Size of the body sent or received.
+        :param retries: Number of retries which were needed.
+        :param from_cache: True if the response was served from the response cache.
+        :param error: True if the request failed without a response.
+        """
+        with self.lock:
+            stats = self._endpoint(endpoint)
+            stats['requests'] += 1
+            stats['latencies'].append(seconds)
+            stats['bytes'] += bytes_transferred
+            stats['retries'] += retries
+            stats['cache_hits'] += int(from_cache)
+            stats['errors'] += int(error)
+            if status is not None:
+                stats['status'][str(status)] = stats['status'].get(str(status), 0) + 1
+
+    def record_bytes(self, endpoint, bytes_transferred):
+        """Add bytes transferred by an endpoint outside of record_request, e.g. the size of an uploaded file."""
+        with self.lock:
+            self._endpoint(endpoint)['bytes'] += bytes_transferred
+
+    def set_info(self, name, value):
+        """Attach additional (JSON serialisable) information to the summary, e.g. the response cache statistics."""
+        with self.lock:
+            self.info[name] = value
+
+    def response_hook(self, response, *args, **kwargs):
+        """requests 'response' hook recording every response of a session."""
+        raw_retries = getattr(response.raw, 'retries', None)
+        retries = len(raw_retries.history) if raw_retries is not None else 0
+        if kwargs.get('stream'):
+            bytes_transferred = int(response.headers.get('Content-Length') or 0)
+        else:
+            bytes_transferred = len(response.content or b'')
+        self.record_request(EndpointName(response.url), response.elapsed.total_seconds(), response.status_code,
+                            bytes_transferred, retries, getattr(response, 'from_cache', False))
+        return response
+
+    def summary(self):
+        """Return the metrics of the run as a dictionary."""
+        with self.lock:
+            endpoints = {}
+            for endpoint, stats in self.endpoints.items():
+                latencies = sorted(stats['latencies'])
+                endpoints[endpoint] = {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'status': dict(stats['status']),
+                    'bytes': stats['bytes'],
+                    'retries': stats['retries'],
+                    'cache_hits': stats['cache_hits'],
+                    'cache_hit_rate': stats['cache_hits'] / stats['requests'] if stats['requests'] else 0.0,
+                    'latency_seconds': dict(
+                        {f"p{int(q * 100)}": Percentile(latencies, q) for q in LATENCY_QUANTILES},
+                        sum=sum(latencies), max=latencies[-1] if latencies else 0.0),
+                }
+            return {
+                'run': self.run_name,
+                'started': self.started,
+                'wall_seconds': time.time() - self.started,
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'endpoints': endpoints,
+                'info': dict(self.info),
+            }
+
+    def write_json(self, file_path):
+        """Write the run summary as JSON."""
+        self._write_atomic(file_path, json.dumps(self.summary(), indent=2, default=str))
+        self.logger.info(f"Metrics written to '{file_path}'.")
+
+    def write_prometheus(self, file_path, prefix='vsparse'):
+        """Write the run summary in the Prometheus text format, for the node_exporter textfile collector."""
+        summary = self.summary()
+        lines = [
+            f"# TYPE {prefix}_run_seconds gauge",
+            f"{prefix}_run_seconds {summary['wall_seconds']:.6f}",
+            f"# TYPE {prefix}_run_timestamp_seconds gauge",
+            f"{prefix}_run_timestamp_seconds {summary['started']:.0f}",
+            f"# TYPE {prefix}_stage_seconds gauge",
+        ]
+        for name, stage in summary['stages'].items():
+            lines.append(f'{prefix}_stage_seconds{{stage="{name}"}} {stage["seconds"]:.6f}')
+        lines.append(f"# TYPE {prefix}_stage_failures gauge")
+        for name, stage in summary['stages'].items():
+            lines.append(f'{prefix}_stage_failures{{stage="{name}"}} {stage["failures"]}')
+
+        lines.append(f"# TYPE {prefix}_request_duration_seconds summary")
+        for endpoint, stats in summary['endpoints'].items():
+            label = f'endpoint="{endpoint}"'
+            for q in LATENCY_QUANTILES:
+                lines.append(f'{prefix}_request_duration_seconds{{{label},quantile="{q}"}} '
+                             f'{stats["latency_seconds"][f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'{prefix}_request_duration_seconds_sum{{{label}}} {stats["latency_seconds"]["sum"]:.6f}')
+            lines.append(f'{prefix}_request_duration_seconds_count{{{label}}} {stats["requests"]}')
+        for metric in ('errors', 'bytes', 'retries', 'cache_hits'):
+            lines.append(f"# TYPE {prefix}_request_{metric}_total counter")
+            for endpoint, stats in summary['endpoints'].items():
+                lines.append(f'{prefix}_request_{metric}_total{{endpoint="{endpoint}"}} {stats[metric]}')
+        self._write_atomic(file_path, "\n".join(lines) + "\n")
+        self.logger.info(f"Prometheus metrics written to '{file_path}'.")
+
+    @staticmethod
+    def _write_atomic(file_path, content):
+        temp_file_path = file_path + '.tmp'
+        with open(temp_file_path, 'w') as file:
+            file.write(content)
+        os.replace(temp_file_path, file_path)
@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+
+# Status codes which indicate that the server wants us to slow down.
+THROTTLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, min_rate=None, max_rate=None, increase_step=0.5, decrease_factor=0.5):
+        """
+        A thread safe token bucket. Each request takes one token, tokens are
+        refilled continuously at 'rate' tokens per second. The rate adapts to the
+        server: it is cut by 'decrease_factor' on a throttled response and grows by
+        'increase_step' on every healthy response (AIMD), within [min_rate, max_rate].
+
+        :param rate: Number of requests allowed per second.
+        :param capacity: Optional. Maximum burst size. Defaults to 'rate' (one second worth of tokens).
+        :param min_rate: Optional. Lowest rate the bucket backs off to. Defaults to a tenth of 'rate'.
+        :param max_rate: Optional. Highest rate the bucket speeds up to. Defaults to twice 'rate'.
+        :param increase_step: Requests per second added after each healthy response.
+        :param decrease_factor: Multiplier applied to the rate after a throttled response.
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.min_rate = float(min_rate or self.rate / 10)
+        self.max_rate = float(max_rate or self.rate * 2)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def try_acquire(self):
+        """Take a token if one is available. Returns 0 when it was taken, otherwise the seconds to wait for one."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        while True:
+            wait_time = self.try_acquire()
+            if wait_time <= 0:
+                return
+            time.sleep(wait_time)
+
+    def backoff(self):
+        """Slow down after a throttled response and drop any burst allowance."""
+        with self.lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self.tokens = min(self.tokens, 0)
+            return self.rate
+
+    def speedup(self):
+        """Speed up after a healthy response."""
+        with self.lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+            return self.rate
+
+
+class HostRateLimiter:
+    def __init__(self, requests_per_second, burst=None, min_rate=None, max_rate=None):
+        """
+        Keeps one token bucket per host so that concurrent workers hitting the same
+        host share a single request budget.
+
+        :param requests_per_second: Number of requests allowed per second for each host.
+        :param burst: Optional. Maximum burst size per host.
+        :param min_rate: Optional. Lowest rate a host is backed off to.
+        :param max_rate: Optional. Highest rate a host is sped up to.
+        """
+        self.logger = logging.getLogger('HostRateLimiter')
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _get_bucket(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.requests_per_second, self.burst, self.min_rate, self.max_rate)
+                self.buckets[host] = bucket
+                self.logger.debug(f"Created rate limiter for host '{host}' at {self.requests_per_second} requests/second.")
+            return bucket
+
+    def acquire(self, url):
+        """
+        Block until a request to the host of the given url is allowed.
+
+        :param url: The url about to be requested.
+        """
+        self._get_bucket(url).acquire()
+
+    def try_acquire(self, url):
+        """
+        Non-blocking variant of acquire for callers which wait on their own, e.g. an asyncio event loop.
+
+        :param url: The url about to be requested.
+        :return: 0 when the request is allowed, otherwise the seconds to wait before trying again.
+        """
+        return self._get_bucket(url).try_acquire()
+
+    def record_response(self, url, status_code):
+        """
+        Feed the status code of a response back into the limiter of its host.
+
+        :param url: The url which was requested.
+        :param status_code: The HTTP status code of the response.
+        :return: True if the response was throttled, False otherwise.
+        """
+        bucket = self._get_bucket(url)
+        if status_code in THROTTLE_STATUS_CODES:
+            rate = bucket.backoff()
+            self.logger.info(f"Throttled response {status_code} from '{urlparse(url).netloc}'. Backing off to {rate:.2f} requests/second.")
+            return True
+        bucket.speedup()
+        return False
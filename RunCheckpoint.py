@@ -0,0 +1,157 @@
+import csv
+import json
+import logging
+import os
+import time
+from os.path import exists
+
+
+class RunCheckpoint:
+    def __init__(self, state_file_path, resume_max_age_hours=12):
+        """
+        Checkpointing for the Advanced Info run. The Advanced Info CSV is streamed row by row, so it doubles as
+        the journal of the run. The state of each run is recorded in a JSON state file keyed by the timestamped
+        Dlevel_Advanced_info name. A restarted run resumes the last run and only fetches the symbols which are
+        not in its CSV yet (i.e. missing or previously failed).
+
+        :param state_file_path: Path of the JSON file holding the run state.
+        :param resume_max_age_hours: Runs started longer ago than this are never resumed, a fresh run is started instead.
+        """
+        self.logger = logging.getLogger('RunCheckpoint')
+        self.state_file_path = state_file_path
+        self.resume_max_age_hours = resume_max_age_hours
+        self.state = self._load_state()
+        self.run_name = None
+
+    def _load_state(self):
+        if exists(self.state_file_path):
+            try:
+                with open(self.state_file_path, 'r') as file:
+                    return json.load(file)
+            except (IOError, ValueError) as e:
+                self.logger.error(f"Could not read run state '{self.state_file_path}': {e}. Starting with an empty state.")
+        return {'current': None, 'runs': {}}
+
+    def _save_state(self):
+        temp_file_path = self.state_file_path + '.tmp'
+        with open(temp_file_path, 'w') as file:
+            json.dump(self.state, file, indent=2)
+        os.replace(temp_file_path, self.state_file_path)
+
+    def journal_path(self, Dlevel_Advanced_info=None):
+        """Return the path of the journal (the Advanced Info CSV) of the given (or current) run."""
+        return Dlevel_Advanced_info or self.run_name
+
+    def start_or_resume(self, Dlevel_Advanced_info, Dlevel_Failed_Info, run_columns=None):
+        """
+        Resume the last run if it was interrupted or finished with failures recently, otherwise start a new run.
+
+        :param Dlevel_Advanced_info: Output file name to use for a new run.
+        :param Dlevel_Failed_Info: Failure file name to use for a new run.
+        :param run_columns: Optional. The DATENUM/DATE columns of a new run (see AdvancedInfoSchema.RunDateColumns).
+            A resumed run keeps the columns it was started with, see run_columns().
+        :return: Tuple (Dlevel_Advanced_info, Dlevel_Failed_Info) of the run to execute.
+        """
+        current = self.state.get('current')
+        run = self.state['runs'].get(current) if current else None
+        if run is not None and exists(self.journal_path(current)):
+            age_hours = (time.time() - run['started']) / 3600
+            if age_hours <= self.resume_max_age_hours and (run['status'] != 'complete' or run.get('failures', 0) > 0):
+                print("Resuming Advanced Info run : " + current)
+                self.logger.info(f"Resuming run '{current}' (status={run['status']}, failures={run.get('failures', 0)}).")
+                run['status'] = 'running'
+                run['resumed'] = run.get('resumed', 0) + 1
+                # Runs recorded before the columns were kept get those of the resumed run.
+                run.setdefault('run_columns', run_columns)
+                self.run_name = current
+                self._save_state()
+                return current, run['failed_info']
+
+        self.run_name = Dlevel_Advanced_info
+        self.state['current'] = Dlevel_Advanced_info
+        self.state['runs'][Dlevel_Advanced_info] = {
+            'failed_info': Dlevel_Failed_Info,
+            'status': 'running',
+            'started': time.time(),
+            'run_columns': run_columns,
+        }
+        self._save_state()
+        self.logger.info(f"Started run '{Dlevel_Advanced_info}'.")
+        return Dlevel_Advanced_info, Dlevel_Failed_Info
+
+    def run_columns(self):
+        """Return the DATENUM/DATE columns the current run was started with, None when none were given."""
+        return self.state['runs'][self.run_name].get('run_columns')
+
+    def _repair_journal(self):
+        # A row is written in one piece and ends with a newline, so a journal which does not end with one was cut
+        # off while writing its last row. Drop that partial line, so that appending starts on a fresh line.
+        with open(self.journal_path(), 'rb+') as file:
+            content = file.read()
+            if not content or content.endswith(b'\n'):
+                return
+            file.truncate(content.rfind(b'\n') + 1)
+        self.logger.warning(f"Dropped the partial last line of the journal '{self.journal_path()}'.")
+
+    @staticmethod
+    def _is_complete(row):
+        # csv.DictReader fills the missing columns of a short row with None and collects extra values under None.
+        return None not in row and None not in row.values()
+
+    def _read_journal(self):
+        with open(self.journal_path(), 'r', newline='') as file:
+            return [row for row in csv.DictReader(file) if self._is_complete(row)]
+
+    def completed_symbols(self):
+        """Return the set of symbols with a complete row in the journal of the current run."""
+        if not exists(self.journal_path()):
+            return set()
+        self._repair_journal()
+        return set(row['SYMBOL'] for row in self._read_journal())
+
+    def pending(self, rows):
+        """
+        Filter the rows down to those whose symbol is not in the journal yet.
+
+        :param rows: The DLevel Basic Info rows of the run.
+        :return: The rows which still have to be fetched.
+        """
+        completed = self.completed_symbols()
+        pendingRows = [row for row in rows if row['SYMBOL'] not in completed]
+        self.logger.info(f"{len(completed)} symbols already journaled, {len(pendingRows)} symbols pending.")
+        return pendingRows
+
+    def sort_journal(self, rows):
+        """
+        Rewrite the journal in the order of the given rows, keeping one complete row per symbol. Rows of a resumed
+        run are appended in the order they were fetched, this restores the symbol order of a single run.
+
+        :param rows: The DLevel Basic Info rows of the run, in the order of the output.
+        """
+        with open(self.journal_path(), 'r', newline='') as file:
+            reader = csv.DictReader(file)
+            journaled = {row['SYMBOL']: row for row in reader if self._is_complete(row)}
+            fieldnames = reader.fieldnames
+        order = {row['SYMBOL']: index for index, row in enumerate(rows)}
+        symbols = sorted(journaled, key=lambda symbol: order.get(symbol, len(order)))
+        temp_file_path = self.journal_path() + '.tmp'
+        with open(temp_file_path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(journaled[symbol] for symbol in symbols)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file_path, self.journal_path())
+
+    def mark_complete(self, failures):
+        """
+        Record that the current run finished.
+
+        :param failures: Number of symbols which could not be fetched.
+        """
+        run = self.state['runs'][self.run_name]
+        run['status'] = 'complete'
+        run['failures'] = failures
+        run['completed'] = time.time()
+        self._save_state()
+        self.logger.info(f"Run '{self.run_name}' complete with {failures} failures.")
@@ -0,0 +1,76 @@
+import logging
+import os
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+from AdvancedInfoSchema import LoadAdvancedInfoCsv, ParseScoreColumns, SCORE_VALUE_COLUMNS
+
+logger = logging.getLogger('SnapshotArchive')
+
+SNAPSHOT_FORMATS = ('parquet', 'feather')
+
+def WriteColumnarSnapshot(df, csv_file_path, snapshot_format='parquet'):
+    # Write the snapshot next to its CSV, e.g. 20250112-130626-3.DLEVEL_ADVANCED_INFO.parquet
+    snapshot_file_path = os.path.splitext(csv_file_path)[0] + '.' + snapshot_format
+    if snapshot_format == 'parquet':
+        df.to_parquet(snapshot_file_path, index=False)
+    else:
+        df.reset_index(drop=True).to_feather(snapshot_file_path)
+    return snapshot_file_path
+
+def WriteSnapshotPartition(df, dataset_root):
+    # Store the snapshot in a dataset partitioned by DATENUM (<dataset_root>/DATENUM=YYYYMMDD/snapshot.parquet).
+    # A later snapshot of the same day replaces the partition.
+    snapshot_file_paths = []
+    for datenum, partition in df.groupby('DATENUM', observed=True):
+        partition_dir = os.path.join(dataset_root, 'DATENUM=' + str(datenum))
+        os.makedirs(partition_dir, exist_ok=True)
+        snapshot_file_path = os.path.join(partition_dir, 'snapshot.parquet')
+        partition.drop(columns=['DATENUM']).to_parquet(snapshot_file_path, index=False)
+        snapshot_file_paths.append(snapshot_file_path)
+    return snapshot_file_paths
+
+def ArchiveAdvancedInfoSnapshot(csv_file_path, snapshot_format='parquet', dataset_root='ValueStocksSnapshots'):
+    '''
+    Write an Advanced Info CSV as a typed columnar snapshot (Parquet or Feather) next to the CSV
+    and add it to the Parquet dataset of all snapshots, partitioned by DATENUM.
+    Returns the path of the snapshot file, or None when the columnar output is not available.
+    '''
+    if snapshot_format not in SNAPSHOT_FORMATS:
+        logger.info("Columnar snapshot disabled (format=" + str(snapshot_format) + ")")
+        return None
+    if pyarrow is None:
+        print("pyarrow is not installed, skipping the columnar snapshot of " + csv_file_path)
+        logger.warning("pyarrow is not installed, skipping the columnar snapshot of " + csv_file_path)
+        return None
+    try:
+        # The archive keeps the columns of the CSV, the score values are parsed again when it is loaded.
+        df = LoadAdvancedInfoCsv(csv_file_path, parse_scores=False)
+        snapshot_file_path = WriteColumnarSnapshot(df, csv_file_path, snapshot_format)
+        WriteSnapshotPartition(df, dataset_root)
+        print("Columnar snapshot written to : " + snapshot_file_path)
+        logger.info("Columnar snapshot written to : " + snapshot_file_path + " and added to dataset " + dataset_root)
+        return snapshot_file_path
+    except Exception as e:
+        print(f"Error writing the columnar snapshot of {csv_file_path}. Exception: {e}")
+        logger.error(f"Error writing the columnar snapshot of {csv_file_path}. Exception: {e}")
+        return None
+
+def LoadSnapshotDataset(dataset_root='ValueStocksSnapshots', from_datenum=None, to_datenum=None, columns=None):
+    # Load (a date range of) the snapshot dataset. Only the partitions and columns asked for are read. The score values
+    # are parsed when the QBS/AGS columns are loaded.
+    filters = []
+    if from_datenum is not None:
+        filters.append(('DATENUM', '>=', int(from_datenum)))
+    if to_datenum is not None:
+        filters.append(('DATENUM', '<=', int(to_datenum)))
+    df = pd.read_parquet(dataset_root, columns=columns, filters=filters or None)
+    if 'DATENUM' in df.columns:
+        df['DATENUM'] = df['DATENUM'].astype('int32')
+    if all(column in df.columns and column + '%' in df.columns for column in SCORE_VALUE_COLUMNS):
+        ParseScoreColumns(df)
+    return df
@@ -7,24 +7,133 @@ import logging
 import progressbar
 import datetime
 from lxml import html
-import copy
 import time
 from bs4 import BeautifulSoup
 import dropbox
 from DropboxClient import DropboxClient
 import pandas as pd
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from RateLimiter import HostRateLimiter
+from HttpCache import ResponseCache, CachingAdapter
+from HttpClient import CreateHttpSession
+from RunCheckpoint import RunCheckpoint
+from AdvancedInfoWriter import AdvancedInfoWriter
+from SnapshotArchive import ArchiveAdvancedInfoSnapshot
+from PipelineMetrics import PipelineMetrics
+from AdvancedInfoSchema import ADVANCED_INFO_COLUMNS, RunDateColumns, TransformAdvancedInfoRow, TransformAdvancedInfoRecords, LoadAdvancedInfoCsv
+from AdvancedInfoDelta import AdvancedInfoState, ApplyClosePrice, ParseBhavcopyClosePrices
+from WatchlistScreens import LoadWatchlistScreens, EvaluateScreens
 logging.basicConfig(filename="ValueStocksProcess.Log",level=logging.DEBUG,format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',datefmt='%d-%b-%y %H:%M:%S')
 
+# Base urls of the services, overridable to run against a local stand-in (see BenchmarkVSParse.py).
+NSE_ARCHIVES_BASE_URL = os.getenv('NSE_ARCHIVES_BASE_URL', 'https://archives.nseindia.com')
+DLEVELS_BASE_URL = os.getenv('DLEVELS_BASE_URL', 'https://ws.dlevels.com')
 
+# Number of Symbols fetched in parallel and the Maximum Requests per Second sent to a single Host.
+DLEVEL_MAX_WORKERS = int(os.getenv('DLEVEL_MAX_WORKERS', '8'))
+DLEVEL_REQUESTS_PER_SECOND = float(os.getenv('DLEVEL_REQUESTS_PER_SECOND', '10'))
+# Attempts per request when the answer is a throttled (429/5xx) response.
+DLEVEL_MAX_ATTEMPTS = int(os.getenv('DLEVEL_MAX_ATTEMPTS', '3'))
+# Optional cap on the number of NSE Symbols resolved, 0 means the full universe.
+DLEVEL_SYMBOL_LIMIT = int(os.getenv('DLEVEL_SYMBOL_LIMIT', '0'))
+dlevelsRateLimiter = HostRateLimiter(DLEVEL_REQUESTS_PER_SECOND)
+# Number of DLEVEL_KEYs packed into the param_list of one Fundamental Report request, the separator placed between
+# them and the field of each report which identifies the key it belongs to. Batching is off (1) by default since
+# list support of the endpoint is not documented. Keys missing from a batched response are fetched again one by
+# one, so a batch which is only partly answered costs one extra request. The first batch of a run is sent on its
+# own and a 200 response to it (or to any later batch) without a single matching report switches batching off for
+# the rest of the run. Failed or throttled batches are fetched one by one without switching batching off.
+DLEVEL_BATCH_SIZE = int(os.getenv('DLEVEL_BATCH_SIZE', '1'))
+DLEVEL_BATCH_SEPARATOR = os.getenv('DLEVEL_BATCH_SEPARATOR', ',')
+DLEVEL_BATCH_KEY_FIELD = os.getenv('DLEVEL_BATCH_KEY_FIELD', 'Symbol_Name')
+dlevelBatchUnsupported = threading.Event()
+
+# NSE Symbols resolved to their DLEVEL_KEY, built once and reused by the following runs.
+MASTER_EQUITY_L_W_DLEVEL_INFO = '02.MASTER_EQUITY_L_W_DLEVEL_INFO.CSV'
+DLEVEL_BASIC_INFO_COLUMNS = ['SYMBOL','NAME','DLEVEL_KEY']
+
+# On-disk cache of HTTP responses. Symbol to DLEVEL_KEY mappings almost never change, the NSE master list changes
+# daily and the Fundamental Report is only reused when a run is repeated on the same day (e.g. after a failure).
+HTTP_CACHE_FILE = os.getenv('HTTP_CACHE_FILE', 'HttpCache.db')
+HTTP_CACHE_TTL_RULES = [
+    ('*/get-autosearch-stock*', 30 * 24 * 60 * 60),
+    ('*/vs-api*Fundamental%20Report*', 6 * 60 * 60),
+    ('*/EQUITY_L.csv', 24 * 60 * 60),
+    ('*/sec_bhavdata_full_*.csv', 24 * 60 * 60),
+]
+HTTP_CACHE_MAX_SIZE_BYTES = int(os.getenv('HTTP_CACHE_MAX_SIZE_BYTES', str(256 * 1024 * 1024)))
+
+# Shared HTTP session. The connection pool is sized to the number of workers, every request gets a connect/read
+# timeout and connection errors are retried with jittered exponential backoff. Throttled (429/5xx) responses are
+# retried by GetWithThrottleRetries, paced by dlevelsRateLimiter.
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.5'))
+HTTP_BACKOFF_JITTER = float(os.getenv('HTTP_BACKOFF_JITTER', '0.5'))
+
+# Run state of the Advanced Info runs. An interrupted run (or one which finished with failures) younger than
+# DLEVEL_RESUME_MAX_AGE_HOURS is resumed instead of starting a full re-crawl.
+DLEVEL_RUNSTATE_FILE = os.getenv('DLEVEL_RUNSTATE_FILE', '03.DLEVEL_ADVANCED_INFO_RUNSTATE.JSON')
+DLEVEL_RESUME_MAX_AGE_HOURS = float(os.getenv('DLEVEL_RESUME_MAX_AGE_HOURS', '12'))
+
+# Optional columnar copy of every Advanced Info snapshot: 'parquet', 'feather' or 'none' (the default). When enabled,
+# all snapshots are also kept in a Parquet dataset partitioned by DATENUM under VS_SNAPSHOT_DATASET.
+VS_SNAPSHOT_FORMAT = os.getenv('VS_SNAPSHOT_FORMAT', 'none').lower()
+VS_SNAPSHOT_DATASET = os.getenv('VS_SNAPSHOT_DATASET', 'ValueStocksSnapshots')
+
+# Run metrics (stage timings, per endpoint requests/latency/bytes/retries/cache hits) written at the end of every run
+# as JSON and, when PIPELINE_METRICS_PROM_FILE is set, in the Prometheus textfile format.
+PIPELINE_METRICS_FILE = os.getenv('PIPELINE_METRICS_FILE', 'ValueStocksMetrics.json')
+PIPELINE_METRICS_PROM_FILE = os.getenv('PIPELINE_METRICS_PROM_FILE', '')
+pipelineMetrics = PipelineMetrics()
+
+# Delta mode. The fundamentals (FUNDAMENTAL, VALUATION, QBS, AGS, ...) of most symbols rarely change, so instead of
+# refetching every symbol the CMP is refreshed from the NSE bhavcopy and the fundamentals are only fetched from dlevels
+# on a staggered schedule of VS_DELTA_REFRESH_DAYS days or when the price moved by more than
+# VS_DELTA_PRICE_CHANGE_THRESHOLD since they were fetched. Only the rows which changed are written to the delta CSV.
+# The full snapshot is rebuilt from the state file for the watchlists and is uploaded under the dated name of a full
+# run next to the delta CSV. BackfillValueStocks.py imports both kinds of CSV into VS_IMPORT. The state file is only
+# saved once the run is published, so the changes of a run whose upload failed are written again by the next run.
+VS_DELTA_MODE = os.getenv('VS_DELTA_MODE', '0') == '1'
+VS_DELTA_STATE_FILE = os.getenv('VS_DELTA_STATE_FILE', '03.DLEVEL_ADVANCED_INFO_STATE.JSON')
+VS_DELTA_SNAPSHOT_FILE = os.getenv('VS_DELTA_SNAPSHOT_FILE', '03.DLEVEL_ADVANCED_INFO_SNAPSHOT.CSV')
+VS_DELTA_REFRESH_DAYS = int(os.getenv('VS_DELTA_REFRESH_DAYS', '7'))
+VS_DELTA_PRICE_CHANGE_THRESHOLD = float(os.getenv('VS_DELTA_PRICE_CHANGE_THRESHOLD', '0.05'))
+# Amibroker watchlists, one per screen of the screens file ('Watchlist Name: expression' per line, see
+# WatchlistScreens.CompileScreen). The five FUNDAMENTAL watchlists are generated when the file does not exist.
+VS_WATCHLIST_SCREENS_FILE = os.getenv('VS_WATCHLIST_SCREENS_FILE', 'WatchlistScreens.txt')
+# Number of days searched backwards for the latest published bhavcopy (weekends and market holidays have none).
+NSE_BHAVCOPY_LOOKBACK_DAYS = int(os.getenv('NSE_BHAVCOPY_LOOKBACK_DAYS', '7'))
+
+
+def GetWithThrottleRetries(url, label=None):
+    '''
+    GET the url, repeating the request up to DLEVEL_MAX_ATTEMPTS times while the response is throttled (429/5xx).
+    This is the only layer retrying on the status code, the CachingAdapter paces every attempt which goes to the
+    network with dlevelsRateLimiter, which backs off on each throttled response.
+    '''
+    for attempt in range(DLEVEL_MAX_ATTEMPTS):
+        response = session.get(url)
+        if not response.throttled:
+            break
+        logging.debug("Throttled Response "+str(response.status_code)+" for "+(label or url)+". Attempt "+str(attempt+1)+" of "+str(DLEVEL_MAX_ATTEMPTS))
+    return response
+
+@pipelineMetrics.stage('GetNseEquityData')
 def GetNseEquityData():
-    NSE_Equity_List_csv_url="https://archives.nseindia.com/content/equities/EQUITY_L.csv"
+    NSE_Equity_List_csv_url=NSE_ARCHIVES_BASE_URL+"/content/equities/EQUITY_L.csv"
     nse_Master_Equity_List_File='01.MASTER_EQUITY_L.CSV'
     file_exists = exists(nse_Master_Equity_List_File)
     if(file_exists):
         print(nse_Master_Equity_List_File + " Found.")
     else:
         print(nse_Master_Equity_List_File + " not Found. Hence Downloading")
-        req = requests.get(NSE_Equity_List_csv_url)
+        req = GetWithThrottleRetries(NSE_Equity_List_csv_url)
+        req.raise_for_status()
         url_content = req.content
         csv_file = open(nse_Master_Equity_List_File, 'wb')
         csv_file.write(url_content)
@@ -36,14 +145,44 @@ def GetNseEquityData():
         data = list(reader)
         return data[1:len(data)]
 
+@pipelineMetrics.stage('GetNseClosePrices')
+def GetNseClosePrices(now=None):
+    '''
+    Close prices of the latest NSE full bhavcopy published in the last NSE_BHAVCOPY_LOOKBACK_DAYS days, as a
+    SYMBOL -> price dictionary. Empty when no bhavcopy could be downloaded.
+    '''
+    now = now or datetime.datetime.now()
+    for daysBack in range(NSE_BHAVCOPY_LOOKBACK_DAYS):
+        day = now - datetime.timedelta(days=daysBack)
+        url = NSE_ARCHIVES_BASE_URL + "/products/content/sec_bhavdata_full_" + day.strftime('%d%m%Y') + ".csv"
+        try:
+            response = session.get(url)
+        except requests.RequestException as Argument:
+            logging.debug("Could not download the bhavcopy " + url + ". Exception=" + str(Argument))
+            continue
+        if response.status_code == 200:
+            prices = ParseBhavcopyClosePrices(response.content)
+            if len(prices) > 0:
+                print("Bhavcopy of " + day.strftime('%d-%b-%Y') + " loaded with " + str(len(prices)) + " close prices.")
+                logging.info("Bhavcopy of " + day.strftime('%d-%b-%Y') + " loaded with " + str(len(prices)) + " close prices.")
+                return prices
+        logging.debug("Bhavcopy not available at " + url + ". Status=" + str(response.status_code))
+    print("No bhavcopy found in the last " + str(NSE_BHAVCOPY_LOOKBACK_DAYS) + " days.")
+    logging.warning("No bhavcopy found in the last " + str(NSE_BHAVCOPY_LOOKBACK_DAYS) + " days.")
+    return {}
+
 
+def StockInfoUrl(symbol):
+    # get-autosearch-stock url of an NSE Symbol, shared by VSParse and VSParseAsync so both use the same cached lookups.
+    urlFormat=DLEVELS_BASE_URL+'/get-autosearch-stock?term={NseCode}&pageName='
+    return urlFormat.format(NseCode=symbol)
 
 def GetStockInfoFromDLevels(NseMasterRow):
-    # some JSON:
-    urlFormat='https://ws.dlevels.com/get-autosearch-stock?term={NseCode}&pageName='
-    url=urlFormat.format(NseCode=NseMasterRow["SYMBOL"])
-    #print(url)
-    response = session.get(url)
+    response = GetWithThrottleRetries(StockInfoUrl(NseMasterRow["SYMBOL"]), NseMasterRow["SYMBOL"])
+    return ParseStockInfo(NseMasterRow, response)
+
+def ParseStockInfo(NseMasterRow, response):
+    # The DLevel Basic Info row of an NSE master row from its get-autosearch-stock response, None when not found.
     if(response.status_code==200):
         #print(response.text)
         responseJson=response.text
@@ -65,63 +204,85 @@ def GetStockInfoFromDLevels(NseMasterRow):
                 #print(dictInfo)
                 return dictInfo
     else:
-        print("Error")
-def BuildAndSaveDLevelBasicInfo():
+        logging.error("DLevel Symbol lookup of "+NseMasterRow["SYMBOL"]+" failed with status "+str(response.status_code))
+def ResolveDLevelInfo(row):
+    '''
+    Worker for the DLevel Symbol Resolution Thread Pool. Looks up a single NSE row exactly once
+    and returns the DLevel Basic Info row, or None when the Symbol could not be resolved.
+    '''
+    try:
+        logging.debug("Getting StockInfo from DLevel for :"+row["SYMBOL"])
+        return GetStockInfoFromDLevels(row)
+    except Exception as Argument:
+        logging.debug("Exception While getting StockInfo from DLevel for "+str(row["SYMBOL"])+". Exception="+str(Argument))
+
+def EligibleNseEquityData(nseEquityData):
+    # Only the EQ and BE series are looked up on dlevels.
+    eligibleData=[]
+    for row in nseEquityData:
+        if(row["SERIES"]=='EQ' or row["SERIES"]=="BE"):
+            eligibleData.append(row)
+        else:
+            logging.debug("Skipping "+row["SYMBOL"]+" Since the Series is not EQ or BE. The Symbol is :"+row["SERIES"])
+    return eligibleData
+
+def SaveDLevelBasicInfo(dLevelInfo):
+    try:
+        if(len(dLevelInfo) > 0):
+            with open(MASTER_EQUITY_L_W_DLEVEL_INFO, 'w', newline='') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=DLEVEL_BASIC_INFO_COLUMNS)
+                writer.writeheader()
+                for data in dLevelInfo:
+                    writer.writerow(data)
+            print("DLevelBasicInfo has been Written to : "+MASTER_EQUITY_L_W_DLEVEL_INFO)
+            logging.debug("DLevelBasicInfo has been Written to : "+MASTER_EQUITY_L_W_DLEVEL_INFO)
+        else:
+            print("DLevelBasicInfo Could not be  Written to : "+MASTER_EQUITY_L_W_DLEVEL_INFO + ". Since No Data")
+            logging.debug("DLevelBasicInfo Could not be  Written to : "+MASTER_EQUITY_L_W_DLEVEL_INFO + ". Since No Data")
+    except Exception as Argument:
+        logging.debug("DLevelBasicInfo Could not be  Written to : "+MASTER_EQUITY_L_W_DLEVEL_INFO + ". Due to Exception: "+str(Argument))
+
+def ReadDLevelBasicInfo():
+    file_exists = exists(MASTER_EQUITY_L_W_DLEVEL_INFO)
+    if(file_exists):
+        with open(MASTER_EQUITY_L_W_DLEVEL_INFO, 'r') as file:
+            reader = csv.DictReader(
+                file, fieldnames=DLEVEL_BASIC_INFO_COLUMNS)
+            data = list(reader)
+            return data[1:len(data)]
+
+@pipelineMetrics.stage('BuildAndSaveDLevelBasicInfo')
+def BuildAndSaveDLevelBasicInfo(maxWorkers=None):
     nseEquityData=GetNseEquityData() 
-    nseEquityData=nseEquityData[:20]
+    if DLEVEL_SYMBOL_LIMIT > 0:
+        nseEquityData=nseEquityData[:DLEVEL_SYMBOL_LIMIT]
     logging.debug(nseEquityData)
-    Master_Equity_l_w_Dlevel_info='02.MASTER_EQUITY_L_W_DLEVEL_INFO.CSV'
-    file_exists = exists(Master_Equity_l_w_Dlevel_info)
-    csv_columns=['SYMBOL','NAME','DLEVEL_KEY']
+    file_exists = exists(MASTER_EQUITY_L_W_DLEVEL_INFO)
     if(file_exists):
-        print("DLevelBasicInfo File : "+Master_Equity_l_w_Dlevel_info + " Found.")
+        print("DLevelBasicInfo File : "+MASTER_EQUITY_L_W_DLEVEL_INFO + " Found.")
     else:
-        print("DLevelBasicInfo File : "+Master_Equity_l_w_Dlevel_info + " Not Found. Hence Building...")
+        print("DLevelBasicInfo File : "+MASTER_EQUITY_L_W_DLEVEL_INFO + " Not Found. Hence Building...")
         dLevelInfo=[]
+        eligibleData=EligibleNseEquityData(nseEquityData)
         widgets = [' [',progressbar.Timer(format= 'Building DLevel Stock Info: %(elapsed)s'),'] ', progressbar.Bar('*'),' (',progressbar.Counter(format='%(value)02d/%(max_value)d'), ') ',]
  
-        bar = progressbar.ProgressBar(max_value=len(nseEquityData),widgets=widgets).start()
-        logging.debug("Total Symbols to Process : "+str(len(nseEquityData)))
+        bar = progressbar.ProgressBar(max_value=len(eligibleData),widgets=widgets).start()
+        logging.debug("Total Symbols to Process : "+str(len(eligibleData)))
+        # Each Symbol is looked up once, lookups run concurrently and are paced by dlevelsRateLimiter
+        # which backs off on 429/5xx responses and speeds up again while the responses are healthy.
+        maxWorkers = maxWorkers or DLEVEL_MAX_WORKERS
         progressCounter=0
-        for row in nseEquityData:
-            try:
-                #print(row)
-                if(row["SERIES"]=='EQ' or row["SERIES"]=="BE"):
-                    logging.debug("Getting StockInfo from DLevel for :"+row["SYMBOL"])
-                    dLevelInfoRow=GetStockInfoFromDLevels(row)
-                    if(dLevelInfoRow != None):
-                        dLevelInfo.append(GetStockInfoFromDLevels(row))
-                else:
-                    logging.debug("Skipping "+row["SYMBOL"]+" Since the Series is not EQ or BE. The Symbol is :"+row["SERIES"])
-            except Exception as Argument:
-                logging.debug("Exception While getting StockInfo from DLevel for "+str(row["SYMBOL"])+". Exception="+str(Argument))
-            finally:
+        with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+            for dLevelInfoRow in executor.map(ResolveDLevelInfo, eligibleData):
+                if(dLevelInfoRow != None):
+                    dLevelInfo.append(dLevelInfoRow)
                 progressCounter+=1
                 bar.update(progressCounter)
-                time.sleep(1/50)
-                logging.debug("Symbols Processed : "+str(progressCounter))
-        try:
-            if(len(dLevelInfo) > 0):
-                with open(Master_Equity_l_w_Dlevel_info, 'w', newline='') as csvfile:
-                    writer = csv.DictWriter(csvfile, fieldnames=csv_columns)
-                    writer.writeheader()
-                    for data in dLevelInfo:
-                        writer.writerow(data)
-                print("DLevelBasicInfo has been Written to : "+Master_Equity_l_w_Dlevel_info)
-                logging.debug("DLevelBasicInfo has been Written to : "+Master_Equity_l_w_Dlevel_info)
-            else:
-                print("DLevelBasicInfo Could not be  Written to : "+Master_Equity_l_w_Dlevel_info + ". Since No Data")
-                logging.debug("DLevelBasicInfo Could not be  Written to : "+Master_Equity_l_w_Dlevel_info + ". Since No Data")
-        except Exception as Argument:
-            logging.debug("DLevelBasicInfo Could not be  Written to : "+Master_Equity_l_w_Dlevel_info + ". Due to Exception: "+Argument)
+        bar.finish()
+        logging.debug("Symbols Processed : "+str(progressCounter))
+        SaveDLevelBasicInfo(dLevelInfo)
         #print(dLevelInfo)
-    file_exists = exists(Master_Equity_l_w_Dlevel_info)
-    if(file_exists):
-        with open(Master_Equity_l_w_Dlevel_info, 'r') as file:
-            reader = csv.DictReader(
-                file, fieldnames=csv_columns)
-            data = list(reader)
-            return data[1:len(data)]
+    return ReadDLevelBasicInfo()
             
 '''
 Following Method is not in Use.
@@ -152,85 +313,150 @@ def GetStockAdvancedInfoFromDLevels(BasicInfoRow):
     PePsValues=PePs[0].split('|')
     PriceToEarning      = PePsValues[0].replace("P/E: ",'').replace(' ','')
     PriceToSales        = PePsValues[1].replace("P/S: ",'').replace(' ','')
-def GetStockAdvancedInfoFromDLevels1(row):
-    rowBackup=copy.deepcopy(row)
+def FundamentalReportsUrl(dLevelKeys):
+    # vs-api url of the Fundamental Report of one or more DLEVEL_KEYs, shared by VSParse and VSParseAsync.
+    urlFormat=DLEVELS_BASE_URL+'/vs-api?platform=web&action=Fundamental%20Report&param_list={dLevel_Key}'
+    return urlFormat.format(dLevel_Key=DLEVEL_BATCH_SEPARATOR.join(key.replace("_","%20") for key in dLevelKeys))
+
+def ParseFundamentalReports(response):
+    # The list of report dictionaries of a vs-api response, empty when the response carries no report.
+    if(response.status_code==200):
+        y = json.loads(response.text)
+        if(y['response']!=[] and len(y['response'])==2):
+            return y['response'][1]
+    return []
+
+def FetchFundamentalReports(dLevelKeys):
+    '''
+    Fetch the Fundamental Report of one or more DLEVEL_KEYs in a single vs-api request.
+    Returns the list of report dictionaries of the response, empty when the response carries no report.
+    '''
+    url=FundamentalReportsUrl(dLevelKeys)
+    logging.debug("Fetching Advanced Info using url:"+url)
+    return ParseFundamentalReports(GetWithThrottleRetries(url))
+
+def NormaliseDLevelKey(dLevelKey):
+    return str(dLevelKey).strip().replace(' ','_').lower()
+
+def GetStockAdvancedInfoFromDLevels1(row, report=None, runColumns=None):
+    rowBackup=dict(row)
     logging.debug("START: Fetching Advanced Info for :"+rowBackup["SYMBOL"]+" having dlevelKey:"+rowBackup["DLEVEL_KEY"])
     # some JSON:
     try:
-        #1. Get Info from the Web Service Call.
-        urlFormat='https://ws.dlevels.com/vs-api?platform=web&action=Fundamental%20Report&param_list={dLevel_Key}'
-        url=urlFormat.format(dLevel_Key=rowBackup["DLEVEL_KEY"].replace("_","%20"))
-        logging.debug("Fetching Advanced Info using url:"+url)
-        response = session.get(url)
-        if(response.status_code==200):
-            responseJson=response.text
-            y = json.loads(responseJson)
-            if(y['response']!=[] and len(y['response'])==2):
-                rowBackup.update(y['response'][1][0])
-        #2. Get the Info from Parsing the Data.
-        #pageBasicFundamentalsFormat = "https://www.valuestocks.in/en/fundamentals-nse-stocks/{dLevelKey}"
-        #pageBasicFundamentalsUrl=pageBasicFundamentalsFormat.format(dLevelKey=rowBackup["DLEVEL_KEY"])
-        #pageResponse=session.get(pageBasicFundamentalsUrl)
-        #tree = html.fromstring(pageResponse.content) 
-        #Sector              =   tree.xpath('//*[@id="app"]/div[3]/div[1]/div[2]/div/div[1]/div/div/div[1]/span/text()')
-        ValuationRange      =   "0-0"#tree.xpath('//*[@id="app"]/div[3]/div[1]/div[2]/div/div[4]/div/div/div[1]/h4/text()')
-        
-        # Retrieving Additional Valuation Information
-        #valuationUrlFormat="https://www.valuestocks.in/en/stocks-valuation/{dLevel_Key}"
-        #valuationurl=valuationUrlFormat.format(dLevel_Key=rowBackup["DLEVEL_KEY"])
-        #responseValuation=session.get(valuationurl)
-        #try:
-        #    if(response.status_code==200):
-        #        soup=BeautifulSoup(responseValuation.content,'html.parser')
-        #        s=soup.find_all('td',class_="stock_data_algnmnt")
-        ValuationAsPerDCF="0"#s[2].text
-        ValuationAsPerGraham="0"#s[3].text
-        ValuationAsPerEarning="0"#s[4].text
-        ValuationAsPerBookValue="0"#s[5].text
-        ValuationAsPerSales="0"#s[6].text
-        SectorPE="0"#s[10].text
-        #else:
-        #        logging.debug("Error Response from Url:"+valuationurl)
-        #except Exception as Argument:
-        #    logging.debug("Exception during Reading Valuation Data"+Argument)
-        
-        return {
-        "DATENUM":datetime.now().strftime('%Y%m%d'),
-        "DATE": datetime.now().strftime('%d-%b-%Y'),
-        "SYMBOL":rowBackup["SYMBOL"],
-        "NAME":rowBackup["NAME"],
-        "SECTOR":rowBackup["SECTOR"],
-        "CMP":rowBackup["LastClose"],
-        "VALUATION":rowBackup["valuation"],
-        "FAIRRANGE":ValuationRange,
-        "PE":rowBackup["Pe"],
-        "SECTORPE":SectorPE,
-        "MARKETCAP":rowBackup["MarketCap"],
-        "MKCAPTYPE":rowBackup['MkCapType'],
-        "TREND":rowBackup["technical_trend"],
-        "FUNDAMENTAL":rowBackup["stock_fundamental"],
-        "MOMENTUM":rowBackup["price_momentum"],
-        "DERATIO":rowBackup["Deratio"],
-        "PRICETOSALES":rowBackup["PriceToSales"],
-        "PLEDGE":rowBackup["Pledge"],
-        "QBS":rowBackup["Qbs"].replace("/","(")+")" if len(rowBackup["Qbs"])>0 else rowBackup["Qbs"],
-        "QBS%":rowBackup["qbs_perc"],
-        "AGS":rowBackup["Ags"].replace("/","(")+")" if len(rowBackup["Ags"])>0 else rowBackup["Ags"],
-        "AGS%":rowBackup["ags_perc"],
-        "VALUATION_DCF":ValuationAsPerDCF,
-        "VALUATION_GRAHAM":ValuationAsPerGraham,
-        "VALUATION_EARNING":ValuationAsPerEarning,
-        "VALUATION_BOOKVALUE":ValuationAsPerBookValue,
-        "VALUATION_SALES":ValuationAsPerSales
-        
-        }
+        #1. Get Info from the Web Service Call, unless it was already fetched in a batch.
+        if report is None:
+            reports = FetchFundamentalReports([rowBackup["DLEVEL_KEY"]])
+            if reports:
+                report = reports[0]
+        if report is not None:
+            rowBackup.update(report)
+        #2. Map the Report onto the Advanced Info columns.
+        return TransformAdvancedInfoRow(rowBackup, runColumns or RunDateColumns())
     except Exception as Argument:
         logging.debug("ERROR: Error Fetching Advanced Info for :"+rowBackup["SYMBOL"]+" having dlevelKey:"+rowBackup["DLEVEL_KEY"])
         logging.debug("Exception: "+str(Argument))
     finally:
         logging.debug("FINISHED: Fetching Advanced Info for :"+rowBackup["SYMBOL"]+" having dlevelKey:"+rowBackup["DLEVEL_KEY"])
 
-def BuildAndSaveAdvancedDLevelInfo(Dlevel_Advanced_info,Dlevel_Failed_Info):
+def FetchAdvancedDLevelInfo(row, runColumns=None):
+    '''
+    Worker for the Advanced Info Thread Pool. Returns the input row, the Advanced Info row (None when not available)
+    and the Exception raised while fetching (None when there was no Exception).
+    '''
+    try:
+        print("Processing Advanced Data for :" + row["SYMBOL"])
+        logging.debug("Processing Advanced Data for :" + row["SYMBOL"])
+        return row, GetStockAdvancedInfoFromDLevels1(row, runColumns=runColumns), None
+    except Exception as Argument:
+        return row, None, Argument
+
+def DemultiplexFundamentalReports(rows, response, runColumns):
+    '''
+    Match the reports of a batched vs-api response to the rows by DLEVEL_BATCH_KEY_FIELD and transform them in bulk.
+    Returns a (row, dLevelInfoRow) tuple per row, dLevelInfoRow is None when the report of the row is missing or could
+    not be converted. A 200 response without any matching report confirms that the endpoint does not support lists,
+    batching is switched off for the rest of the run. Shared by VSParse and VSParseAsync.
+    '''
+    reportsByKey = {}
+    for report in ParseFundamentalReports(response):
+        if report.get(DLEVEL_BATCH_KEY_FIELD):
+            reportsByKey[NormaliseDLevelKey(report[DLEVEL_BATCH_KEY_FIELD])] = report
+    matched = [NormaliseDLevelKey(row["DLEVEL_KEY"]) in reportsByKey for row in rows]
+    if response.status_code == 200 and not any(matched) and not dlevelBatchUnsupported.is_set():
+        dlevelBatchUnsupported.set()
+        logging.warning("Batched Fundamental Report request returned no matching report, falling back to one request per Symbol.")
+    elif not all(matched):
+        logging.debug(str(matched.count(False))+" of "+str(len(rows))+" Symbols missing from a batched response (status "+str(response.status_code)+"), fetching them one by one.")
+    records = [dict(row, **reportsByKey.get(NormaliseDLevelKey(row["DLEVEL_KEY"]), {})) for row in rows]
+    return list(zip(rows, TransformAdvancedInfoRecords(records, runColumns)))
+
+def FetchAdvancedDLevelInfoBatch(rows, runColumns=None):
+    '''
+    Worker for the batched Advanced Info Thread Pool. Fetches the Fundamental Reports of all the rows in one request,
+    demultiplexes them with DemultiplexFundamentalReports and falls back to FetchAdvancedDLevelInfo for every row whose
+    report is missing from the response or could not be converted.
+    Returns the list of FetchAdvancedDLevelInfo results.
+    '''
+    runColumns = runColumns or RunDateColumns()
+    if len(rows) == 1 or dlevelBatchUnsupported.is_set():
+        return [FetchAdvancedDLevelInfo(row, runColumns) for row in rows]
+
+    try:
+        url = FundamentalReportsUrl([row["DLEVEL_KEY"] for row in rows])
+        logging.debug("Fetching Advanced Info of "+str(len(rows))+" Symbols using url:"+url)
+        demultiplexed = DemultiplexFundamentalReports(rows, GetWithThrottleRetries(url), runColumns)
+    except Exception as Argument:
+        logging.debug("Exception while fetching a batch of "+str(len(rows))+" Fundamental Reports. Exception="+str(Argument))
+        demultiplexed = [(row, None) for row in rows]
+
+    results = []
+    for row, dLevelInfoRow in demultiplexed:
+        if dLevelInfoRow is None:
+            results.append(FetchAdvancedDLevelInfo(row, runColumns))
+        else:
+            print("Processing Advanced Data for :" + row["SYMBOL"])
+            logging.debug("Processing Advanced Data for :" + row["SYMBOL"] + " from a batched response")
+            results.append((row, dLevelInfoRow, None))
+    return results
+
+def IterAdvancedDLevelInfo(nseEquityData, maxWorkers, batchSize=1, runColumns=None):
+    '''
+    Generator over the (row, dLevelInfoRow, Exception) results of FetchAdvancedDLevelInfo, in the order of nseEquityData.
+    Symbols are fetched in batches of batchSize. At most 2 x maxWorkers batches are in flight at any time, so memory
+    does not grow with the size of the universe. runColumns (DATENUM/DATE) are shared by every row of the run.
+    '''
+    runColumns = runColumns or RunDateColumns()
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        inFlight = deque()
+        for start in range(0, len(nseEquityData), batchSize):
+            inFlight.append(executor.submit(FetchAdvancedDLevelInfoBatch, nseEquityData[start:start + batchSize], runColumns))
+            # The first batch goes out alone, so an endpoint without list support is detected before more batches are sent.
+            if len(inFlight) >= maxWorkers * 2 or (start == 0 and batchSize > 1):
+                yield from inFlight.popleft().result()
+        while inFlight:
+            yield from inFlight.popleft().result()
+
+def LogAdvancedInfoFailure(row, Argument):
+    if Argument is not None:
+        print("Some Exception while fetching the Advanced Info for :" + row["SYMBOL"])
+        logging.debug("Some Exception while fetching the Advanced Info for :" + row["SYMBOL"])
+        print("Exception: " + str(Argument))
+        logging.debug("Exception: " + str(Argument))
+    else:
+        print("Unable to Get Advance Stock Info for Symbol:" + row["SYMBOL"])
+        logging.debug("Unable to Get Advance Stock Info for Symbol:" + row["SYMBOL"])
+
+def WriteAdvancedInfoResults(writer, results):
+    # Write the (row, dLevelInfoRow, Exception) results of a run with an AdvancedInfoWriter, shared with VSParseAsync.
+    for row, dLevelInfoRow, Argument in results:
+        if dLevelInfoRow is not None:
+            writer.write_row(dLevelInfoRow)
+        else:
+            LogAdvancedInfoFailure(row, Argument)
+            writer.write_failure(row)
+
+@pipelineMetrics.stage('BuildAndSaveAdvancedDLevelInfo')
+def BuildAndSaveAdvancedDLevelInfo(Dlevel_Advanced_info,Dlevel_Failed_Info,maxWorkers=None,checkpoint=None,batchSize=None):
     global dropboxClient
     nseEquityData = BuildAndSaveDLevelBasicInfo()
     
@@ -242,78 +468,151 @@ def BuildAndSaveAdvancedDLevelInfo(Dlevel_Advanced_info,Dlevel_Failed_Info):
         logging.debug("DLevel Basic Info not available, Check if 02.MASTER_EQUITY_L_W_DLEVEL_INFO.CSV Exists and Contains the data")
         return
     
-    csv_columns = ["DATENUM","DATE", "SYMBOL", "NAME", "SECTOR", "CMP", "VALUATION", "FAIRRANGE", "PE", "SECTORPE", "MARKETCAP", "MKCAPTYPE", "TREND", "FUNDAMENTAL", "MOMENTUM", "DERATIO", "PRICETOSALES", "PLEDGE", "QBS", "QBS%", "AGS", "AGS%", "VALUATION_DCF", "VALUATION_GRAHAM", "VALUATION_EARNING", "VALUATION_BOOKVALUE", "VALUATION_SALES"]
-    
-    dLevelInfo = []
-    dLevelInfoFailure = []
+    rowsWritten = 0
+    failureCount = 0
 
-    # Fetch advanced stock information
-    for row in nseEquityData:
-        try:
-            print("Processing Advanced Data for :" + row["SYMBOL"])
-            logging.debug("Processing Advanced Data for :" + row["SYMBOL"])
-            dLevelInfoRow = GetStockAdvancedInfoFromDLevels1(row)
-            if dLevelInfoRow != None:
-                dLevelInfo.append(dLevelInfoRow)
-            else:
-                dLevelInfoFailure.append(row)
-                print("Unable to Get Advance Stock Info for Symbol:" + row["SYMBOL"])
-                logging.debug("Unable to Get Advance Stock Info for Symbol:" + row["SYMBOL"])
-        except Exception as Argument:
-            dLevelInfoFailure.append(row)
-            print("Some Exception while fetching the Advanced Info for :" + row["SYMBOL"])
-            logging.debug("Some Exception while fetching the Advanced Info for :" + row["SYMBOL"])
-            print("Exception: " + str(Argument))
-            logging.debug("Exception: " + str(Argument))
-    
-    # Writing advanced stock info to CSV
+    # When checkpointing, the Advanced Info CSV of the run doubles as its journal: only the Symbols which are
+    # not in it yet are fetched and new rows are appended to it.
+    pendingData = nseEquityData
+    if checkpoint is not None:
+        pendingData = checkpoint.pending(nseEquityData)
+        rowsWritten = len(nseEquityData) - len(pendingData)
+    appendToExisting = checkpoint is not None and exists(Dlevel_Advanced_info) and os.path.getsize(Dlevel_Advanced_info) > 0
+    # A resumed run keeps the DATENUM/DATE it was started with, even when it is resumed on the next day.
+    runColumns = (checkpoint.run_columns() if checkpoint is not None else None) or RunDateColumns()
+
+    # Fetch advanced stock information using a bounded Thread Pool and stream every row straight into the CSV.
+    # Each row is flushed and synced to disk as it is written, so the file can be tailed while the run is in
+    # progress and an interrupted run loses at most the row being written.
+    maxWorkers = maxWorkers or DLEVEL_MAX_WORKERS
+    batchSize = max(1, batchSize or DLEVEL_BATCH_SIZE)
+    logging.debug("Fetching Advanced Info for " + str(len(pendingData)) + " Symbols using " + str(maxWorkers) + " Workers in batches of " + str(batchSize))
+    writer = AdvancedInfoWriter(Dlevel_Advanced_info, Dlevel_Failed_Info, append=appendToExisting)
     try:
-        if len(dLevelInfo) > 0:
-            with open(Dlevel_Advanced_info, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=csv_columns)
-                writer.writeheader()
-                for data in dLevelInfo:
-                    writer.writerow(data)
-            logging.debug("DLevelAdvancedInfo has been Written to: " + Dlevel_Advanced_info)
+        with writer:
+            WriteAdvancedInfoResults(writer, IterAdvancedDLevelInfo(pendingData, maxWorkers, batchSize, runColumns))
+        logging.debug("DLevelAdvancedInfo has been Written to: " + Dlevel_Advanced_info)
+    except IOError:
+        logging.debug("I/O error while writing to " + Dlevel_Advanced_info)
+    rowsWritten += writer.rows_written
+    failureCount = writer.failures
+
+    if checkpoint is not None:
+        if appendToExisting:
+            # The rows of the resumed run were appended after the earlier ones, restore the Symbol order.
+            checkpoint.sort_journal(nseEquityData)
+        checkpoint.mark_complete(failureCount)
 
-            # Uploading the generated CSV to Dropbox
-            dropbox_path = f"/NSEBSEBhavcopy/ValueStocks/{Dlevel_Advanced_info}"  # Adjust the Dropbox folder path as needed
+    # Handle failures (if any) for logging purposes
+    if failureCount == 0 and exists(Dlevel_Failed_Info):
+        # A resumed run has fetched all the Symbols which failed earlier.
+        os.remove(Dlevel_Failed_Info)
+        logging.debug("Removed Dlevel_Failed_Info since there are no more failures: " + Dlevel_Failed_Info)
+
+    if rowsWritten > 0:
+        with pipelineMetrics.stage('ArchiveAdvancedInfoSnapshot'):
+            ArchiveAdvancedInfoSnapshot(Dlevel_Advanced_info, VS_SNAPSHOT_FORMAT, VS_SNAPSHOT_DATASET)
+
+        # Uploading the generated CSV to Dropbox
+        dropbox_path = f"/NSEBSEBhavcopy/ValueStocks/{Dlevel_Advanced_info}"  # Adjust the Dropbox folder path as needed
+        with pipelineMetrics.stage('DropboxUpload'):
             dropboxClient.upload_file(Dlevel_Advanced_info, dropbox_path)
+    else:
+        logging.debug("No data to write for Advanced Info CSV")
+
+@pipelineMetrics.stage('BuildAndSaveAdvancedDLevelDelta')
+def BuildAndSaveAdvancedDLevelDelta(Dlevel_Advanced_Delta,Dlevel_Advanced_info,Dlevel_Failed_Info,maxWorkers=None,batchSize=None):
+    '''
+    Delta variant of BuildAndSaveAdvancedDLevelInfo. Fetches the fundamentals of the symbols which are due for a refresh,
+    applies the bhavcopy close price to the last row of all the others and writes only the rows which changed to
+    Dlevel_Advanced_Delta. The full snapshot of the run is written to VS_DELTA_SNAPSHOT_FILE and uploaded as
+    Dlevel_Advanced_info. Returns the path of the full snapshot, or None when there is no DLevel Basic Info.
+    '''
+    global dropboxClient
+    nseEquityData = BuildAndSaveDLevelBasicInfo()
+    if not nseEquityData:
+        print("DLevel Basic Info not available, Check if 02.MASTER_EQUITY_L_W_DLEVEL_INFO.CSV Exists and Contains the data")
+        logging.debug("DLevel Basic Info not available, Check if 02.MASTER_EQUITY_L_W_DLEVEL_INFO.CSV Exists and Contains the data")
+        return None
 
+    runColumns = RunDateColumns()
+    state = AdvancedInfoState(VS_DELTA_STATE_FILE, VS_DELTA_REFRESH_DAYS, VS_DELTA_PRICE_CHANGE_THRESHOLD)
+    closePrices = GetNseClosePrices()
+    refreshData = []
+    priceOnlyData = []
+    refreshReasons = {}
+    for row in nseEquityData:
+        reason = state.refresh_reason(row["SYMBOL"], closePrices.get(row["SYMBOL"]), runColumns["DATENUM"])
+        if reason is None:
+            priceOnlyData.append(row)
         else:
-            logging.debug("No data to write for Advanced Info CSV")
+            refreshData.append(row)
+            refreshReasons[reason] = refreshReasons.get(reason, 0) + 1
+    print("Delta run: refreshing the fundamentals of " + str(len(refreshData)) + " Symbols " + str(refreshReasons)
+          + ", updating the price of " + str(len(priceOnlyData)) + " Symbols")
+    logging.info("Delta run: refreshing the fundamentals of " + str(len(refreshData)) + " Symbols " + str(refreshReasons)
+                 + ", updating the price of " + str(len(priceOnlyData)) + " Symbols")
 
-    except IOError:
-        logging.debug("I/O error while writing to " + Dlevel_Advanced_info)
+    maxWorkers = maxWorkers or DLEVEL_MAX_WORKERS
+    batchSize = max(1, batchSize or DLEVEL_BATCH_SIZE)
+    # The delta CSV is rebuilt from the state by a rerun, so its rows are not synced one by one.
+    with AdvancedInfoWriter(Dlevel_Advanced_Delta, Dlevel_Failed_Info, sync=False) as writer:
+        for row, dLevelInfoRow, Argument in IterAdvancedDLevelInfo(refreshData, maxWorkers, batchSize, runColumns):
+            refreshed = dLevelInfoRow is not None
+            if not refreshed:
+                LogAdvancedInfoFailure(row, Argument)
+                writer.write_failure(row)
+                # Keep the price of a known Symbol current, its fundamentals are retried by the next run.
+                if state.row(row["SYMBOL"]) is None or row["SYMBOL"] not in closePrices:
+                    continue
+                dLevelInfoRow = ApplyClosePrice(state.row(row["SYMBOL"]), closePrices[row["SYMBOL"]], runColumns)
+            if state.update(dLevelInfoRow, refreshed):
+                writer.write_row(dLevelInfoRow)
+        for row in priceOnlyData:
+            dLevelInfoRow = ApplyClosePrice(state.row(row["SYMBOL"]), closePrices[row["SYMBOL"]], runColumns)
+            if state.update(dLevelInfoRow, False):
+                writer.write_row(dLevelInfoRow)
+    rowsWritten = writer.rows_written
+    failureCount = writer.failures
+    logging.debug("DLevelAdvancedInfo Delta of " + str(rowsWritten) + " rows has been Written to: " + Dlevel_Advanced_Delta)
+    pipelineMetrics.set_info('delta', {'refreshed': len(refreshData), 'refresh_reasons': refreshReasons,
+                                       'price_only': len(priceOnlyData), 'changed_rows': rowsWritten, 'failures': failureCount})
 
-    # Handle failures (if any) for logging purposes
-    try:
-        if len(dLevelInfoFailure) > 0:
-            with open(Dlevel_Failed_Info, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=["SYMBOL", "NAME", "DLEVEL_KEY"])
-                writer.writeheader()
-                for data in dLevelInfoFailure:
-                    writer.writerow(data)
-            logging.debug("Dlevel_Failed_Info has been Written to: " + Dlevel_Failed_Info)
-    except IOError:
-        logging.debug("I/O error while writing to " + Dlevel_Failed_Info)
+    snapshotRows = state.write_snapshot(VS_DELTA_SNAPSHOT_FILE, [row["SYMBOL"] for row in nseEquityData], runColumns)
+    print("Full snapshot of " + str(snapshotRows) + " Symbols written to : " + VS_DELTA_SNAPSHOT_FILE)
+    logging.info("Full snapshot of " + str(snapshotRows) + " Symbols written to : " + VS_DELTA_SNAPSHOT_FILE)
+    if snapshotRows > 0:
+        with pipelineMetrics.stage('ArchiveAdvancedInfoSnapshot'):
+            ArchiveAdvancedInfoSnapshot(VS_DELTA_SNAPSHOT_FILE, VS_SNAPSHOT_FORMAT, VS_SNAPSHOT_DATASET)
+
+    published = True
+    with pipelineMetrics.stage('DropboxUpload'):
+        if rowsWritten > 0:
+            dropbox_path = f"/NSEBSEBhavcopy/ValueStocks/{Dlevel_Advanced_Delta}"  # Adjust the Dropbox folder path as needed
+            published = dropboxClient.upload_file(Dlevel_Advanced_Delta, dropbox_path)
+        else:
+            logging.debug("No changed rows in the Advanced Info Delta")
+        if published and snapshotRows > 0:
+            # Consumers of the full CSV keep finding one per run.
+            published = dropboxClient.upload_file(VS_DELTA_SNAPSHOT_FILE, f"/NSEBSEBhavcopy/ValueStocks/{Dlevel_Advanced_info}")
+
+    # The state is the baseline of the next delta, it only moves on once this run's changes are published.
+    if published:
+        state.save()
+    else:
+        print("The delta run could not be published, its changes are written again by the next run.")
+        logging.error("The delta run could not be published, the delta state is not saved: " + VS_DELTA_STATE_FILE)
+    return VS_DELTA_SNAPSHOT_FILE
 
 
+@pipelineMetrics.stage('GenerateAmibrokerTlsForFundamentals')
 def GenerateAmibrokerTlsForFundamentals(file_path):
     print("Starting the process of generating Amibroker TLS files.")
     logging.info("Starting the process of generating Amibroker TLS files.")
     
-    # Define the column names based on the provided CSV structure
-    column_names = [
-        'DATE','SYMBOL', 'NAME', 'SECTOR', 'CMP', 'VALUATION', 'FAIRRANGE', 'PE', 'SECTORPE',
-        'MARKETCAP', 'MKCAPTYPE', 'TREND', 'FUNDAMENTAL', 'MOMENTUM', 'DERATIO', 
-        'PRICETOSALES', 'PLEDGE', 'QBS', 'QBS%', 'AGS', 'AGS%', 'VALUATION_DCF', 
-        'VALUATION_GRAHAM', 'VALUATION_EARNING', 'VALUATION_BOOKVALUE', 'VALUATION_SALES'
-    ]
-    
     try:
-        # Read the CSV file into a DataFrame
-        df = pd.read_csv(file_path, names=column_names, header=None)
+        # Read the CSV file into a typed DataFrame, so the screens compare numbers and categories
+        df = LoadAdvancedInfoCsv(file_path)
         print(f"Successfully read the CSV file: {file_path}")
         logging.info(f"Successfully read the CSV file: {file_path}")
     except Exception as e:
@@ -321,45 +620,34 @@ def GenerateAmibrokerTlsForFundamentals(file_path):
         logging.error(f"Error reading the CSV file: {file_path}. Exception: {e}")
         return
     
-    # Dictionary to map FUNDAMENTAL values to output filenames
-    fundamentals_to_files = {
-        "Good Financials": "Good Fundamentals.tls",
-        "Great Financials": "Great Fundamentals.tls",
-        "Moderate Financials": "Moderate Fundamentals.tls",
-        "Poor Financials": "Poor Fundamentals.tls"
-    }
-    
-    # Iterate over each fundamental type and write corresponding SYMBOL column to file
-    for fundamental, output_file in fundamentals_to_files.items():
+    # Evaluate every screen in one pass over the snapshot, then write one watchlist per screen.
+    screens = LoadWatchlistScreens(VS_WATCHLIST_SCREENS_FILE)
+    masks = EvaluateScreens(df, screens)
+    symbols = df['SYMBOL'].to_numpy()
+    contents = {}
+    for name, mask in masks.items():
+        output_file = name if name.lower().endswith('.tls') else name + '.tls'
         try:
-            filtered_df = df[df['FUNDAMENTAL'] == fundamental]
-            
-            # Extract the SYMBOL column and save to a .tls file
-            filtered_df[['SYMBOL']].to_csv(output_file, index=False, header=False)
-            print(f"Wrote {len(filtered_df)} symbols to {output_file}")
-            logging.info(f"Wrote {len(filtered_df)} symbols to {output_file}")
-            dropbox_path = f"/NSEBSEBhavcopy/Amibroker_Watchlists/{output_file}"  # Adjust the Dropbox folder path as needed
-            dropboxClient.upload_file(output_file, dropbox_path)
-            print(f'{output_file} Uploaded to Dropbox at : {dropbox_path}')
-            logging.info(f'{output_file} Uploaded to Dropbox at : {dropbox_path}')
+            content = "".join(str(symbol) + os.linesep for symbol in symbols[mask]).encode()
+            with open(output_file, 'wb') as file:
+                file.write(content)
+            print(f"Wrote {int(mask.sum())} symbols to {output_file}")
+            logging.info(f"Wrote {int(mask.sum())} symbols to {output_file}")
+            contents[f"/NSEBSEBhavcopy/Amibroker_Watchlists/{output_file}"] = content  # Adjust the Dropbox folder path as needed
         except Exception as e:
             print(f"Error writing to file: {output_file}. Exception: {e}")
             logging.error(f"Error writing to file: {output_file}. Exception: {e}")
-    
-    # Create the "Great and Good Fundamentals" file
+
+    # Upload the watchlists concurrently, those which are unchanged in Dropbox are skipped.
     try:
-        output_file="Great and Good Fundamentals.tls"
-        great_and_good_df = df[df['FUNDAMENTAL'].isin(['Good Financials', 'Great Financials'])]
-        great_and_good_df[['SYMBOL']].to_csv(output_file, index=False, header=False)
-        print(f"Wrote {len(great_and_good_df)} symbols to {output_file}")
-        logging.info(f"Wrote {len(great_and_good_df)} symbols to {output_file}")
-        dropbox_path = f"/NSEBSEBhavcopy/Amibroker_Watchlists/{output_file}"  # Adjust the Dropbox folder path as needed
-        dropboxClient.upload_file(output_file, dropbox_path)
-        print(f'{output_file} Uploaded to Dropbox at : {dropbox_path}')
-        logging.info(f'{output_file} Uploaded to Dropbox at : {dropbox_path}')
+        with pipelineMetrics.stage('DropboxUpload'):
+            uploadResults = dropboxClient.upload_contents_if_changed(contents)
+        for dropbox_path, result in uploadResults.items():
+            print(f'{os.path.basename(dropbox_path)} {result} at Dropbox : {dropbox_path}')
+            logging.info(f'{os.path.basename(dropbox_path)} {result} at Dropbox : {dropbox_path}')
     except Exception as e:
-        print(f"Error writing to Great and Good Fundamentals.tls. Exception: {e}")
-        logging.error(f"Error writing to Great and Good Fundamentals.tls. Exception: {e}")
+        print(f"Error uploading the watchlists to Dropbox. Exception: {e}")
+        logging.error(f"Error uploading the watchlists to Dropbox. Exception: {e}")
     
     print("Files created successfully.")
     logging.info("Process completed successfully.")
@@ -369,16 +657,63 @@ def GenerateAmibrokerTlsForFundamentals(file_path):
     
 #row={"SYMBOL":"LTIM","NAME":"LTIMindtree Limited","DLEVEL_KEY":"lti_is_equity"}
 #GetStockAdvancedInfoFromDLevels1(row)
-global dropboxClient
-dropboxClient=DropboxClient()
-session = requests.Session()
-#BuildAndSaveDLevelBasicInfo()
-now = datetime.datetime.now()
-Dlevel_Advanced_info = now.strftime("%Y%m%d-%H%M%S") + '-3.DLEVEL_ADVANCED_INFO.CSV'
-Dlevel_Failed_Info = now.strftime("%Y%m%d-%H%M%S") + "-3.DLEVEL_ADVANCED_INFO_FAILURE.CSV"
-BuildAndSaveAdvancedDLevelInfo(Dlevel_Advanced_info,Dlevel_Failed_Info)
-
-# Test Code Below to download the File From DropBox and Build Amibroker TLS
-#dropboxClient.download_file("/NSEBSEBhavCopy/ValueStocks/20250104-193904-3.DLEVEL_ADVANCED_INFO.CSV")
-#Dlevel_Advanced_info="20250104-193904-3.DLEVEL_ADVANCED_INFO.CSV"
-GenerateAmibrokerTlsForFundamentals(Dlevel_Advanced_info)
+def StartPipelineRun(dropbox_client=None):
+    '''
+    Reset the state of the previous run and create the Dropbox client, the HTTP response cache and the HTTP session
+    shared by the stages of a run.
+
+    :param dropbox_client: Optional. The DropboxClient to use, one configured from the environment is created by default.
+    '''
+    global dropboxClient, httpCache, session
+    pipelineMetrics.reset()
+    dlevelBatchUnsupported.clear()
+    dropboxClient=dropbox_client or DropboxClient(metrics=pipelineMetrics)
+    httpCache = ResponseCache(HTTP_CACHE_FILE, HTTP_CACHE_TTL_RULES, max_size_bytes=HTTP_CACHE_MAX_SIZE_BYTES)
+    session = CreateHttpSession(CachingAdapter, (httpCache, dlevelsRateLimiter), pool_size=DLEVEL_MAX_WORKERS, connect_timeout=HTTP_CONNECT_TIMEOUT,
+                                read_timeout=HTTP_READ_TIMEOUT, max_retries=HTTP_MAX_RETRIES,
+                                backoff_factor=HTTP_BACKOFF_FACTOR, backoff_jitter=HTTP_BACKOFF_JITTER, metrics=pipelineMetrics)
+
+def FinishPipelineRun():
+    # Record the cache and token statistics and write the metrics of the run.
+    logging.info("HTTP Cache Statistics: " + str(httpCache.stats()))
+    pipelineMetrics.set_info('http_cache', httpCache.stats())
+    pipelineMetrics.set_info('dropbox_tokens', dropboxClient.get_token_stats())
+    pipelineMetrics.write_json(PIPELINE_METRICS_FILE)
+    if PIPELINE_METRICS_PROM_FILE:
+        pipelineMetrics.write_prometheus(PIPELINE_METRICS_PROM_FILE)
+
+def RunValueStocksPipeline(dropbox_client=None):
+    '''
+    Run the nightly pipeline: build (or resume) the Advanced Info CSV, upload it and generate the Amibroker watchlists.
+    Returns the name of the Advanced Info CSV of the run, in delta mode (VS_DELTA_MODE) the name of the delta CSV.
+
+    :param dropbox_client: Optional. The DropboxClient to use, one configured from the environment is created by default.
+    '''
+    StartPipelineRun(dropbox_client)
+    #BuildAndSaveDLevelBasicInfo()
+    now = datetime.datetime.now()
+    Dlevel_Advanced_info = now.strftime("%Y%m%d-%H%M%S") + '-3.DLEVEL_ADVANCED_INFO.CSV'
+    Dlevel_Failed_Info = now.strftime("%Y%m%d-%H%M%S") + "-3.DLEVEL_ADVANCED_INFO_FAILURE.CSV"
+    if VS_DELTA_MODE:
+        # Only the changed rows are written to the delta CSV, the watchlists are built from the full snapshot.
+        Dlevel_Advanced_Delta = now.strftime("%Y%m%d-%H%M%S") + '-3.DLEVEL_ADVANCED_INFO_DELTA.CSV'
+        pipelineMetrics.run_name = Dlevel_Advanced_Delta
+        snapshot_file = BuildAndSaveAdvancedDLevelDelta(Dlevel_Advanced_Delta,Dlevel_Advanced_info,Dlevel_Failed_Info)
+        if snapshot_file is not None:
+            GenerateAmibrokerTlsForFundamentals(snapshot_file)
+        Dlevel_Advanced_info = Dlevel_Advanced_Delta
+    else:
+        runCheckpoint = RunCheckpoint(DLEVEL_RUNSTATE_FILE, DLEVEL_RESUME_MAX_AGE_HOURS)
+        Dlevel_Advanced_info, Dlevel_Failed_Info = runCheckpoint.start_or_resume(Dlevel_Advanced_info, Dlevel_Failed_Info, RunDateColumns(now))
+        pipelineMetrics.run_name = Dlevel_Advanced_info
+        BuildAndSaveAdvancedDLevelInfo(Dlevel_Advanced_info,Dlevel_Failed_Info,checkpoint=runCheckpoint)
+
+        # Test Code Below to download the File From DropBox and Build Amibroker TLS
+        #dropboxClient.download_file("/NSEBSEBhavCopy/ValueStocks/20250104-193904-3.DLEVEL_ADVANCED_INFO.CSV")
+        #Dlevel_Advanced_info="20250104-193904-3.DLEVEL_ADVANCED_INFO.CSV"
+        GenerateAmibrokerTlsForFundamentals(Dlevel_Advanced_info)
+    FinishPipelineRun()
+    return Dlevel_Advanced_info
+
+if __name__ == '__main__':
+    RunValueStocksPipeline()
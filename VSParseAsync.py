@@ -0,0 +1,330 @@
+'''
+asyncio variant of the VSParse run. The stages run concurrently and are connected by bounded queues:
+
+    DLEVEL_KEY resolution -> batching -> Fundamental Report fetch -> CSV writer
+
+A symbol's Fundamental Report is requested as soon as its DLEVEL_KEY is resolved and rows are written while later
+symbols are still being resolved, so these stages take about as long as the slowest of them rather than their sum.
+The dlevels endpoints are requested with aiohttp (see AsyncHttpClient.AsyncHttpSession) through the same response
+cache, rate limiter and metrics as VSParse, and the URLs, responses and CSV rows are built by the same helpers.
+
+The columnar archive, the Dropbox upload of the CSV and the watchlist generation and upload need the complete CSV,
+so they start only once the stages above are finished. They then run side by side, the blocking Dropbox and pandas
+calls in threads.
+
+The configuration is read from the same environment variables as VSParse. Delta mode (VS_DELTA_MODE) is run by the
+threaded VSParse pipeline.
+
+Example:
+    python VSParseAsync.py
+'''
+import asyncio
+import datetime
+import logging
+import os
+from os.path import exists
+
+import VSParse
+from AsyncHttpClient import AsyncHttpSession
+from AdvancedInfoSchema import RunDateColumns, TransformAdvancedInfoRow
+from AdvancedInfoWriter import AdvancedInfoWriter
+from RunCheckpoint import RunCheckpoint
+from SnapshotArchive import ArchiveAdvancedInfoSnapshot
+from VSParse import (DLEVEL_MAX_WORKERS, DLEVEL_MAX_ATTEMPTS, DLEVEL_SYMBOL_LIMIT, DLEVEL_BATCH_SIZE,
+                     HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT,
+                     HTTP_MAX_RETRIES, HTTP_BACKOFF_FACTOR, HTTP_BACKOFF_JITTER, DLEVEL_RUNSTATE_FILE,
+                     DLEVEL_RESUME_MAX_AGE_HOURS, VS_SNAPSHOT_FORMAT, VS_SNAPSHOT_DATASET, VS_DELTA_MODE,
+                     MASTER_EQUITY_L_W_DLEVEL_INFO, dlevelsRateLimiter, dlevelBatchUnsupported, pipelineMetrics,
+                     StockInfoUrl, ParseStockInfo, FundamentalReportsUrl, ParseFundamentalReports,
+                     DemultiplexFundamentalReports, WriteAdvancedInfoResults)
+
+# Capacity (in rows) of the queues between the stages. A full queue holds back the stage feeding it, so a slow
+# stage does not pile up the output of the faster ones in memory.
+VS_ASYNC_QUEUE_SIZE = int(os.getenv('VS_ASYNC_QUEUE_SIZE', '200'))
+# Seconds a partly filled Fundamental Report batch waits for more resolved symbols before it is sent anyway.
+VS_ASYNC_BATCH_LINGER_SECONDS = float(os.getenv('VS_ASYNC_BATCH_LINGER_SECONDS', '0.2'))
+
+# Marks the end of the rows on a queue.
+_END = None
+
+
+async def RunStages(*coroutines):
+    # Run the stages concurrently. When one of them fails the others are cancelled, so none is left waiting on a queue.
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def GetWithThrottleRetriesAsync(http, url, label=None):
+    # Async port of VSParse.GetWithThrottleRetries.
+    for attempt in range(DLEVEL_MAX_ATTEMPTS):
+        response = await http.get(url)
+        if not response.throttled:
+            break
+        logging.debug("Throttled Response "+str(response.status_code)+" for "+(label or url)+". Attempt "+str(attempt+1)+" of "+str(DLEVEL_MAX_ATTEMPTS))
+    return response
+
+
+async def GetStockInfoFromDLevelsAsync(http, NseMasterRow):
+    # Async port of VSParse.GetStockInfoFromDLevels, the url is the same so both share the cached lookups.
+    response = await GetWithThrottleRetriesAsync(http, StockInfoUrl(NseMasterRow["SYMBOL"]), NseMasterRow["SYMBOL"])
+    return ParseStockInfo(NseMasterRow, response)
+
+
+async def ResolveDLevelInfoStage(http, checkpoint, resolvedQueue):
+    '''
+    Stage 1. Put the DLevel Basic Info rows of the symbols which are not journaled yet on resolvedQueue. They are read
+    from MASTER_EQUITY_L_W_DLEVEL_INFO when it exists, otherwise the NSE symbols are resolved by DLEVEL_MAX_WORKERS
+    concurrent lookups and every row is passed on as soon as it is resolved. The file is written once all are resolved.
+    '''
+    completed = await asyncio.to_thread(checkpoint.completed_symbols)
+    try:
+        with pipelineMetrics.stage('BuildAndSaveDLevelBasicInfo'):
+            nseEquityData = await asyncio.to_thread(VSParse.GetNseEquityData)
+            if DLEVEL_SYMBOL_LIMIT > 0:
+                nseEquityData = nseEquityData[:DLEVEL_SYMBOL_LIMIT]
+            if exists(MASTER_EQUITY_L_W_DLEVEL_INFO):
+                print("DLevelBasicInfo File : "+MASTER_EQUITY_L_W_DLEVEL_INFO + " Found.")
+                for row in VSParse.ReadDLevelBasicInfo():
+                    if row["SYMBOL"] not in completed:
+                        await resolvedQueue.put(row)
+                return
+
+            print("DLevelBasicInfo File : "+MASTER_EQUITY_L_W_DLEVEL_INFO + " Not Found. Hence Building...")
+            eligibleData = VSParse.EligibleNseEquityData(nseEquityData)
+            logging.debug("Total Symbols to Process : "+str(len(eligibleData)))
+            pending = iter(enumerate(eligibleData))
+            dLevelInfo = {}
+
+            async def ResolveWorker():
+                # The workers share one iterator, every symbol is looked up exactly once.
+                for index, row in pending:
+                    try:
+                        logging.debug("Getting StockInfo from DLevel for :"+row["SYMBOL"])
+                        dLevelInfoRow = await GetStockInfoFromDLevelsAsync(http, row)
+                    except Exception as Argument:
+                        logging.debug("Exception While getting StockInfo from DLevel for "+str(row["SYMBOL"])+". Exception="+str(Argument))
+                        continue
+                    if dLevelInfoRow is not None:
+                        dLevelInfo[index] = dLevelInfoRow
+                        if dLevelInfoRow["SYMBOL"] not in completed:
+                            await resolvedQueue.put(dLevelInfoRow)
+
+            await RunStages(*(ResolveWorker() for _ in range(DLEVEL_MAX_WORKERS)))
+            logging.debug("Symbols Processed : "+str(len(eligibleData)))
+            # Written in the order of the NSE master list, like the threaded pipeline does.
+            await asyncio.to_thread(VSParse.SaveDLevelBasicInfo, [dLevelInfo[index] for index in sorted(dLevelInfo)])
+    finally:
+        await resolvedQueue.put(_END)
+
+
+async def BatchStage(resolvedQueue, batchQueue, batchSize, fetchWorkers, batchFetched):
+    '''
+    Stage 2. Group the resolved rows into Fundamental Report batches of batchSize. A partly filled batch is sent
+    after VS_ASYNC_BATCH_LINGER_SECONDS without a new row, so a slow resolution does not hold back the fetches.
+    Like VSParse.IterAdvancedDLevelInfo, the first batch of several symbols goes out alone (until batchFetched is
+    set), so an endpoint without list support is detected before more batches are sent.
+    '''
+    batch = []
+    probing = batchSize > 1
+    done = False
+    while not done:
+        lingered = False
+        try:
+            row = await asyncio.wait_for(resolvedQueue.get(), VS_ASYNC_BATCH_LINGER_SECONDS if batch else None)
+            if row is _END:
+                done = True
+            else:
+                batch.append(row)
+        except asyncio.TimeoutError:
+            lingered = True
+        if batch and (done or lingered or len(batch) >= batchSize):
+            await batchQueue.put(batch)
+            if probing and len(batch) > 1:
+                probing = False
+                await batchFetched.wait()
+            batch = []
+    for _ in range(fetchWorkers):
+        await batchQueue.put(_END)
+
+
+async def FetchFundamentalReportsAsync(http, dLevelKeys):
+    # Async port of VSParse.FetchFundamentalReports.
+    url = FundamentalReportsUrl(dLevelKeys)
+    logging.debug("Fetching Advanced Info using url:"+url)
+    return ParseFundamentalReports(await GetWithThrottleRetriesAsync(http, url))
+
+
+async def FetchAdvancedDLevelInfoAsync(http, row, runColumns):
+    # Async port of VSParse.FetchAdvancedDLevelInfo, returns (row, dLevelInfoRow or None, Exception or None).
+    try:
+        print("Processing Advanced Data for :" + row["SYMBOL"])
+        logging.debug("Processing Advanced Data for :" + row["SYMBOL"])
+        record = dict(row)
+        reports = await FetchFundamentalReportsAsync(http, [row["DLEVEL_KEY"]])
+        if reports:
+            record.update(reports[0])
+        return row, TransformAdvancedInfoRow(record, runColumns), None
+    except Exception as Argument:
+        return row, None, Argument
+
+
+async def FetchAdvancedDLevelInfoBatchAsync(http, rows, runColumns):
+    # Async port of VSParse.FetchAdvancedDLevelInfoBatch, the rows missing from the batched response are refetched concurrently.
+    if len(rows) == 1 or dlevelBatchUnsupported.is_set():
+        return await asyncio.gather(*(FetchAdvancedDLevelInfoAsync(http, row, runColumns) for row in rows))
+
+    try:
+        url = FundamentalReportsUrl([row["DLEVEL_KEY"] for row in rows])
+        logging.debug("Fetching Advanced Info of "+str(len(rows))+" Symbols using url:"+url)
+        results = DemultiplexFundamentalReports(rows, await GetWithThrottleRetriesAsync(http, url), runColumns)
+    except Exception as Argument:
+        logging.debug("Exception while fetching a batch of "+str(len(rows))+" Fundamental Reports. Exception="+str(Argument))
+        results = [(row, None) for row in rows]
+    refetched = await asyncio.gather(*(FetchAdvancedDLevelInfoAsync(http, row, runColumns)
+                                       for row, dLevelInfoRow in results if dLevelInfoRow is None))
+    refetched = iter(refetched)
+    batchResults = []
+    for row, dLevelInfoRow in results:
+        if dLevelInfoRow is None:
+            batchResults.append(next(refetched))
+        else:
+            print("Processing Advanced Data for :" + row["SYMBOL"])
+            logging.debug("Processing Advanced Data for :" + row["SYMBOL"] + " from a batched response")
+            batchResults.append((row, dLevelInfoRow, None))
+    return batchResults
+
+
+async def FetchStage(http, batchQueue, resultQueue, runColumns, batchFetched):
+    # Stage 3, run by DLEVEL_MAX_WORKERS tasks. Fetch the batches and pass every (row, dLevelInfoRow, Exception) on.
+    try:
+        while True:
+            rows = await batchQueue.get()
+            if rows is _END:
+                break
+            results = await FetchAdvancedDLevelInfoBatchAsync(http, rows, runColumns)
+            batchFetched.set()
+            for result in results:
+                await resultQueue.put(result)
+    finally:
+        await resultQueue.put(_END)
+
+
+async def WriteStage(resultQueue, fetchWorkers, Dlevel_Advanced_info, Dlevel_Failed_Info, appendToExisting):
+    '''
+    Stage 4. Stream the rows into the Advanced Info CSV (the journal of the run) and the failures into
+    Dlevel_Failed_Info with VSParse.WriteAdvancedInfoResults, in the order they are fetched. The rows waiting on
+    resultQueue are written together in a thread and synced to disk once per batch, so the writes never block the
+    fetches on the event loop. Returns (rows written, failures).
+    '''
+    def WriteBatch(writer, results):
+        WriteAdvancedInfoResults(writer, results)
+        writer.fsync()
+
+    finishedWorkers = 0
+    with AdvancedInfoWriter(Dlevel_Advanced_info, Dlevel_Failed_Info, append=appendToExisting, sync=False) as writer:
+        while finishedWorkers < fetchWorkers:
+            results = []
+            result = await resultQueue.get()
+            while True:
+                if result is _END:
+                    finishedWorkers += 1
+                else:
+                    results.append(result)
+                if resultQueue.empty():
+                    break
+                result = resultQueue.get_nowait()
+            if results:
+                await asyncio.to_thread(WriteBatch, writer, results)
+    logging.debug("DLevelAdvancedInfo has been Written to: " + Dlevel_Advanced_info)
+    return writer.rows_written, writer.failures
+
+
+async def PublishAdvancedDLevelInfo(Dlevel_Advanced_info):
+    # Stage 5. The archive, the upload of the CSV and the watchlists only need the complete CSV, so they run side by side.
+    def Archive():
+        with pipelineMetrics.stage('ArchiveAdvancedInfoSnapshot'):
+            ArchiveAdvancedInfoSnapshot(Dlevel_Advanced_info, VS_SNAPSHOT_FORMAT, VS_SNAPSHOT_DATASET)
+
+    def Upload():
+        dropbox_path = f"/NSEBSEBhavcopy/ValueStocks/{Dlevel_Advanced_info}"  # Adjust the Dropbox folder path as needed
+        with pipelineMetrics.stage('DropboxUpload'):
+            VSParse.dropboxClient.upload_file(Dlevel_Advanced_info, dropbox_path)
+
+    await RunStages(asyncio.to_thread(Archive), asyncio.to_thread(Upload),
+                    asyncio.to_thread(VSParse.GenerateAmibrokerTlsForFundamentals, Dlevel_Advanced_info))
+
+
+async def BuildAndSaveAdvancedDLevelInfoAsync(Dlevel_Advanced_info, Dlevel_Failed_Info, checkpoint, maxWorkers=None, batchSize=None):
+    '''
+    Async counterpart of VSParse.BuildAndSaveAdvancedDLevelInfo followed by GenerateAmibrokerTlsForFundamentals, with
+    the resolution, fetch and write stages overlapping. Returns the number of rows written to Dlevel_Advanced_info.
+    '''
+    maxWorkers = maxWorkers or DLEVEL_MAX_WORKERS
+    batchSize = max(1, batchSize or DLEVEL_BATCH_SIZE)
+    appendToExisting = exists(Dlevel_Advanced_info) and os.path.getsize(Dlevel_Advanced_info) > 0
+    # A resumed run keeps the DATENUM/DATE it was started with, even when it is resumed on the next day.
+    runColumns = checkpoint.run_columns() or RunDateColumns()
+    resolvedQueue = asyncio.Queue(VS_ASYNC_QUEUE_SIZE)
+    batchQueue = asyncio.Queue(max(1, VS_ASYNC_QUEUE_SIZE // batchSize))
+    resultQueue = asyncio.Queue(VS_ASYNC_QUEUE_SIZE)
+    batchFetched = asyncio.Event()
+    logging.debug("Fetching Advanced Info using " + str(maxWorkers) + " Workers in batches of " + str(batchSize) + " (async)")
+
+    async with AsyncHttpSession(VSParse.httpCache, dlevelsRateLimiter, pool_size=maxWorkers, connect_timeout=HTTP_CONNECT_TIMEOUT,
+                                read_timeout=HTTP_READ_TIMEOUT, max_retries=HTTP_MAX_RETRIES, backoff_factor=HTTP_BACKOFF_FACTOR,
+                                backoff_jitter=HTTP_BACKOFF_JITTER, metrics=pipelineMetrics) as http:
+        with pipelineMetrics.stage('BuildAndSaveAdvancedDLevelInfo'):
+            results = await RunStages(
+                ResolveDLevelInfoStage(http, checkpoint, resolvedQueue),
+                BatchStage(resolvedQueue, batchQueue, batchSize, maxWorkers, batchFetched),
+                WriteStage(resultQueue, maxWorkers, Dlevel_Advanced_info, Dlevel_Failed_Info, appendToExisting),
+                *(FetchStage(http, batchQueue, resultQueue, runColumns, batchFetched) for _ in range(maxWorkers)))
+    rowsWritten, failureCount = results[2]
+
+    if rowsWritten > 0 or appendToExisting:
+        # The rows are written in the order they are fetched, restore the Symbol order of the threaded pipeline.
+        await asyncio.to_thread(checkpoint.sort_journal, VSParse.ReadDLevelBasicInfo() or [])
+    checkpoint.mark_complete(failureCount)
+    if failureCount == 0 and exists(Dlevel_Failed_Info):
+        # A resumed run has fetched all the Symbols which failed earlier.
+        os.remove(Dlevel_Failed_Info)
+        logging.debug("Removed Dlevel_Failed_Info since there are no more failures: " + Dlevel_Failed_Info)
+
+    if rowsWritten > 0 or appendToExisting:
+        await PublishAdvancedDLevelInfo(Dlevel_Advanced_info)
+    else:
+        logging.debug("No data to write for Advanced Info CSV")
+    return rowsWritten
+
+
+async def RunValueStocksPipelineAsync(dropbox_client=None):
+    '''
+    Async counterpart of VSParse.RunValueStocksPipeline. Returns the name of the Advanced Info CSV of the run.
+
+    :param dropbox_client: Optional. The DropboxClient to use, one configured from the environment is created by default.
+    '''
+    if VS_DELTA_MODE:
+        print("Delta mode is run by the threaded pipeline.")
+        logging.info("Delta mode is run by the threaded pipeline.")
+        return await asyncio.to_thread(VSParse.RunValueStocksPipeline, dropbox_client)
+
+    VSParse.StartPipelineRun(dropbox_client)
+    now = datetime.datetime.now()
+    runCheckpoint = RunCheckpoint(DLEVEL_RUNSTATE_FILE, DLEVEL_RESUME_MAX_AGE_HOURS)
+    Dlevel_Advanced_info, Dlevel_Failed_Info = runCheckpoint.start_or_resume(
+        now.strftime("%Y%m%d-%H%M%S") + '-3.DLEVEL_ADVANCED_INFO.CSV', now.strftime("%Y%m%d-%H%M%S") + "-3.DLEVEL_ADVANCED_INFO_FAILURE.CSV",
+        RunDateColumns(now))
+    pipelineMetrics.run_name = Dlevel_Advanced_info
+    await BuildAndSaveAdvancedDLevelInfoAsync(Dlevel_Advanced_info, Dlevel_Failed_Info, runCheckpoint)
+    VSParse.FinishPipelineRun()
+    return Dlevel_Advanced_info
+
+
+if __name__ == '__main__':
+    asyncio.run(RunValueStocksPipelineAsync())
@@ -0,0 +1,267 @@
+import argparse
+import csv
+import json
+import logging
+import sqlite3
+
+from AdvancedInfoSchema import ADVANCED_INFO_COLUMNS
+from ValueStocksSchema import DAILY_CHANGES_INSERT, IMPORT_ROWS, MigrateValueStocksSchema
+
+logger = logging.getLogger('ValueStocksQueries')
+
+# The queries are constant strings with bound parameters, so sqlite3 prepares each of them once per connection
+# and reuses the statement from its cache afterwards.
+
+DAILY_CHANGES_DELETE = """
+    DELETE FROM VS_DAILY_CHANGES WHERE IMPORT_DATE_ID IN (SELECT ID FROM VS_META_IMPORTDATE WHERE DATENUM >= :from_datenum)
+"""
+# The rows imported from :from_datenum onwards and the last earlier row of each of their symbols, found through the
+# IX_VS_IMPORT_SYMBOL_DATE index, so refreshing the latest import does not sort the whole history.
+DAILY_CHANGES_REFRESH = DAILY_CHANGES_INSERT.format(row_filter="h.DATENUM >= :from_datenum", rows=IMPORT_ROWS + """
+    WHERE d.DATENUM >= :from_datenum
+    UNION ALL
+    SELECT v.IMPORT_DATE_ID, v.SYMBOL_ID, d.DATENUM, v.FUNDAMENTAL_ID, v.VALUATION_ID, v.TREND_ID, v.MOMEMTUM_ID, v.CMP, v.PE
+    FROM (SELECT DISTINCT n.SYMBOL_ID FROM VS_IMPORT n JOIN VS_META_IMPORTDATE nd ON nd.ID = n.IMPORT_DATE_ID
+          WHERE nd.DATENUM >= :from_datenum) s
+    JOIN VS_IMPORT v ON v.SYMBOL_ID = s.SYMBOL_ID AND v.IMPORT_DATE_ID = (
+        SELECT p.IMPORT_DATE_ID FROM VS_IMPORT p JOIN VS_META_IMPORTDATE pd ON pd.ID = p.IMPORT_DATE_ID
+        WHERE p.SYMBOL_ID = s.SYMBOL_ID AND pd.DATENUM < :from_datenum ORDER BY pd.DATENUM DESC LIMIT 1)
+    JOIN VS_META_IMPORTDATE d ON d.ID = v.IMPORT_DATE_ID
+""")
+
+# Every transition of the whole history, the statement migration 3 builds VS_DAILY_CHANGES with.
+DAILY_CHANGES_REBUILD = DAILY_CHANGES_INSERT.format(rows=IMPORT_ROWS, row_filter="1")
+
+# Net change between two snapshots: joins the two dates on the (IMPORT_DATE_ID, SYMBOL_ID) unique index.
+CHANGES_BETWEEN_QUERY = """
+    SELECT s.SYMBOL_ID AS SYMBOL, s.NAME,
+           pf.FUNDAMENTAL AS FROM_FUNDAMENTAL, cf.FUNDAMENTAL AS TO_FUNDAMENTAL,
+           pv.VALUATION AS FROM_VALUATION, cv.VALUATION AS TO_VALUATION,
+           prev.CMP AS FROM_CMP, cur.CMP AS TO_CMP, prev.PE AS FROM_PE, cur.PE AS TO_PE
+    FROM VS_IMPORT cur
+    JOIN VS_IMPORT prev ON prev.IMPORT_DATE_ID = (SELECT ID FROM VS_META_IMPORTDATE WHERE DATENUM = :from_datenum)
+                       AND prev.SYMBOL_ID = cur.SYMBOL_ID
+    JOIN VS_META_STOCKINFO s ON s.ID = cur.SYMBOL_ID
+    LEFT JOIN VS_META_FUNDAMENTAL pf ON pf.ID = prev.FUNDAMENTAL_ID
+    LEFT JOIN VS_META_FUNDAMENTAL cf ON cf.ID = cur.FUNDAMENTAL_ID
+    LEFT JOIN VS_META_VALUATION pv ON pv.ID = prev.VALUATION_ID
+    LEFT JOIN VS_META_VALUATION cv ON cv.ID = cur.VALUATION_ID
+    WHERE cur.IMPORT_DATE_ID = (SELECT ID FROM VS_META_IMPORTDATE WHERE DATENUM = :to_datenum)
+      AND (cur.FUNDAMENTAL_ID IS NOT prev.FUNDAMENTAL_ID OR cur.VALUATION_ID IS NOT prev.VALUATION_ID)
+    ORDER BY s.SYMBOL_ID
+"""
+
+# Day-over-day transitions from the materialized VS_DAILY_CHANGES table.
+DAILY_CHANGES_QUERY = """
+    SELECT d.DATENUM, pd.DATENUM AS PREV_DATENUM, s.SYMBOL_ID AS SYMBOL,
+           pf.FUNDAMENTAL AS FROM_FUNDAMENTAL, cf.FUNDAMENTAL AS TO_FUNDAMENTAL,
+           pv.VALUATION AS FROM_VALUATION, cv.VALUATION AS TO_VALUATION,
+           pt.TREND AS FROM_TREND, ct.TREND AS TO_TREND,
+           pm.MOMEMTUM AS FROM_MOMENTUM, cm.MOMEMTUM AS TO_MOMENTUM,
+           c.PREV_CMP AS FROM_CMP, c.CMP AS TO_CMP, c.PREV_PE AS FROM_PE, c.PE AS TO_PE
+    FROM VS_META_IMPORTDATE d
+    JOIN VS_DAILY_CHANGES c ON c.IMPORT_DATE_ID = d.ID
+    JOIN VS_META_IMPORTDATE pd ON pd.ID = c.PREV_IMPORT_DATE_ID
+    JOIN VS_META_STOCKINFO s ON s.ID = c.SYMBOL_ID
+    LEFT JOIN VS_META_FUNDAMENTAL pf ON pf.ID = c.PREV_FUNDAMENTAL_ID
+    LEFT JOIN VS_META_FUNDAMENTAL cf ON cf.ID = c.FUNDAMENTAL_ID
+    LEFT JOIN VS_META_VALUATION pv ON pv.ID = c.PREV_VALUATION_ID
+    LEFT JOIN VS_META_VALUATION cv ON cv.ID = c.VALUATION_ID
+    LEFT JOIN VS_META_TREND pt ON pt.ID = c.PREV_TREND_ID
+    LEFT JOIN VS_META_TREND ct ON ct.ID = c.TREND_ID
+    LEFT JOIN VS_META_MOMEMTUM pm ON pm.ID = c.PREV_MOMEMTUM_ID
+    LEFT JOIN VS_META_MOMEMTUM cm ON cm.ID = c.MOMEMTUM_ID
+    WHERE d.DATENUM BETWEEN :from_datenum AND :to_datenum
+      AND (:symbol IS NULL OR s.SYMBOL_ID = :symbol)
+    ORDER BY d.DATENUM, s.SYMBOL_ID
+"""
+
+# CMP/PE history of a symbol, served by the covering IX_VS_IMPORT_SYMBOL_DATE index.
+SYMBOL_HISTORY_QUERY = """
+    SELECT d.DATENUM, d.DATE, v.CMP, v.PE, v.MARKET_CAP, f.FUNDAMENTAL, val.VALUATION
+    FROM VS_META_STOCKINFO s
+    JOIN VS_IMPORT v ON v.SYMBOL_ID = s.ID
+    JOIN VS_META_IMPORTDATE d ON d.ID = v.IMPORT_DATE_ID
+    LEFT JOIN VS_META_FUNDAMENTAL f ON f.ID = v.FUNDAMENTAL_ID
+    LEFT JOIN VS_META_VALUATION val ON val.ID = v.VALUATION_ID
+    WHERE s.SYMBOL_ID = :symbol AND d.DATENUM BETWEEN :from_datenum AND :to_datenum
+    ORDER BY d.DATENUM
+"""
+
+# Per date and sector aggregates, served by the covering IX_VS_IMPORT_DATE_SECTOR index. Loss making
+# companies (PE <= 0) are left out of the average PE.
+SECTOR_AGGREGATES_QUERY = """
+    SELECT d.DATENUM, sec.SECTOR_NAME AS SECTOR, COUNT(*) AS STOCKS,
+           AVG(CASE WHEN v.PE > 0 THEN v.PE END) AS AVG_PE,
+           SUM(v.MARKET_CAP) AS MARKET_CAP
+    FROM VS_META_IMPORTDATE d
+    JOIN VS_IMPORT v ON v.IMPORT_DATE_ID = d.ID
+    JOIN VS_META_SECTOR sec ON sec.ID = v.SECTOR_ID
+    WHERE d.DATENUM BETWEEN :from_datenum AND :to_datenum
+    GROUP BY d.DATENUM, sec.SECTOR_NAME
+    ORDER BY d.DATENUM, sec.SECTOR_NAME
+"""
+
+# Full snapshot as of a date: the latest row of every symbol imported on or before it, so dates imported from a delta
+# CSV (holding only the changed rows) are completed with the earlier rows of the unchanged symbols.
+SNAPSHOT_QUERY = """
+    WITH LATEST AS (
+        SELECT v.*, d.DATENUM, d.DATE,
+               ROW_NUMBER() OVER (PARTITION BY v.SYMBOL_ID ORDER BY d.DATENUM DESC) AS RN
+        FROM VS_IMPORT v
+        JOIN VS_META_IMPORTDATE d ON d.ID = v.IMPORT_DATE_ID
+        WHERE d.DATENUM <= :datenum
+    )
+    SELECT l.DATENUM, l.DATE, s.SYMBOL_ID AS SYMBOL, s.NAME, sec.SECTOR_NAME AS SECTOR, l.CMP, val.VALUATION,
+           l.FAIR_RANGE AS FAIRRANGE, l.PE, l.SECTOR_PE AS SECTORPE, l.MARKET_CAP AS MARKETCAP, mc.MARKETCAPTYPE AS MKCAPTYPE,
+           t.TREND, f.FUNDAMENTAL, m.MOMEMTUM AS MOMENTUM, l.DERATIO, l.PRICETOSALES, l.PLEDGE,
+           l.QBS, l."QBS%", l.AGS, l."AGS%", l.VALUATION_DCF, l.VALUATION_GRAHAM, l.VALUATION_EARNING,
+           l.VALUATION_BOOKVALUE, l.VALUATION_SALES
+    FROM LATEST l
+    JOIN VS_META_STOCKINFO s ON s.ID = l.SYMBOL_ID
+    LEFT JOIN VS_META_SECTOR sec ON sec.ID = l.SECTOR_ID
+    LEFT JOIN VS_META_VALUATION val ON val.ID = l.VALUATION_ID
+    LEFT JOIN VS_META_MARKETCAPTYPE mc ON mc.ID = l.MARKETCAPTYPEID
+    LEFT JOIN VS_META_TREND t ON t.ID = l.TREND_ID
+    LEFT JOIN VS_META_FUNDAMENTAL f ON f.ID = l.FUNDAMENTAL_ID
+    LEFT JOIN VS_META_MOMEMTUM m ON m.ID = l.MOMEMTUM_ID
+    WHERE l.RN = 1
+    ORDER BY s.SYMBOL_ID
+"""
+
+# Range used when a query is not limited to dates.
+MIN_DATENUM = 0
+MAX_DATENUM = 99991231
+
+
+def ConnectValueStocksDB(db_file_path):
+    # Open the database for querying, making sure the schema (and VS_DAILY_CHANGES) is up to date.
+    conn = sqlite3.connect(db_file_path)
+    MigrateValueStocksSchema(conn)
+    return conn
+
+def FetchDicts(conn, query, params):
+    cursor = conn.execute(query, params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor]
+
+def RefreshDailyChanges(conn, import_date_ids):
+    '''
+    Recompute VS_DAILY_CHANGES from the oldest of the given import dates onwards, since the previous row of the
+    symbols imported after it may have changed (e.g. when a backfill inserts an older day). Does not commit.
+    Returns the number of transitions stored.
+    '''
+    import_date_ids = list(import_date_ids)
+    if not import_date_ids:
+        return 0
+    from_datenum = conn.execute(
+        "SELECT MIN(DATENUM) FROM VS_META_IMPORTDATE WHERE ID IN (SELECT value FROM json_each(?))",
+        (json.dumps(import_date_ids),)).fetchone()[0]
+    if from_datenum is None:
+        return 0
+    conn.execute(DAILY_CHANGES_DELETE, {'from_datenum': from_datenum})
+    # cursor.rowcount is not maintained for statements starting with WITH.
+    changesBefore = conn.total_changes
+    conn.execute(DAILY_CHANGES_REFRESH, {'from_datenum': from_datenum})
+    transitions = conn.total_changes - changesBefore
+    logger.debug(f"Refreshed VS_DAILY_CHANGES from DATENUM {from_datenum}: {transitions} transitions.")
+    return transitions
+
+def RebuildDailyChanges(conn):
+    '''
+    Recompute VS_DAILY_CHANGES from the whole VS_IMPORT history, e.g. to repair dates imported without their
+    transitions by an older version. Does not commit. Returns the number of transitions stored.
+    '''
+    conn.execute("DELETE FROM VS_DAILY_CHANGES")
+    changesBefore = conn.total_changes
+    conn.execute(DAILY_CHANGES_REBUILD)
+    transitions = conn.total_changes - changesBefore
+    logger.info(f"Rebuilt VS_DAILY_CHANGES: {transitions} transitions.")
+    return transitions
+
+def GetChangesBetween(conn, from_datenum, to_datenum):
+    '''
+    Symbols whose FUNDAMENTAL or VALUATION differs between two import dates (net change, intermediate
+    transitions which were reverted are not reported). Only symbols imported on both dates are compared, dates
+    imported from a delta CSV are better served by GetDailyChanges.
+    '''
+    return FetchDicts(conn, CHANGES_BETWEEN_QUERY, {'from_datenum': from_datenum, 'to_datenum': to_datenum})
+
+def GetDailyChanges(conn, from_datenum=MIN_DATENUM, to_datenum=MAX_DATENUM, symbol=None):
+    '''
+    Every day-over-day FUNDAMENTAL / VALUATION / TREND / MOMENTUM transition of the dates in the range,
+    optionally of a single symbol.
+    '''
+    return FetchDicts(conn, DAILY_CHANGES_QUERY, {'from_datenum': from_datenum, 'to_datenum': to_datenum, 'symbol': symbol})
+
+def GetSymbolHistory(conn, symbol, from_datenum=MIN_DATENUM, to_datenum=MAX_DATENUM):
+    # CMP, PE, MARKET_CAP, FUNDAMENTAL and VALUATION of a symbol for every import date in the range.
+    return FetchDicts(conn, SYMBOL_HISTORY_QUERY, {'symbol': symbol, 'from_datenum': from_datenum, 'to_datenum': to_datenum})
+
+def GetSectorAggregates(conn, from_datenum, to_datenum=None):
+    # Number of stocks, average PE and total market cap per sector for every import date in the range.
+    return FetchDicts(conn, SECTOR_AGGREGATES_QUERY, {'from_datenum': from_datenum, 'to_datenum': to_datenum or from_datenum})
+
+def GetSnapshot(conn, datenum=MAX_DATENUM):
+    '''
+    Full Advanced Info snapshot as of a date, with the columns of the Advanced Info CSV. Every row keeps the DATENUM
+    and DATE it was imported on.
+    '''
+    return FetchDicts(conn, SNAPSHOT_QUERY, {'datenum': datenum})
+
+def WriteSnapshotCsv(rows, csv_file_path):
+    # Write the rows of GetSnapshot as an Advanced Info CSV.
+    with open(csv_file_path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=ADVANCED_INFO_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Query the ValueStocks database.")
+    parser.add_argument('--db', default='ValueStocksDB.db', help="Path of the SQLite database.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    changes = commands.add_parser('changes', help="Symbols whose FUNDAMENTAL or VALUATION changed between two dates.")
+    changes.add_argument('from_datenum', type=int)
+    changes.add_argument('to_datenum', type=int)
+    daily = commands.add_parser('daily-changes', help="Day-over-day transitions in a date range.")
+    daily.add_argument('from_datenum', type=int)
+    daily.add_argument('to_datenum', type=int)
+    daily.add_argument('--symbol')
+    history = commands.add_parser('history', help="CMP/PE history of a symbol.")
+    history.add_argument('symbol')
+    history.add_argument('--from-datenum', type=int, default=MIN_DATENUM)
+    history.add_argument('--to-datenum', type=int, default=MAX_DATENUM)
+    sectors = commands.add_parser('sectors', help="Sector aggregates per date.")
+    sectors.add_argument('from_datenum', type=int)
+    sectors.add_argument('to_datenum', type=int, nargs='?')
+    snapshot = commands.add_parser('snapshot', help="Full snapshot as of a date, completing delta imports with earlier rows.")
+    snapshot.add_argument('datenum', type=int, nargs='?', default=MAX_DATENUM)
+    snapshot.add_argument('--output', help="Write the snapshot as an Advanced Info CSV instead of printing it.")
+    commands.add_parser('rebuild-changes', help="Rebuild VS_DAILY_CHANGES from the whole import history.")
+    args = parser.parse_args()
+
+    conn = ConnectValueStocksDB(args.db)
+    try:
+        if args.command == 'changes':
+            rows = GetChangesBetween(conn, args.from_datenum, args.to_datenum)
+        elif args.command == 'daily-changes':
+            rows = GetDailyChanges(conn, args.from_datenum, args.to_datenum, args.symbol)
+        elif args.command == 'snapshot':
+            rows = GetSnapshot(conn, args.datenum)
+            if args.output:
+                WriteSnapshotCsv(rows, args.output)
+                print("Wrote " + str(len(rows)) + " rows to " + args.output)
+                rows = []
+        elif args.command == 'rebuild-changes':
+            transitions = RebuildDailyChanges(conn)
+            conn.commit()
+            print("Rebuilt VS_DAILY_CHANGES with " + str(transitions) + " transitions")
+            rows = []
+        elif args.command == 'history':
+            rows = GetSymbolHistory(conn, args.symbol, args.from_datenum, args.to_datenum)
+        else:
+            rows = GetSectorAggregates(conn, args.from_datenum, args.to_datenum)
+        for row in rows:
+            print(json.dumps(row))
+    finally:
+        conn.close()
@@ -0,0 +1,119 @@
+import logging
+
+from AdvancedInfoSchema import SCORE_VALUE_COLUMNS
+
+logger = logging.getLogger('ValueStocksSchema')
+
+# VS_DAILY_CHANGES: transitions of the categorical columns of every symbol, between an import date and the previous
+# import date (in DATENUM order) the symbol was imported on. Delta imports only store the rows which changed, so the
+# previous row of a symbol is not necessarily on the previous import date. Only rows where one of the tracked columns
+# changed are stored.
+DAILY_CHANGES_TABLE = """
+    CREATE TABLE IF NOT EXISTS VS_DAILY_CHANGES (
+        IMPORT_DATE_ID INTEGER NOT NULL REFERENCES VS_META_IMPORTDATE (ID),
+        PREV_IMPORT_DATE_ID INTEGER NOT NULL REFERENCES VS_META_IMPORTDATE (ID),
+        SYMBOL_ID INTEGER NOT NULL REFERENCES VS_META_STOCKINFO (ID),
+        PREV_FUNDAMENTAL_ID INTEGER, FUNDAMENTAL_ID INTEGER,
+        PREV_VALUATION_ID INTEGER, VALUATION_ID INTEGER,
+        PREV_TREND_ID INTEGER, TREND_ID INTEGER,
+        PREV_MOMEMTUM_ID INTEGER, MOMEMTUM_ID INTEGER,
+        PREV_CMP NUMERIC (8, 2), CMP NUMERIC (8, 2),
+        PREV_PE NUMERIC (8, 2), PE NUMERIC (8, 2),
+        PRIMARY KEY (IMPORT_DATE_ID, SYMBOL_ID)
+    ) WITHOUT ROWID
+"""
+# Rows of VS_IMPORT with the columns tracked by VS_DAILY_CHANGES and their DATENUM.
+IMPORT_ROWS = """
+    SELECT v.IMPORT_DATE_ID, v.SYMBOL_ID, d.DATENUM, v.FUNDAMENTAL_ID, v.VALUATION_ID, v.TREND_ID, v.MOMEMTUM_ID, v.CMP, v.PE
+    FROM VS_IMPORT v
+    JOIN VS_META_IMPORTDATE d ON d.ID = v.IMPORT_DATE_ID
+"""
+# Compute the transitions of the {rows} (a query with the columns of IMPORT_ROWS) selected by {row_filter} (a condition
+# on h.DATENUM). Every row is paired with the previous row of its symbol among the {rows}.
+DAILY_CHANGES_INSERT = """
+    WITH IMPORT_ROWS AS ({rows}),
+    HISTORY AS (
+        SELECT r.*,
+            LAG(r.IMPORT_DATE_ID) OVER w AS PREV_IMPORT_DATE_ID, LAG(r.FUNDAMENTAL_ID) OVER w AS PREV_FUNDAMENTAL_ID,
+            LAG(r.VALUATION_ID) OVER w AS PREV_VALUATION_ID, LAG(r.TREND_ID) OVER w AS PREV_TREND_ID,
+            LAG(r.MOMEMTUM_ID) OVER w AS PREV_MOMEMTUM_ID, LAG(r.CMP) OVER w AS PREV_CMP, LAG(r.PE) OVER w AS PREV_PE
+        FROM IMPORT_ROWS r
+        WINDOW w AS (PARTITION BY r.SYMBOL_ID ORDER BY r.DATENUM)
+    )
+    INSERT OR REPLACE INTO VS_DAILY_CHANGES (IMPORT_DATE_ID, PREV_IMPORT_DATE_ID, SYMBOL_ID,
+        PREV_FUNDAMENTAL_ID, FUNDAMENTAL_ID, PREV_VALUATION_ID, VALUATION_ID, PREV_TREND_ID, TREND_ID,
+        PREV_MOMEMTUM_ID, MOMEMTUM_ID, PREV_CMP, CMP, PREV_PE, PE)
+    SELECT h.IMPORT_DATE_ID, h.PREV_IMPORT_DATE_ID, h.SYMBOL_ID,
+        h.PREV_FUNDAMENTAL_ID, h.FUNDAMENTAL_ID, h.PREV_VALUATION_ID, h.VALUATION_ID, h.PREV_TREND_ID, h.TREND_ID,
+        h.PREV_MOMEMTUM_ID, h.MOMEMTUM_ID, h.PREV_CMP, h.CMP, h.PREV_PE, h.PE
+    FROM HISTORY h
+    WHERE h.PREV_IMPORT_DATE_ID IS NOT NULL AND ({row_filter})
+      AND (h.FUNDAMENTAL_ID IS NOT h.PREV_FUNDAMENTAL_ID OR h.VALUATION_ID IS NOT h.PREV_VALUATION_ID
+           OR h.TREND_ID IS NOT h.PREV_TREND_ID OR h.MOMEMTUM_ID IS NOT h.PREV_MOMEMTUM_ID)
+"""
+
+def ScoreColumnsBackfill(column):
+    # Fill the numeric score columns of a score column ("8(10)" and "80%") of the rows imported as text only.
+    scoreColumn, maxColumn, percentColumn = SCORE_VALUE_COLUMNS[column]
+    isScore = f"(ltrim({column}, '-') GLOB '[0-9]*([0-9]*)')"
+    isPercent = f"(ltrim(\"{column}%\", '-') GLOB '[0-9]*%')"
+    return f"""
+        UPDATE VS_IMPORT SET
+            {scoreColumn} = CASE WHEN {isScore} THEN CAST(substr({column}, 1, instr({column}, '(') - 1) AS REAL) END,
+            {maxColumn} = CASE WHEN {isScore} THEN CAST(substr({column}, instr({column}, '(') + 1) AS REAL) END,
+            {percentColumn} = CASE WHEN {isPercent} THEN CAST(rtrim("{column}%", '%') AS REAL) END
+    """
+
+# Schema migrations of ValueStocksDB.db, applied in order. PRAGMA user_version records the last applied migration.
+MIGRATIONS = [
+    # 1. VS_IMPORT: one row per (date, symbol) and indexes for the common access paths.
+    [
+        # Re-running the old importer duplicated rows, keep the most recently inserted row of every (date, symbol).
+        """
+        DELETE FROM VS_IMPORT WHERE rowid NOT IN (
+            SELECT MAX(rowid) FROM VS_IMPORT GROUP BY IMPORT_DATE_ID, SYMBOL_ID
+        )
+        """,
+        # "All stocks on date D" and the upsert conflict target.
+        "CREATE UNIQUE INDEX IF NOT EXISTS UX_VS_IMPORT_DATE_SYMBOL ON VS_IMPORT (IMPORT_DATE_ID, SYMBOL_ID)",
+        # "History of symbol X", covering the columns the time-series queries read.
+        """
+        CREATE INDEX IF NOT EXISTS IX_VS_IMPORT_SYMBOL_DATE ON VS_IMPORT
+            (SYMBOL_ID, IMPORT_DATE_ID, CMP, PE, MARKET_CAP, FUNDAMENTAL_ID, VALUATION_ID)
+        """,
+        # Per date sector aggregates.
+        "CREATE INDEX IF NOT EXISTS IX_VS_IMPORT_DATE_SECTOR ON VS_IMPORT (IMPORT_DATE_ID, SECTOR_ID, MARKET_CAP, PE)",
+        "ANALYZE",
+    ],
+    # 2. VS_DAILY_CHANGES, refreshed by every import.
+    [
+        DAILY_CHANGES_TABLE,
+        "CREATE INDEX IF NOT EXISTS IX_VS_DAILY_CHANGES_SYMBOL ON VS_DAILY_CHANGES (SYMBOL_ID, IMPORT_DATE_ID)",
+    ],
+    # 3. (Re)build VS_DAILY_CHANGES from the history imported so far, pairing every row with the previous row of its
+    #    symbol instead of the row on the previous import date, which delta imports leave out.
+    [
+        "DELETE FROM VS_DAILY_CHANGES",
+        DAILY_CHANGES_INSERT.format(rows=IMPORT_ROWS, row_filter="1"),
+    ],
+    # 4. Numeric QBS/AGS score, max and percent, written by the importer along with the text columns.
+    [
+        f"ALTER TABLE VS_IMPORT ADD COLUMN {valueColumn} NUMERIC (5, 1)"
+        for valueColumns in SCORE_VALUE_COLUMNS.values() for valueColumn in valueColumns
+    ] + [ScoreColumnsBackfill(column) for column in SCORE_VALUE_COLUMNS],
+]
+
+def MigrateValueStocksSchema(conn):
+    # Apply the migrations which are newer than the database, each in its own transaction.
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for index in range(version, len(MIGRATIONS)):
+        logger.info("Applying ValueStocks schema migration " + str(index + 1))
+        try:
+            for statement in MIGRATIONS[index]:
+                conn.execute(statement)
+            conn.execute("PRAGMA user_version = " + str(index + 1))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return len(MIGRATIONS)
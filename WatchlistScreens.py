@@ -0,0 +1,231 @@
+import logging
+import re
+from os.path import exists
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger('WatchlistScreens')
+
+# Screens generated when no screens file exists: watchlist name -> rule expression.
+DEFAULT_SCREENS = {
+    "Good Fundamentals": "FUNDAMENTAL == 'Good Financials'",
+    "Great Fundamentals": "FUNDAMENTAL == 'Great Financials'",
+    "Moderate Fundamentals": "FUNDAMENTAL == 'Moderate Financials'",
+    "Poor Fundamentals": "FUNDAMENTAL == 'Poor Financials'",
+    "Great and Good Fundamentals": "FUNDAMENTAL in ('Great Financials', 'Good Financials')",
+}
+
+_TOKEN_PATTERN = re.compile(r"""\s*(?:(?P<string>"[^"]*"|'[^']*')|(?P<op>==|!=|<=|>=|<|>|=)|(?P<punct>[(),])|(?P<word>[^\s(),"'<>=!]+))""")
+_ORDER_OPERATORS = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal}
+
+
+class ScreenError(ValueError):
+    """Raised for a screen which cannot be parsed or evaluated."""
+
+
+def _Tokenize(expression):
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN_PATTERN.match(expression, position)
+        if match is None or match.end() == position:
+            raise ScreenError(f"Unexpected character at position {position} of '{expression}'")
+        position = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        yield kind, (text[1:-1] if kind == 'string' else '==' if text == '=' else text)
+
+
+class _ScreenParser:
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = list(_Tokenize(expression))
+        self.position = 0
+
+    def _peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def _is_keyword(self, keyword, offset=0):
+        kind, text = self._peek(offset)
+        return kind == 'word' and text.lower() == keyword
+
+    def _expect(self, kind, text=None):
+        token = self._peek()
+        if token[0] != kind or (text is not None and token[1] != text):
+            raise ScreenError(f"Expected {text or kind} instead of '{token[1] or 'the end'}' in '{self.expression}'")
+        self.position += 1
+        return token[1]
+
+    def parse(self):
+        node = self._parse_or()
+        if self.position < len(self.tokens):
+            raise ScreenError(f"Unexpected '{self._peek()[1]}' in '{self.expression}'")
+        return node
+
+    def _parse_or(self):
+        nodes = [self._parse_and()]
+        while self._is_keyword('or'):
+            self.position += 1
+            nodes.append(self._parse_and())
+        return nodes[0] if len(nodes) == 1 else ('or', tuple(nodes))
+
+    def _parse_and(self):
+        nodes = [self._parse_not()]
+        while self._is_keyword('and'):
+            self.position += 1
+            nodes.append(self._parse_not())
+        return nodes[0] if len(nodes) == 1 else ('and', tuple(nodes))
+
+    def _parse_not(self):
+        if self._is_keyword('not'):
+            self.position += 1
+            return ('not', self._parse_not())
+        return self._parse_term()
+
+    def _parse_term(self):
+        if self._peek() == ('punct', '('):
+            self.position += 1
+            node = self._parse_or()
+            self._expect('punct', ')')
+            return node
+        column = self._expect('word').upper()
+        kind, text = self._peek()
+        if kind == 'op':
+            self.position += 1
+            values = (self._parse_value(),)
+            operator = {'==': 'in', '!=': 'not in'}.get(text, text)
+        elif self._is_keyword('in'):
+            self.position += 1
+            values, operator = self._parse_list(), 'in'
+        elif self._is_keyword('not') and self._is_keyword('in', 1):
+            self.position += 2
+            values, operator = self._parse_list(), 'not in'
+        else:
+            raise ScreenError(f"Expected an operator after '{column}' in '{self.expression}'")
+        # == and != are 'in' and 'not in' a single value, so equal predicates of different screens share one mask.
+        if operator == 'not in':
+            return ('not', ('predicate', column, 'in', values))
+        return ('predicate', column, operator, values)
+
+    def _parse_list(self):
+        self._expect('punct', '(')
+        values = [self._parse_value(inList=True)]
+        while self._peek() == ('punct', ','):
+            self.position += 1
+            values.append(self._parse_value(inList=True))
+        self._expect('punct', ')')
+        return tuple(sorted(set(values)))
+
+    def _parse_value(self, inList=False):
+        # A quoted string, or the unquoted words up to the next and/or, parenthesis or comma.
+        if self._peek()[0] == 'string':
+            self.position += 1
+            return self.tokens[self.position - 1][1].strip().lower()
+        words = []
+        while self._peek()[0] == 'word' and (inList or not (self._is_keyword('and') or self._is_keyword('or'))):
+            words.append(self._peek()[1])
+            self.position += 1
+        if not words:
+            raise ScreenError(f"Expected a value instead of '{self._peek()[1] or 'the end'}' in '{self.expression}'")
+        return " ".join(words).lower()
+
+
+def CompileScreen(expression):
+    '''
+    Parse a screen expression into a tree of ('and' | 'or', children), ('not', child) and
+    ('predicate', column, operator, values) nodes. Raises ScreenError when the expression is not valid.
+
+    Expressions combine comparisons of the snapshot columns (including the parsed QBS/AGS score columns) with and,
+    or, not and parentheses, e.g.
+    FUNDAMENTAL in (Great, Good) and VALUATION == Undervalued and PLEDGE < 5 and MKCAPTYPE != Micro Cap
+    Text comparisons (==, !=, in, not in) are case-insensitive prefix matches, so 'Great' matches 'Great Financials'.
+    Values may be quoted and must be when they contain a comma, a parenthesis or the words and/or.
+    '''
+    return _ScreenParser(expression).parse()
+
+
+class ScreenEvaluator:
+    def __init__(self, df):
+        """
+        Evaluates compiled screens against a snapshot DataFrame. Every distinct predicate is evaluated once and its
+        boolean mask is shared by all the screens using it. Text predicates on categorical columns only look at the
+        categories.
+
+        :param df: The Advanced Info DataFrame, see AdvancedInfoSchema.LoadAdvancedInfoCsv.
+        """
+        self.df = df
+        self.masks = {}
+
+    def mask(self, node):
+        """Return the boolean mask (a numpy array) of the rows matching a compiled screen."""
+        kind = node[0]
+        if kind == 'and':
+            return np.logical_and.reduce([self.mask(child) for child in node[1]])
+        if kind == 'or':
+            return np.logical_or.reduce([self.mask(child) for child in node[1]])
+        if kind == 'not':
+            return ~self.mask(node[1])
+        if node not in self.masks:
+            self.masks[node] = self._predicate_mask(*node[1:])
+        return self.masks[node]
+
+    def _predicate_mask(self, column, operator, values):
+        if column not in self.df.columns:
+            raise ScreenError(f"Unknown column '{column}'")
+        series = self.df[column]
+        if pd.api.types.is_numeric_dtype(series.dtype):
+            try:
+                numbers = [float(value) for value in values]
+            except ValueError:
+                raise ScreenError(f"Column '{column}' is numeric, {list(values)} is not")
+            array = series.to_numpy(dtype='float64', na_value=np.nan)
+            if operator == 'in':
+                return np.isin(array, numbers)
+            return _ORDER_OPERATORS[operator](array, numbers[0])
+        if operator != 'in':
+            raise ScreenError(f"Operator '{operator}' needs a numeric column, '{column}' is text")
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            matched = [category for category in series.cat.categories if str(category).lower().startswith(values)]
+            return series.isin(matched).to_numpy()
+        lowered = series.astype('string').str.lower()
+        return np.logical_or.reduce([lowered.str.startswith(value).fillna(False).to_numpy(dtype=bool) for value in values])
+
+
+def LoadWatchlistScreens(file_path):
+    '''
+    Read the screens from a text file with one 'Watchlist Name: expression' per line. Empty lines and lines
+    starting with # are ignored. Returns DEFAULT_SCREENS when the file does not exist.
+    '''
+    if not file_path or not exists(file_path):
+        return dict(DEFAULT_SCREENS)
+    screens = {}
+    with open(file_path, 'r') as file:
+        for lineNumber, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            name, separator, expression = line.partition(':')
+            if not separator or not name.strip() or not expression.strip():
+                logger.error(f"Ignoring line {lineNumber} of '{file_path}', expected 'Watchlist Name: expression'")
+                continue
+            screens[name.strip()] = expression.strip()
+    return screens
+
+
+def EvaluateScreens(df, screens):
+    '''
+    Evaluate every screen (name -> expression) against the snapshot DataFrame in a single pass sharing the predicate
+    masks. Returns name -> boolean mask of the screens which could be evaluated, the others are logged and skipped.
+    '''
+    evaluator = ScreenEvaluator(df)
+    masks = {}
+    for name, expression in screens.items():
+        try:
+            masks[name] = evaluator.mask(CompileScreen(expression))
+        except ScreenError as e:
+            print(f"Skipping watchlist '{name}': {e}")
+            logger.error(f"Skipping watchlist '{name}': {e}")
+    logger.debug(f"Evaluated {len(masks)} screens using {len(evaluator.masks)} distinct predicates")
+    return masks
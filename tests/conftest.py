@@ -0,0 +1,43 @@
+import csv
+import logging
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_SNAPSHOT = os.path.join(REPO_ROOT, '20250112-130626-3.DLEVEL_ADVANCED_INFO.CSV')
+
+# The modules live at the root of the repository.
+sys.path.insert(0, REPO_ROOT)
+# Keeps the logging.basicConfig calls of the imported modules from creating log files in the working directory.
+logging.getLogger().addHandler(logging.NullHandler())
+
+
+@pytest.fixture
+def value_stocks_db(tmp_path):
+    # A copy of the committed (empty) database, never the database itself.
+    db_file_path = str(tmp_path / 'ValueStocksDB.db')
+    shutil.copyfile(os.path.join(REPO_ROOT, 'ValueStocksDB.db'), db_file_path)
+    return db_file_path
+
+
+@pytest.fixture
+def sample_rows():
+    with open(SAMPLE_SNAPSHOT, newline='') as file:
+        return list(csv.DictReader(file))
+
+
+def WriteSnapshot(directory, datenum, rows, suffix='-3.DLEVEL_ADVANCED_INFO.CSV'):
+    '''
+    Write the rows as the Advanced Info snapshot of a day, with the DATENUM and DATE columns of that day.
+    Returns the path of the snapshot.
+    '''
+    date = '%s-%s-%s' % (str(datenum)[6:], ('Jan', 'Feb', 'Mar')[int(str(datenum)[4:6]) - 1], str(datenum)[:4])
+    csv_file_path = os.path.join(str(directory), str(datenum) + '-190000' + suffix)
+    with open(csv_file_path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(dict(row, DATENUM=datenum, DATE=date) for row in rows)
+    return csv_file_path
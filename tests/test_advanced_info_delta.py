@@ -0,0 +1,78 @@
+import datetime
+
+import pytest
+
+from AdvancedInfoDelta import AdvancedInfoState, ApplyClosePrice, RowChanged
+from BackfillValueStocks import SelectSnapshotFiles
+
+RUN_COLUMNS = {'DATENUM': '20250114', 'DATE': '14-Jan-2025'}
+
+
+@pytest.fixture
+def row(sample_rows):
+    # 20MICRONS: CMP 235.28, PE 14.05, PRICETOSALES 0.97, MARKETCAP 835.
+    return dict(sample_rows[0], DATENUM='20250113', DATE='13-Jan-2025')
+
+
+def DateNum(start, days):
+    return int((datetime.datetime.strptime(str(start), '%Y%m%d') + datetime.timedelta(days=days)).strftime('%Y%m%d'))
+
+
+def test_apply_close_price_rescales_the_price_columns(row):
+    newRow = ApplyClosePrice(row, 470.56, RUN_COLUMNS)
+
+    assert (newRow['DATENUM'], newRow['DATE'], newRow['CMP']) == ('20250114', '14-Jan-2025', 470.56)
+    assert (newRow['PE'], newRow['PRICETOSALES'], newRow['MARKETCAP']) == (28.1, 1.94, 1670)
+    assert newRow['FUNDAMENTAL'] == row['FUNDAMENTAL']
+    assert row['CMP'] == '235.28'
+
+
+def test_apply_unchanged_close_price_keeps_the_row(row):
+    newRow = ApplyClosePrice(row, 235.28, RUN_COLUMNS)
+
+    assert not RowChanged(row, newRow)
+    assert newRow['PE'] == row['PE']
+
+
+def test_refresh_reason(tmp_path, row):
+    state = AdvancedInfoState(str(tmp_path / 'STATE.JSON'), refresh_days=7, price_change_threshold=0.05)
+    assert state.refresh_reason('20MICRONS', 235.28, 20250113) == 'new'
+
+    state.update(row, refreshed=True)
+
+    assert state.refresh_reason('20MICRONS', None, 20250113) == 'no price'
+    assert state.refresh_reason('20MICRONS', 235.28, 20250113) is None
+    assert state.refresh_reason('20MICRONS', 250.0, 20250113) == 'price moved'
+    assert state.refresh_reason('20MICRONS', 235.28, DateNum(20250113, 7)) == 'stale'
+    # Between two stale refreshes a symbol is refreshed on at most one scheduled day, the same for every run.
+    reasons = [state.refresh_reason('20MICRONS', 235.28, DateNum(20250113, days)) for days in range(1, 7)]
+    assert set(reasons) <= {None, 'scheduled'} and reasons.count('scheduled') <= 1
+
+
+def test_update_reports_changes_and_keeps_the_refresh_day(tmp_path, row):
+    state = AdvancedInfoState(str(tmp_path / 'STATE.JSON'))
+    assert state.update(row, refreshed=True)
+
+    sameRow = dict(row, DATENUM='20250114', DATE='14-Jan-2025', PE='14.050')
+    assert not state.update(sameRow, refreshed=False)
+    assert state.update(ApplyClosePrice(sameRow, 240.0, RUN_COLUMNS), refreshed=False)
+
+    # Price only updates do not move the refresh day or the CMP the refresh threshold is measured from.
+    assert state.symbols['20MICRONS']['refreshed'] == 20250113
+    assert state.symbols['20MICRONS']['refresh_cmp'] == '235.28'
+    assert state.row('20MICRONS')['CMP'] == 240.0
+
+
+def test_saved_state_is_reloaded(tmp_path, row):
+    state = AdvancedInfoState(str(tmp_path / 'STATE.JSON'))
+    state.update(row, refreshed=True)
+    state.save()
+
+    assert AdvancedInfoState(str(tmp_path / 'STATE.JSON')).row('20MICRONS') == row
+
+
+def test_backfill_prefers_the_full_snapshot_of_a_day():
+    files = ['20250113-190000-3.DLEVEL_ADVANCED_INFO.CSV', '20250113-190000-3.DLEVEL_ADVANCED_INFO_DELTA.CSV',
+             '20250114-190000-3.DLEVEL_ADVANCED_INFO_DELTA.CSV', '20250115-180000-3.DLEVEL_ADVANCED_INFO.CSV']
+
+    assert SelectSnapshotFiles(sorted(files), {20250115}) == files[:1] + files[2:3]
@@ -0,0 +1,41 @@
+import time
+
+import VSParse
+
+RUN_COLUMNS = {'DATENUM': 20250113, 'DATE': '13-Jan-2025'}
+
+
+def BasicInfoRow(symbol):
+    return {'SYMBOL': symbol, 'NAME': symbol + ' Ltd', 'DLEVEL_KEY': symbol.lower() + '_is_equity'}
+
+
+def test_concurrent_fetches_are_yielded_in_symbol_order(monkeypatch):
+    rows = [BasicInfoRow(symbol) for symbol in ('AAA', 'BBB', 'CCC', 'DDD', 'EEE', 'FFF')]
+    # The first symbols answer last.
+    delays = {row['SYMBOL']: 0.05 * (len(rows) - index) for index, row in enumerate(rows)}
+
+    def FetchAdvancedDLevelInfo(row, runColumns=None):
+        time.sleep(delays[row['SYMBOL']])
+        return row, dict(row), None
+
+    monkeypatch.setattr(VSParse, 'FetchAdvancedDLevelInfo', FetchAdvancedDLevelInfo)
+
+    results = list(VSParse.IterAdvancedDLevelInfo(rows, maxWorkers=4, runColumns=RUN_COLUMNS))
+
+    assert [row['SYMBOL'] for row, _, _ in results] == [row['SYMBOL'] for row in rows]
+
+
+def test_failed_fetches_are_returned_with_their_exception(monkeypatch):
+    rows = [BasicInfoRow('AAA'), BasicInfoRow('BBB')]
+
+    def GetStockAdvancedInfoFromDLevels1(row, runColumns=None):
+        if row['SYMBOL'] == 'BBB':
+            raise ValueError('no report')
+        return dict(row)
+
+    monkeypatch.setattr(VSParse, 'GetStockAdvancedInfoFromDLevels1', GetStockAdvancedInfoFromDLevels1)
+
+    results = list(VSParse.IterAdvancedDLevelInfo(rows, maxWorkers=2, runColumns=RUN_COLUMNS))
+
+    assert [(row['SYMBOL'], dLevelInfoRow is not None, type(Argument).__name__) for row, dLevelInfoRow, Argument in results] == \
+        [('AAA', True, 'NoneType'), ('BBB', False, 'ValueError')]
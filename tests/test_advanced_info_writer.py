@@ -0,0 +1,38 @@
+import csv
+
+from AdvancedInfoSchema import ADVANCED_INFO_COLUMNS
+from AdvancedInfoWriter import AdvancedInfoWriter
+from VSParse import WriteAdvancedInfoResults
+
+ROWS = [{'SYMBOL': symbol, 'NAME': symbol + ' Ltd', 'DLEVEL_KEY': symbol.lower()} for symbol in ('AAA', 'BBB', 'CCC')]
+
+
+def ReadCsv(path):
+    with open(path, newline='') as file:
+        return list(csv.DictReader(file))
+
+
+def test_rows_and_failures_are_written(tmp_path, sample_rows):
+    advancedInfo, failedInfo = tmp_path / 'ADVANCED_INFO.CSV', tmp_path / 'FAILURE.CSV'
+    results = [(ROWS[0], sample_rows[0], None), (ROWS[1], None, ValueError('no report')), (ROWS[2], sample_rows[1], None)]
+
+    with AdvancedInfoWriter(str(advancedInfo), str(failedInfo)) as writer:
+        WriteAdvancedInfoResults(writer, results)
+
+    assert (writer.rows_written, writer.failures) == (2, 1)
+    written = ReadCsv(advancedInfo)
+    assert list(written[0]) == ADVANCED_INFO_COLUMNS
+    assert [row['SYMBOL'] for row in written] == [sample_rows[0]['SYMBOL'], sample_rows[1]['SYMBOL']]
+    assert ReadCsv(failedInfo) == [ROWS[1]]
+
+
+def test_append_keeps_header_and_no_failure_file_without_failures(tmp_path, sample_rows):
+    advancedInfo, failedInfo = tmp_path / 'ADVANCED_INFO.CSV', tmp_path / 'FAILURE.CSV'
+    with AdvancedInfoWriter(str(advancedInfo), str(failedInfo)) as writer:
+        writer.write_row(sample_rows[0])
+
+    with AdvancedInfoWriter(str(advancedInfo), str(failedInfo), append=True, sync=False) as writer:
+        writer.write_row(sample_rows[1])
+
+    assert [row['SYMBOL'] for row in ReadCsv(advancedInfo)] == [sample_rows[0]['SYMBOL'], sample_rows[1]['SYMBOL']]
+    assert not failedInfo.exists()
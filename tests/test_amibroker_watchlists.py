@@ -0,0 +1,35 @@
+import os
+
+import VSParse
+from AdvancedInfoSchema import LoadAdvancedInfoCsv
+from conftest import SAMPLE_SNAPSHOT
+
+
+class UploadRecorder:
+    def __init__(self):
+        self.contents = None
+
+    def upload_contents_if_changed(self, contents):
+        self.contents = contents
+        return {path: 'uploaded' for path in contents}
+
+
+def test_every_watchlist_is_written_and_uploaded_in_one_call(tmp_path, monkeypatch):
+    recorder = UploadRecorder()
+    monkeypatch.setattr(VSParse, 'dropboxClient', recorder, raising=False)
+    monkeypatch.setattr(VSParse, 'VS_WATCHLIST_SCREENS_FILE', str(tmp_path / 'NoScreens.txt'))
+    monkeypatch.chdir(tmp_path)
+
+    VSParse.GenerateAmibrokerTlsForFundamentals(SAMPLE_SNAPSHOT)
+
+    df = LoadAdvancedInfoCsv(SAMPLE_SNAPSHOT)
+    watchlists = sorted(name for name in os.listdir(tmp_path) if name.endswith('.tls'))
+    assert len(watchlists) == 5
+    assert sorted(os.path.basename(path) for path in recorder.contents) == watchlists
+    for name in watchlists:
+        with open(tmp_path / name, 'rb') as file:
+            content = file.read()
+        assert recorder.contents['/NSEBSEBhavcopy/Amibroker_Watchlists/' + name] == content
+    good = df['SYMBOL'][df['FUNDAMENTAL'] == 'Good Financials'].astype(str)
+    assert recorder.contents['/NSEBSEBhavcopy/Amibroker_Watchlists/Good Fundamentals.tls'] == \
+        "".join(symbol + os.linesep for symbol in good).encode()
@@ -0,0 +1,59 @@
+import sqlite3
+
+import BackfillValueStocks
+from conftest import WriteSnapshot
+
+
+def CountImportedRows(db_file_path):
+    conn = sqlite3.connect(db_file_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM VS_IMPORT").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_snapshots_are_committed_per_batch(tmp_path, value_stocks_db, sample_rows, monkeypatch):
+    rows = sample_rows[:10]
+    for datenum in (20250113, 20250114, 20250115):
+        WriteSnapshot(tmp_path, datenum, rows)
+    # Rows another connection sees after each snapshot is imported.
+    visibleRows = []
+    importRows = BackfillValueStocks.ImportValueStocksRows
+
+    def ImportAndCount(conn, dimensionCache, snapshotRows):
+        rowCount = importRows(conn, dimensionCache, snapshotRows)
+        visibleRows.append(CountImportedRows(value_stocks_db))
+        return rowCount
+    monkeypatch.setattr(BackfillValueStocks, 'ImportValueStocksRows', ImportAndCount)
+
+    importedFiles = BackfillValueStocks.BackfillValueStocks(str(tmp_path), value_stocks_db, workers=1, filesPerTransaction=2)
+
+    assert importedFiles == 3
+    # Nothing is visible until the first batch of two snapshots commits.
+    assert visibleRows == [0, 0, 2 * len(rows)]
+    assert CountImportedRows(value_stocks_db) == 3 * len(rows)
+
+
+def test_failed_snapshot_is_rolled_back_alone(tmp_path, value_stocks_db, sample_rows, monkeypatch):
+    rows = sample_rows[:10]
+    for datenum in (20250113, 20250114, 20250115):
+        WriteSnapshot(tmp_path, datenum, rows)
+    importRows = BackfillValueStocks.ImportValueStocksRows
+
+    def FailSecondDay(conn, dimensionCache, snapshotRows):
+        rowCount = importRows(conn, dimensionCache, snapshotRows)
+        if snapshotRows[0]['DATENUM'] == 20250114:
+            raise ValueError("broken snapshot")
+        return rowCount
+    monkeypatch.setattr(BackfillValueStocks, 'ImportValueStocksRows', FailSecondDay)
+
+    importedFiles = BackfillValueStocks.BackfillValueStocks(str(tmp_path), value_stocks_db, workers=1, filesPerTransaction=2)
+
+    assert importedFiles == 2
+    conn = sqlite3.connect(value_stocks_db)
+    try:
+        datenums = [row[0] for row in conn.execute(
+            "SELECT DISTINCT d.DATENUM FROM VS_IMPORT v JOIN VS_META_IMPORTDATE d ON d.ID = v.IMPORT_DATE_ID ORDER BY 1")]
+    finally:
+        conn.close()
+    assert datenums == [20250113, 20250115]
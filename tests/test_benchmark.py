@@ -0,0 +1,66 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+import requests
+
+from AdvancedInfoSchema import ADVANCED_INFO_COLUMNS, TransformAdvancedInfoRow
+from BenchmarkVSParse import LoadFixtures, MockServices
+from conftest import REPO_ROOT, SAMPLE_SNAPSHOT
+
+
+@pytest.fixture
+def services():
+    server = MockServices(LoadFixtures(SAMPLE_SNAPSHOT, 5), batch_separator=',')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_fixtures_reproduce_the_seed_rows(sample_rows):
+    fixtures = LoadFixtures(SAMPLE_SNAPSHOT, 5)
+
+    for row in sample_rows[:5]:
+        key = fixtures['autosearch'][row['SYMBOL']]['Symbol_Name']
+        record = dict(fixtures['reports'][key], SYMBOL=row['SYMBOL'], NAME=row['NAME'])
+        dLevelInfoRow = TransformAdvancedInfoRow(record, {'DATENUM': row['DATENUM'], 'DATE': row['DATE']})
+        assert {column: str(dLevelInfoRow[column]) for column in ADVANCED_INFO_COLUMNS} == \
+            {column: row[column] for column in ADVANCED_INFO_COLUMNS}
+
+
+def test_stand_in_serves_lookups_and_batched_reports(services, sample_rows):
+    symbols = [row['SYMBOL'] for row in sample_rows[:2]]
+
+    lookup = requests.get(services.base_url + '/get-autosearch-stock?term=' + symbols[0] + '&pageName=').json()
+    keys = [services.fixtures['autosearch'][symbol]['Symbol_Name'] for symbol in symbols]
+    reports = requests.get(services.base_url + '/vs-api?platform=web&action=FundamentalReport&param_list=' + ','.join(keys)).json()
+
+    assert lookup['response'][0]['EXCHANGE_NAME'] == symbols[0]
+    assert [report['Symbol_Name'] for report in reports['response'][1]] == keys
+    assert services.counts == {'dlevels/get-autosearch-stock': 1, 'dlevels/vs-api': 1}
+
+
+def test_stand_in_injects_errors(services):
+    services.error_rate = 1.0
+    services.error_status = 429
+
+    assert requests.get(services.base_url + '/get-autosearch-stock?term=AAA&pageName=').status_code == 429
+    assert services.counts['dlevels/get-autosearch-stock:error'] == 1
+
+
+def test_benchmark_runs_the_pipeline_offline(tmp_path):
+    output = tmp_path / 'report.json'
+    # The work directory of the benchmark is created in TMPDIR.
+    subprocess.run([sys.executable, os.path.join(REPO_ROOT, 'BenchmarkVSParse.py'), '--symbols', '10', '--latency-ms', '0',
+                    '--jitter-ms', '0', '--quiet', '--output', str(output)],
+                   cwd=str(tmp_path), env=dict(os.environ, TMPDIR=str(tmp_path)), check=True, capture_output=True, timeout=120)
+
+    report = json.loads(output.read_text())
+    run = report['runs'][0]
+    assert run['rows_written'] == 10
+    assert run['server_requests']['dlevels/vs-api'] == 10
+    assert 'BuildAndSaveAdvancedDLevelInfo' in run['stages']
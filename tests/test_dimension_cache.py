@@ -0,0 +1,71 @@
+import sqlite3
+
+from DimensionCache import DimensionCache
+from ValueStocksSchema import MigrateValueStocksSchema
+
+
+class CountingConnection:
+    # Wraps a sqlite3 connection and counts the statements sent to it.
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = []
+
+    def execute(self, sql, *args):
+        self.statements.append(sql)
+        return self.conn.execute(sql, *args)
+
+    def executemany(self, sql, rows):
+        self.statements.append(sql)
+        return self.conn.executemany(sql, rows)
+
+
+def OpenDB(db_file_path):
+    conn = sqlite3.connect(db_file_path)
+    MigrateValueStocksSchema(conn)
+    return conn
+
+
+def test_known_values_are_served_from_memory(value_stocks_db):
+    conn = OpenDB(value_stocks_db)
+    try:
+        conn.execute("INSERT INTO VS_META_SECTOR (SECTOR_NAME) VALUES ('Banks')")
+        counting = CountingConnection(conn)
+        cache = DimensionCache(counting)
+        loaded = len(counting.statements)
+
+        ids = cache.resolve('SECTOR', [('Banks',), ('Banks',), (None,)])
+
+        assert 'Banks' in ids and None not in ids
+        assert len(counting.statements) == loaded
+    finally:
+        conn.close()
+
+
+def test_new_values_are_inserted_in_one_batch(value_stocks_db):
+    conn = OpenDB(value_stocks_db)
+    try:
+        counting = CountingConnection(conn)
+        cache = DimensionCache(counting)
+        loaded = len(counting.statements)
+
+        ids = cache.resolve('STOCKINFO', [('AAA', 'AAA Ltd'), ('BBB', 'BBB Ltd'), ('AAA', 'AAA Ltd')])
+
+        # One INSERT for all the new values and one SELECT of their IDs.
+        assert len(counting.statements) == loaded + 2
+        assert dict(conn.execute("SELECT SYMBOL_ID, ID FROM VS_META_STOCKINFO").fetchall()) == \
+            {'AAA': ids['AAA'], 'BBB': ids['BBB']}
+    finally:
+        conn.close()
+
+
+def test_reload_forgets_rolled_back_ids(value_stocks_db):
+    conn = OpenDB(value_stocks_db)
+    try:
+        cache = DimensionCache(conn)
+        cache.resolve('TREND', [('Bullish',)])
+        conn.rollback()
+        cache.reload()
+
+        assert 'Bullish' not in cache.ids['TREND']
+    finally:
+        conn.close()
@@ -0,0 +1,31 @@
+import threading
+
+import VSParse
+
+
+def NseRow(symbol, series='EQ'):
+    return {'SYMBOL': symbol, 'NAME OF COMPANY': symbol + ' Ltd', 'SERIES': series}
+
+
+def test_symbols_are_resolved_once_and_saved_in_nse_order(tmp_path, monkeypatch):
+    nseEquityData = [NseRow('AAA'), NseRow('BBB', 'SM'), NseRow('CCC', 'BE'), NseRow('DDD'), NseRow('EEE')]
+    lookups = []
+    lock = threading.Lock()
+
+    def GetStockInfoFromDLevels(NseMasterRow):
+        with lock:
+            lookups.append(NseMasterRow['SYMBOL'])
+        if NseMasterRow['SYMBOL'] == 'DDD':
+            return None
+        return {'SYMBOL': NseMasterRow['SYMBOL'], 'NAME': NseMasterRow['NAME OF COMPANY'], 'DLEVEL_KEY': NseMasterRow['SYMBOL'].lower()}
+
+    monkeypatch.setattr(VSParse, 'MASTER_EQUITY_L_W_DLEVEL_INFO', str(tmp_path / '02.MASTER_EQUITY_L_W_DLEVEL_INFO.CSV'))
+    monkeypatch.setattr(VSParse, 'GetNseEquityData', lambda: nseEquityData)
+    monkeypatch.setattr(VSParse, 'GetStockInfoFromDLevels', GetStockInfoFromDLevels)
+
+    dLevelInfo = VSParse.BuildAndSaveDLevelBasicInfo(maxWorkers=3)
+
+    # Only the EQ and BE series are looked up, each exactly once.
+    assert sorted(lookups) == ['AAA', 'CCC', 'DDD', 'EEE']
+    assert [row['SYMBOL'] for row in dLevelInfo] == ['AAA', 'CCC', 'EEE']
+    assert dLevelInfo[0] == {'SYMBOL': 'AAA', 'NAME': 'AAA Ltd', 'DLEVEL_KEY': 'aaa'}
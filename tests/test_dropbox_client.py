@@ -0,0 +1,286 @@
+import datetime
+import posixpath
+
+import dropbox
+import requests
+
+import DropboxClient as DropboxClientModule
+from DropboxClient import DropboxClient, dropbox_content_hash
+
+
+class TokenSession(requests.Session):
+    # Answers the OAuth token refreshes, every refresh hands out a new access token.
+    def __init__(self, expires_in=14400):
+        super().__init__()
+        self.expires_in = expires_in
+        self.token_requests = 0
+
+    def post(self, url, **kwargs):
+        self.token_requests += 1
+        response = requests.Response()
+        response.status_code = 200
+        response._content = ('{"access_token": "token-%d", "expires_in": %d}' % (self.token_requests, self.expires_in)).encode()
+        return response
+
+
+def CreateClient(tmp_path, session=None, **kwargs):
+    return DropboxClient('refresh', 'client', 'secret', retry_delay=0, session=session or TokenSession(),
+                         listing_index_path=str(tmp_path / 'DropboxListingIndex.json'), **kwargs)
+
+
+def test_token_is_refreshed_only_shortly_before_it_expires(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(DropboxClientModule.time, 'time', lambda: clock[0])
+    session = TokenSession(expires_in=3600)
+    client = CreateClient(tmp_path, session, token_refresh_margin=300)
+
+    clock[0] += 3000
+    client._check_access_token()
+    assert (session.token_requests, client.access_token) == (1, 'token-1')
+
+    clock[0] += 400
+    client._check_access_token()
+    assert (session.token_requests, client.access_token) == (2, 'token-2')
+    assert client.get_token_stats() == {'refreshes': 2, 'expires_in': 3600}
+
+
+def test_rejected_token_is_refreshed_once_and_the_operation_retried(tmp_path):
+    client = CreateClient(tmp_path)
+    calls = []
+
+    def _operation():
+        calls.append(client.access_token)
+        if len(calls) == 1:
+            raise DropboxClientModule.dropbox.exceptions.AuthError('request-id', None)
+        return 'done'
+
+    assert client._retry_operation(_operation) == 'done'
+    assert calls == ['token-1', 'token-2']
+    # A token which was already replaced by another thread is not refreshed again.
+    client._refresh_access_token(expired_token='token-1')
+    assert client.get_token_stats()['refreshes'] == 2
+
+
+class DownloadResponse:
+    def __init__(self, data):
+        self.data = data
+        self.block_sizes = []
+
+    def iter_content(self, chunk_size):
+        self.block_sizes.append(chunk_size)
+        return (self.data[offset:offset + chunk_size] for offset in range(0, len(self.data), chunk_size))
+
+    def close(self):
+        pass
+
+
+def FileMetadata(path, data, server_modified=None):
+    return dropbox.files.FileMetadata(
+        name=posixpath.basename(path), id='id:' + path.lower(), path_lower=path.lower(), path_display=path,
+        client_modified=server_modified or datetime.datetime(2025, 1, 13), rev='0123456789abcdef',
+        server_modified=server_modified or datetime.datetime(2025, 1, 13), size=len(data),
+        content_hash=dropbox_content_hash(data))
+
+
+class FakeDropbox:
+    # In-memory stand-in for dropbox.Dropbox, keeping the files by their lower case path.
+    def __init__(self, files=None):
+        self.files = {}
+        self.uploads = []
+        self.sessions = {}
+        self.chunks = []
+        # Every stored or deleted file, the cursors are positions in this list.
+        self.changes = []
+        self.listings = []
+        for path, data in (files or {}).items():
+            self.store(path, data)
+
+    def store(self, path, data):
+        self.files[path.lower()] = (FileMetadata(path, data), bytes(data))
+        self.changes.append(self.files[path.lower()][0])
+
+    def delete(self, path):
+        del self.files[path.lower()]
+        self.changes.append(dropbox.files.DeletedMetadata(name=posixpath.basename(path), path_lower=path.lower(), path_display=path))
+
+    def files_upload(self, data, path, mode=None):
+        self.uploads.append(path)
+        self.store(path, data)
+
+    def files_upload_session_start(self, data, close=False):
+        session_id = 'session-%d' % len(self.sessions)
+        self.sessions[session_id] = bytearray(data)
+        return dropbox.files.UploadSessionStartResult(session_id=session_id)
+
+    def _check_offset(self, cursor, error):
+        received = len(self.sessions[cursor.session_id])
+        if cursor.offset != received:
+            raise dropbox.exceptions.ApiError('request-id', error(received), None, None)
+
+    def files_upload_session_append_v2(self, data, cursor):
+        self._check_offset(cursor, lambda received: dropbox.files.UploadSessionAppendError.incorrect_offset(
+            dropbox.files.UploadSessionOffsetError(correct_offset=received)))
+        self.chunks.append((cursor.offset, len(data)))
+        self.sessions[cursor.session_id] += data
+
+    def files_upload_session_finish(self, data, cursor, commit):
+        self._check_offset(cursor, lambda received: dropbox.files.UploadSessionFinishError.lookup_failed(
+            dropbox.files.UploadSessionLookupError.incorrect_offset(dropbox.files.UploadSessionOffsetError(correct_offset=received))))
+        self.chunks.append((cursor.offset, len(data)))
+        self.uploads.append(commit.path)
+        self.store(commit.path, self.sessions.pop(cursor.session_id) + data)
+
+    def files_upload_session_finish_batch_v2(self, entries):
+        results = []
+        for entry in entries:
+            self.uploads.append(entry.commit.path)
+            self.store(entry.commit.path, self.sessions.pop(entry.cursor.session_id))
+            results.append(dropbox.files.UploadSessionFinishBatchResultEntry.success(self.files[entry.commit.path.lower()][0]))
+        return dropbox.files.UploadSessionFinishBatchResult(entries=results)
+
+    def files_download(self, path):
+        metadata, data = self.files[path.lower()]
+        return metadata, DownloadResponse(data)
+
+    def files_list_folder(self, path, recursive=False):
+        entries = [metadata for path_lower, (metadata, _) in sorted(self.files.items())
+                   if posixpath.dirname(path_lower) == path.lower() or (recursive and path_lower.startswith(path.lower() + '/'))]
+        self.listings.append(('list', path))
+        return dropbox.files.ListFolderResult(entries=entries, cursor='%s:%d' % (path.lower(), len(self.changes)), has_more=False)
+
+    def files_list_folder_continue(self, cursor):
+        self.listings.append(('continue', cursor))
+        path, position = cursor.rsplit(':', 1)
+        if int(position) > len(self.changes):
+            raise dropbox.exceptions.ApiError('request-id', dropbox.files.ListFolderContinueError.reset, None, None)
+        entries = [entry for entry in self.changes[int(position):] if posixpath.dirname(entry.path_lower) == path]
+        return dropbox.files.ListFolderResult(entries=entries, cursor='%s:%d' % (path, len(self.changes)), has_more=False)
+
+
+def test_only_changed_contents_are_uploaded(tmp_path):
+    client = CreateClient(tmp_path)
+    client.dbx = FakeDropbox({'/Watchlists/Good.tls': b'AAA\nBBB\n', '/Watchlists/Bad.tls': b'CCC\n'})
+
+    results = client.upload_contents_if_changed({
+        '/Watchlists/Good.tls': b'AAA\nBBB\n',
+        '/Watchlists/Bad.tls': b'CCC\nDDD\n',
+        '/Watchlists/New.tls': b'EEE\n',
+    })
+
+    assert results == {'/Watchlists/Good.tls': 'unchanged', '/Watchlists/Bad.tls': 'uploaded', '/Watchlists/New.tls': 'uploaded'}
+    assert sorted(client.dbx.uploads) == ['/Watchlists/Bad.tls', '/Watchlists/New.tls']
+    assert client.dbx.files['/watchlists/bad.tls'][1] == b'CCC\nDDD\n'
+
+
+def test_large_files_are_uploaded_in_chunks_at_increasing_offsets(tmp_path):
+    client = CreateClient(tmp_path, chunk_size=4)
+    client.dbx = FakeDropbox()
+    local_file_path = tmp_path / 'snapshot.csv'
+    local_file_path.write_bytes(b'0123456789')
+
+    assert client.upload_file(str(local_file_path), '/ValueStocks/snapshot.csv') is True
+
+    assert client.dbx.chunks == [(0, 4), (4, 4), (8, 2)]
+    assert client.dbx.files['/valuestocks/snapshot.csv'][1] == b'0123456789'
+
+
+def test_chunked_upload_resumes_from_the_offset_dropbox_has(tmp_path):
+    class LostReplyDropbox(FakeDropbox):
+        # The first append reaches Dropbox but its reply is lost, so the client sends the chunk again.
+        def files_upload_session_append_v2(self, data, cursor):
+            super().files_upload_session_append_v2(data, cursor)
+            if len(self.chunks) == 1:
+                raise ConnectionError('connection reset')
+
+    client = CreateClient(tmp_path, chunk_size=4)
+    client.dbx = LostReplyDropbox()
+    local_file_path = tmp_path / 'snapshot.csv'
+    local_file_path.write_bytes(b'0123456789')
+
+    assert client.upload_file(str(local_file_path), '/ValueStocks/snapshot.csv') is True
+
+    # The resent chunk is refused with the correct offset and the upload goes on from there.
+    assert client.dbx.chunks == [(0, 4), (4, 4), (8, 2)]
+    assert client.dbx.files['/valuestocks/snapshot.csv'][1] == b'0123456789'
+
+
+def test_downloads_are_streamed_in_blocks(tmp_path):
+    client = CreateClient(tmp_path, download_block_size=3)
+    client.dbx = FakeDropbox({'/ValueStocks/snapshot.csv': b'0123456789'})
+    downloads = []
+    download = client.dbx.files_download
+    client.dbx.files_download = lambda path: downloads.append(download(path)) or downloads[-1]
+
+    client.download_file('/ValueStocks/snapshot.csv', str(tmp_path / 'snapshot.csv'))
+
+    assert (tmp_path / 'snapshot.csv').read_bytes() == b'0123456789'
+    assert downloads[0][1].block_sizes == [3]
+    assert not (tmp_path / 'snapshot.csv.part').exists()
+
+
+def WriteFiles(folder, files):
+    for relative_path, data in files.items():
+        (folder / relative_path).parent.mkdir(parents=True, exist_ok=True)
+        (folder / relative_path).write_bytes(data)
+
+
+def test_sync_upload_transfers_only_changed_files(tmp_path):
+    client = CreateClient(tmp_path, chunk_size=8)
+    client.dbx = FakeDropbox({'/Sync/same.tls': b'AAA', '/Sync/changed.tls': b'BBB', '/Sync/other.csv': b'x'})
+    WriteFiles(tmp_path / 'local', {'same.tls': b'AAA', 'changed.tls': b'BBB2', 'sub/new.tls': b'CCC', 'large.tls': b'0123456789'})
+
+    summary = client.sync_folder(str(tmp_path / 'local'), '/Sync', filename_pattern='*.tls')
+
+    assert summary == {'transferred': 3, 'unchanged': 1, 'failed': 0}
+    assert sorted(client.dbx.uploads) == ['/Sync/changed.tls', '/Sync/large.tls', '/Sync/sub/new.tls']
+    # Only the file larger than chunk_size went through its own upload session.
+    assert client.dbx.chunks == [(0, 8), (8, 2)]
+    assert client.dbx.files['/sync/changed.tls'][1] == b'BBB2'
+
+
+def test_sync_download_transfers_only_changed_files(tmp_path):
+    client = CreateClient(tmp_path)
+    client.dbx = FakeDropbox({'/Sync/same.tls': b'AAA', '/Sync/changed.tls': b'BBB2', '/Sync/Sub/new.tls': b'CCC'})
+    WriteFiles(tmp_path / 'local', {'same.tls': b'AAA', 'changed.tls': b'BBB'})
+    downloads = []
+    download = client.dbx.files_download
+    client.dbx.files_download = lambda path: downloads.append(path) or download(path)
+
+    summary = client.sync_folder(str(tmp_path / 'local'), '/Sync', direction='download')
+
+    assert summary == {'transferred': 2, 'unchanged': 1, 'failed': 0}
+    assert sorted(downloads) == ['/sync/changed.tls', '/sync/sub/new.tls']
+    assert (tmp_path / 'local' / 'changed.tls').read_bytes() == b'BBB2'
+    assert (tmp_path / 'local' / 'Sub' / 'new.tls').read_bytes() == b'CCC'
+
+
+def test_listings_are_updated_from_the_stored_cursor(tmp_path):
+    dbx = FakeDropbox({'/ValueStocks/20250113.CSV': b'1', '/ValueStocks/20250114.CSV': b'2'})
+    client = CreateClient(tmp_path)
+    client.dbx = dbx
+
+    assert sorted(name for name, _ in client.list_files('/ValueStocks')) == ['20250113.CSV', '20250114.CSV']
+    dbx.store('/ValueStocks/20250115.CSV', b'3')
+    dbx.delete('/ValueStocks/20250113.CSV')
+
+    assert sorted(name for name, _ in client.list_files('/ValueStocks')) == ['20250114.CSV', '20250115.CSV']
+    assert dbx.listings == [('list', '/ValueStocks'), ('continue', '/valuestocks:2')]
+    assert client.file_exists('/ValueStocks/20250115.CSV') and not client.file_exists('/ValueStocks/20250113.CSV')
+
+    # The cursor is persisted, a new client only fetches the changes since it.
+    restarted = CreateClient(tmp_path)
+    restarted.dbx = dbx
+    assert restarted.listing_index.get_cursor('/ValueStocks') == '/valuestocks:4'
+    assert restarted.get_most_recent_file('/ValueStocks') in ('/valuestocks/20250114.csv', '/valuestocks/20250115.csv')
+    assert dbx.listings[-1][0] == 'continue'
+
+
+def test_reset_cursor_lists_the_folder_again(tmp_path):
+    dbx = FakeDropbox({'/ValueStocks/20250113.CSV': b'1'})
+    client = CreateClient(tmp_path)
+    client.dbx = dbx
+    client.list_files('/ValueStocks')
+    client.listing_index.apply('/ValueStocks', [], '/valuestocks:99')
+
+    assert [name for name, _ in client.list_files('/ValueStocks')] == ['20250113.CSV']
+    assert [call for call, _ in dbx.listings] == ['list', 'continue', 'list']
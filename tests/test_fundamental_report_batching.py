@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+import VSParse
+from AdvancedInfoSchema import FIELD_MAPPING
+
+RUN_COLUMNS = {'DATENUM': 20250113, 'DATE': '13-Jan-2025'}
+
+
+class FakeResponse:
+    def __init__(self, status_code, reports=()):
+        self.status_code = status_code
+        self.text = json.dumps({'response': [{}, list(reports)]})
+
+
+def BasicInfoRow(symbol):
+    return {'SYMBOL': symbol, 'NAME': symbol + ' Ltd', 'DLEVEL_KEY': symbol.lower() + '_is_equity'}
+
+
+def Report(row):
+    report = {field: '1' for column, field in FIELD_MAPPING.items() if column not in ('SYMBOL', 'NAME')}
+    report.update({'Qbs': '8/10', 'Ags': '6/10', VSParse.DLEVEL_BATCH_KEY_FIELD: row['DLEVEL_KEY'].replace('_', ' ')})
+    return report
+
+
+@pytest.fixture(autouse=True)
+def batching_enabled():
+    VSParse.dlevelBatchUnsupported.clear()
+    yield
+    VSParse.dlevelBatchUnsupported.clear()
+
+
+def test_reports_are_matched_to_their_rows():
+    rows = [BasicInfoRow('AAA'), BasicInfoRow('BBB'), BasicInfoRow('CCC')]
+
+    results = VSParse.DemultiplexFundamentalReports(rows, FakeResponse(200, [Report(rows[2]), Report(rows[0])]), RUN_COLUMNS)
+
+    assert [row['SYMBOL'] for row, _ in results] == ['AAA', 'BBB', 'CCC']
+    assert [dLevelInfoRow['SYMBOL'] if dLevelInfoRow else None for _, dLevelInfoRow in results] == ['AAA', None, 'CCC']
+    assert not VSParse.dlevelBatchUnsupported.is_set()
+
+
+def test_ok_response_without_matching_report_switches_batching_off():
+    rows = [BasicInfoRow('AAA'), BasicInfoRow('BBB')]
+
+    results = VSParse.DemultiplexFundamentalReports(rows, FakeResponse(200, [Report(BasicInfoRow('ZZZ'))]), RUN_COLUMNS)
+
+    assert [dLevelInfoRow for _, dLevelInfoRow in results] == [None, None]
+    assert VSParse.dlevelBatchUnsupported.is_set()
+
+
+def test_throttled_response_keeps_batching_on():
+    rows = [BasicInfoRow('AAA'), BasicInfoRow('BBB')]
+
+    results = VSParse.DemultiplexFundamentalReports(rows, FakeResponse(503), RUN_COLUMNS)
+
+    assert [dLevelInfoRow for _, dLevelInfoRow in results] == [None, None]
+    assert not VSParse.dlevelBatchUnsupported.is_set()
@@ -0,0 +1,135 @@
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+import HttpCache
+from HttpCache import CachingAdapter, ResponseCache
+
+URL = 'https://ws.dlevels.com/get-autosearch-stock?term=AAA&pageName='
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        # Every call moves on a little, so the LAST_ACCESS of every lookup differs.
+        self.now += 0.001
+        return self.now
+
+
+class Network:
+    # Stands in for HTTPAdapter.send: answers with the queued (status, headers, body) and records the requests.
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        status, headers, body = self.responses.pop(0)
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response._content = body
+        response.url = request.url
+        response.request = request
+        return response
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(HttpCache.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def network(monkeypatch):
+    network = Network()
+    monkeypatch.setattr(HTTPAdapter, 'send', lambda adapter, request, **kwargs: network.send(request, **kwargs))
+    return network
+
+
+def CreateSession(cache, rate_limiter=None):
+    session = requests.Session()
+    session.mount('https://', CachingAdapter(cache, rate_limiter))
+    return session
+
+
+def test_responses_are_served_from_the_cache_until_their_ttl_expires(tmp_path, clock, network):
+    cache = ResponseCache(str(tmp_path / 'HttpCache.db'), ttl_rules=[('*get-autosearch-stock*', 60)])
+    session = CreateSession(cache)
+    network.responses = [(200, {}, b'first'), (200, {}, b'second')]
+
+    assert session.get(URL).content == b'first'
+    cached = session.get(URL)
+    assert (cached.content, cached.from_cache) == (b'first', True)
+
+    clock.now += 61
+    assert session.get(URL).content == b'second'
+    assert len(network.requests) == 2
+    assert cache.stats()['hits'] == 1
+
+
+def test_urls_without_a_ttl_are_not_cached(tmp_path, clock, network):
+    cache = ResponseCache(str(tmp_path / 'HttpCache.db'), ttl_rules=[('*get-autosearch-stock*', 60)])
+    session = CreateSession(cache)
+    network.responses = [(200, {}, b'report'), (200, {}, b'report')]
+
+    session.get('https://ws.dlevels.com/vs-api?symbol=AAA')
+    session.get('https://ws.dlevels.com/vs-api?symbol=AAA')
+
+    assert len(network.requests) == 2
+    assert cache.stats()['size_bytes'] == 0
+
+
+def test_stale_entries_are_revalidated_with_their_etag(tmp_path, clock, network):
+    cache = ResponseCache(str(tmp_path / 'HttpCache.db'), default_ttl=60)
+    session = CreateSession(cache)
+    network.responses = [(200, {'ETag': '"v1"'}, b'listing'), (304, {}, b'')]
+
+    session.get(URL)
+    clock.now += 61
+    revalidated = session.get(URL)
+
+    assert network.requests[1].headers['If-None-Match'] == '"v1"'
+    assert (revalidated.status_code, revalidated.content, revalidated.from_cache) == (200, b'listing', True)
+    # The 304 makes the entry fresh again, the next lookup does not go to the network.
+    assert session.get(URL).content == b'listing'
+    assert len(network.requests) == 2
+    assert cache.stats()['revalidations'] == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / 'HttpCache.db'), default_ttl=60, max_size_bytes=10)
+
+    cache.put('https://a', 200, {}, b'aaaa')
+    cache.put('https://b', 200, {}, b'bbbb')
+    cache.get('https://a')
+    cache.put('https://c', 200, {}, b'cccc')
+
+    assert cache.get('https://b') is None
+    assert cache.get('https://a')['content'] == b'aaaa'
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['size_bytes'] == 8
+
+
+def test_only_network_requests_are_paced_by_the_rate_limiter(tmp_path, clock, network):
+    class RateLimiter:
+        def __init__(self):
+            self.acquired = []
+
+        def acquire(self, url):
+            self.acquired.append(url)
+
+        def record_response(self, url, status_code):
+            return status_code == 503
+
+    rate_limiter = RateLimiter()
+    session = CreateSession(ResponseCache(str(tmp_path / 'HttpCache.db'), default_ttl=60), rate_limiter)
+    network.responses = [(503, {}, b''), (200, {}, b'listing')]
+
+    assert session.get(URL).throttled is True
+    assert session.get(URL).throttled is False
+    assert session.get(URL).throttled is False
+    assert len(rate_limiter.acquired) == 2
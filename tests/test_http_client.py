@@ -0,0 +1,64 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError
+
+import VSParse
+from HttpClient import BuildRetryPolicy, CreateHttpSession
+
+
+class RecordingAdapter(HTTPAdapter):
+    # Answers every request with the next queued status code and records the timeout it was sent with.
+    statuses = []
+    timeouts = []
+
+    def send(self, request, **kwargs):
+        RecordingAdapter.timeouts.append(kwargs.get('timeout'))
+        response = requests.Response()
+        response.status_code = RecordingAdapter.statuses.pop(0)
+        response.url = request.url
+        response.request = request
+        response._content = b''
+        response.throttled = response.status_code in (429, 503)
+        return response
+
+
+def test_connection_errors_are_retried_with_jittered_backoff():
+    retry = BuildRetryPolicy(max_retries=3, backoff_factor=0.5, backoff_jitter=0.5)
+
+    retry = retry.increment('GET', '/vs-api', error=ProtocolError('reset'))
+    retry = retry.increment('GET', '/vs-api', error=ProtocolError('reset'))
+
+    assert 1.0 <= retry.get_backoff_time() <= 1.5
+
+
+def test_throttled_responses_are_left_to_the_caller():
+    retry = BuildRetryPolicy()
+
+    # Not even when they carry a Retry-After header, they reach the HostRateLimiter instead.
+    assert not retry.is_retry('GET', 503, has_retry_after=True)
+    assert not retry.is_retry('GET', 429, has_retry_after=True)
+    assert not retry.is_retry('GET', 502)
+
+
+def test_session_applies_its_default_timeout():
+    session = CreateHttpSession(adapter_class=RecordingAdapter, connect_timeout=2, read_timeout=7)
+    RecordingAdapter.statuses[:] = [200, 200]
+    RecordingAdapter.timeouts[:] = []
+
+    session.get('https://ws.dlevels.com/vs-api')
+    session.get('https://ws.dlevels.com/vs-api', timeout=1)
+
+    assert RecordingAdapter.timeouts == [(2, 7), 1]
+
+
+def test_throttled_requests_are_repeated_outside_the_nse_stage(monkeypatch):
+    session = CreateHttpSession(adapter_class=RecordingAdapter)
+    RecordingAdapter.statuses[:] = [503, 429, 200]
+    monkeypatch.setattr(VSParse, 'session', session, raising=False)
+    VSParse.pipelineMetrics.reset()
+
+    response = VSParse.GetWithThrottleRetries('https://ws.dlevels.com/vs-api', 'AAA')
+
+    assert response.status_code == 200
+    assert RecordingAdapter.statuses == []
+    assert 'GetNseEquityData' not in VSParse.pipelineMetrics.stages
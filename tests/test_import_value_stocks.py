@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+
+import ImportValueStocksToSqlLite
+from ImportValueStocksToSqlLite import ImportValueStocksFiles, OpenValueStocksDB
+from conftest import WriteSnapshot
+
+
+def Query(db_file_path, sql):
+    conn = sqlite3.connect(db_file_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def ImportSnapshots(db_file_path, csv_file_paths):
+    conn, dimensionCache = OpenValueStocksDB(db_file_path)
+    try:
+        return ImportValueStocksFiles(csv_file_paths, conn, dimensionCache)
+    finally:
+        conn.close()
+
+
+def test_rows_are_stored_with_their_dimension_ids(tmp_path, value_stocks_db, sample_rows):
+    rows = sample_rows[:20]
+
+    importedRows = ImportSnapshots(value_stocks_db, [WriteSnapshot(tmp_path, 20250113, rows)])
+
+    assert importedRows == len(rows)
+    stored = dict(Query(value_stocks_db, """
+        SELECT S.SYMBOL_ID, SE.SECTOR_NAME || '|' || I.CMP FROM VS_IMPORT I
+        JOIN VS_META_STOCKINFO S ON S.ID = I.SYMBOL_ID JOIN VS_META_SECTOR SE ON SE.ID = I.SECTOR_ID"""))
+    assert stored[rows[0]['SYMBOL']] == rows[0]['SECTOR'] + '|' + str(float(rows[0]['CMP']))
+    assert Query(value_stocks_db, "SELECT DATENUM FROM VS_META_IMPORTDATE") == [(20250113,)]
+
+
+def test_reimporting_a_snapshot_updates_instead_of_duplicating(tmp_path, value_stocks_db, sample_rows):
+    rows = sample_rows[:20]
+    ImportSnapshots(value_stocks_db, [WriteSnapshot(tmp_path, 20250113, rows)])
+
+    rows[0] = dict(rows[0], CMP='12345.5')
+    ImportSnapshots(value_stocks_db, [WriteSnapshot(tmp_path, 20250113, rows)])
+
+    assert Query(value_stocks_db, "SELECT COUNT(*) FROM VS_IMPORT") == [(len(rows),)]
+    assert Query(value_stocks_db, "SELECT COUNT(*) FROM VS_META_STOCKINFO") == [(len(rows),)]
+    assert Query(value_stocks_db, f"""
+        SELECT I.CMP FROM VS_IMPORT I JOIN VS_META_STOCKINFO S ON S.ID = I.SYMBOL_ID
+        WHERE S.SYMBOL_ID = '{rows[0]['SYMBOL']}'""") == [(12345.5,)]
+
+
+def test_rows_clashing_on_the_unique_name_are_skipped(tmp_path, value_stocks_db, sample_rows, capsys):
+    rows = sample_rows[:3]
+    # A renamed Symbol reusing the NAME of another one cannot be added to VS_META_STOCKINFO.
+    rows[1] = dict(rows[1], NAME=rows[0]['NAME'])
+
+    importedRows = ImportSnapshots(value_stocks_db, [WriteSnapshot(tmp_path, 20250113, rows)])
+
+    assert importedRows == 2
+    assert sorted(symbol for symbol, in Query(value_stocks_db, "SELECT SYMBOL_ID FROM VS_META_STOCKINFO")) == \
+        sorted([rows[0]['SYMBOL'], rows[2]['SYMBOL']])
+    assert "Skipping " + rows[1]['SYMBOL'] in capsys.readouterr().out
+
+
+def test_failed_file_leaves_no_rows_or_dimensions_behind(tmp_path, value_stocks_db, sample_rows, monkeypatch):
+    conn, dimensionCache = OpenValueStocksDB(value_stocks_db)
+    try:
+        ImportValueStocksFiles([WriteSnapshot(tmp_path, 20250113, sample_rows[:5])], conn, dimensionCache)
+
+        def RefreshDailyChanges(conn, dateIds):
+            raise RuntimeError('disk full')
+        monkeypatch.setattr(ImportValueStocksToSqlLite, 'RefreshDailyChanges', RefreshDailyChanges)
+        with pytest.raises(RuntimeError):
+            ImportValueStocksFiles([WriteSnapshot(tmp_path, 20250114, sample_rows[5:10])], conn, dimensionCache)
+
+        # The IDs of the rolled back file are dropped from the cache as well.
+        assert dimensionCache.ids['STOCKINFO'].keys() == {row['SYMBOL'] for row in sample_rows[:5]}
+    finally:
+        conn.close()
+
+    assert Query(value_stocks_db, "SELECT COUNT(*) FROM VS_IMPORT") == [(5,)]
+    assert Query(value_stocks_db, "SELECT DATENUM FROM VS_META_IMPORTDATE") == [(20250113,)]
+
+
+def test_migration_drops_duplicated_rows_and_indexes_the_history(value_stocks_db):
+    conn = sqlite3.connect(value_stocks_db)
+    try:
+        # Rows duplicated by the old importer, which inserted a (date, symbol) again on every run.
+        conn.executemany("INSERT INTO VS_IMPORT (IMPORT_DATE_ID, SYMBOL_ID, SECTOR_ID, VALUATION_ID, CMP) VALUES (1, ?, 1, 1, ?)",
+                         [(1, 10.0), (1, 11.0), (2, 20.0)])
+        conn.commit()
+        ImportValueStocksToSqlLite.MigrateValueStocksSchema(conn)
+
+        assert conn.execute("SELECT SYMBOL_ID, CMP FROM VS_IMPORT ORDER BY SYMBOL_ID").fetchall() == [(1, 11.0), (2, 20.0)]
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT IMPORT_DATE_ID, CMP FROM VS_IMPORT WHERE SYMBOL_ID = 1").fetchall()
+        assert 'IX_VS_IMPORT_SYMBOL_DATE' in str(plan)
+    finally:
+        conn.close()
@@ -0,0 +1,53 @@
+import threading
+
+import PipelineMetrics
+from PipelineMetrics import PipelineMetrics as Metrics
+
+
+def test_decorated_stage_times_concurrent_calls_separately(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(PipelineMetrics.time, 'monotonic', lambda: clock[0])
+    metrics = Metrics()
+
+    @metrics.stage('Fetch')
+    def Fetch(entered, release):
+        entered.set()
+        release.wait(5)
+
+    calls = []
+    for start in (0.0, 10.0):
+        clock[0] = start
+        entered, release = threading.Event(), threading.Event()
+        thread = threading.Thread(target=Fetch, args=(entered, release))
+        thread.start()
+        assert entered.wait(5)
+        calls.append((thread, release))
+
+    # The second call ends after 5s, the first one, still running, after 20s.
+    for end, (thread, release) in zip((15.0, 20.0), reversed(calls)):
+        clock[0] = end
+        release.set()
+        thread.join(5)
+
+    assert metrics.stages['Fetch']['calls'] == 2
+    assert metrics.stages['Fetch']['seconds'] == 25.0
+
+
+def test_summary_reports_endpoint_counts_and_latency_percentiles():
+    metrics = Metrics()
+    endpoint = PipelineMetrics.EndpointName('https://ws.dlevels.com/vs-api?platform=web&symbol=A')
+    for seconds in range(1, 101):
+        metrics.record_request(endpoint, seconds / 100, 200, 10, from_cache=seconds <= 25)
+    metrics.record_request(endpoint, 0.0, retries=3, error=True)
+    with metrics.stage('Upload'):
+        pass
+
+    summary = metrics.summary()
+
+    stats = summary['endpoints']['ws.dlevels.com/vs-api']
+    assert (stats['requests'], stats['errors'], stats['retries'], stats['cache_hits']) == (101, 1, 3, 25)
+    assert stats['status'] == {'200': 100}
+    assert stats['bytes'] == 1000
+    assert stats['latency_seconds']['p50'] == 0.5
+    assert stats['latency_seconds']['p99'] == 0.99
+    assert summary['stages']['Upload']['calls'] == 1
@@ -0,0 +1,62 @@
+import RateLimiter
+from RateLimiter import HostRateLimiter, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def FrozenClock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(RateLimiter.time, 'monotonic', clock)
+    return clock
+
+
+def test_bucket_allows_a_burst_then_paces_at_its_rate(monkeypatch):
+    clock = FrozenClock(monkeypatch)
+    bucket = TokenBucket(rate=4, capacity=2)
+
+    assert [bucket.try_acquire() for _ in range(2)] == [0, 0]
+    assert bucket.try_acquire() == 0.25
+
+    clock.now += 0.25
+    assert bucket.try_acquire() == 0
+
+
+def test_hosts_have_their_own_budget(monkeypatch):
+    FrozenClock(monkeypatch)
+    limiter = HostRateLimiter(requests_per_second=1)
+
+    assert limiter.try_acquire('https://ws.dlevels.com/vs-api?symbol=a') == 0
+    assert limiter.try_acquire('https://ws.dlevels.com/vs-api?symbol=b') > 0
+    assert limiter.try_acquire('https://nsearchives.nseindia.com/content/equities/EQUITY_L.csv') == 0
+
+
+def test_throttled_responses_back_off_and_healthy_ones_recover(monkeypatch):
+    FrozenClock(monkeypatch)
+    limiter = HostRateLimiter(requests_per_second=8, min_rate=1, max_rate=10)
+    url = 'https://ws.dlevels.com/vs-api?symbol=a'
+    bucket = limiter._get_bucket(url)
+
+    assert [limiter.record_response(url, status) for status in (429, 503, 503, 503)] == [True] * 4
+    # Halved on every throttled response, never below min_rate, and the burst allowance is dropped.
+    assert bucket.rate == 1
+    assert limiter.try_acquire(url) > 0
+
+    assert limiter.record_response(url, 200) is False
+    assert bucket.rate == 1.5
+    for _ in range(40):
+        limiter.record_response(url, 200)
+    assert bucket.rate == 10
+
+
+def test_client_errors_are_not_throttling(monkeypatch):
+    FrozenClock(monkeypatch)
+    limiter = HostRateLimiter(requests_per_second=8)
+
+    assert limiter.record_response('https://ws.dlevels.com/vs-api', 404) is False
+    assert limiter._get_bucket('https://ws.dlevels.com/vs-api').rate == 8.5
@@ -0,0 +1,53 @@
+import csv
+
+from RunCheckpoint import RunCheckpoint
+
+ROWS = [{'SYMBOL': symbol, 'NAME': symbol + ' Ltd', 'DLEVEL_KEY': symbol.lower()} for symbol in ('AAA', 'BBB', 'CCC', 'DDD')]
+
+
+def StartRun(tmp_path, journal_text):
+    checkpoint = RunCheckpoint(str(tmp_path / 'RUNSTATE.JSON'))
+    journal = tmp_path / 'ADVANCED_INFO.CSV'
+    checkpoint.start_or_resume(str(journal), str(tmp_path / 'FAILURE.CSV'))
+    journal.write_text(journal_text)
+    return checkpoint, journal
+
+
+def test_partial_last_line_is_dropped_and_not_completed(tmp_path):
+    checkpoint, journal = StartRun(tmp_path, "SYMBOL,NAME,CMP\nAAA,AAA Ltd,10\nBBB,BBB Ltd,2")
+
+    pending = checkpoint.pending(ROWS)
+
+    assert [row['SYMBOL'] for row in pending] == ['BBB', 'CCC', 'DDD']
+    assert journal.read_text() == "SYMBOL,NAME,CMP\nAAA,AAA Ltd,10\n"
+
+
+def test_rows_missing_columns_are_not_completed(tmp_path):
+    checkpoint, journal = StartRun(tmp_path, "SYMBOL,NAME,CMP\nAAA,AAA Ltd,10\nBBB,BBB Ltd\n")
+
+    assert checkpoint.completed_symbols() == {'AAA'}
+
+
+def test_sort_journal_restores_symbol_order(tmp_path):
+    checkpoint, journal = StartRun(tmp_path, "SYMBOL,NAME,CMP\nCCC,CCC Ltd,3\nBBB,BBB Ltd\nAAA,AAA Ltd,1\nBBB,BBB Ltd,2\n")
+
+    checkpoint.sort_journal(ROWS)
+
+    with open(journal, newline='') as file:
+        assert [row['SYMBOL'] for row in csv.DictReader(file)] == ['AAA', 'BBB', 'CCC']
+    assert "BBB,BBB Ltd,2" in journal.read_text()
+
+
+def test_resumed_run_keeps_its_run_columns(tmp_path):
+    state_file_path = str(tmp_path / 'RUNSTATE.JSON')
+    journal = tmp_path / 'ADVANCED_INFO.CSV'
+    started = RunCheckpoint(state_file_path)
+    started.start_or_resume(str(journal), str(tmp_path / 'FAILURE.CSV'), {'DATENUM': '20250112', 'DATE': '12-Jan-2025'})
+    journal.write_text("SYMBOL,NAME,CMP\nAAA,AAA Ltd,10\n")
+
+    resumed = RunCheckpoint(state_file_path)
+    name, _ = resumed.start_or_resume(str(tmp_path / 'NEXT_DAY.CSV'), str(tmp_path / 'NEXT_DAY_FAILURE.CSV'),
+                                      {'DATENUM': '20250113', 'DATE': '13-Jan-2025'})
+
+    assert name == str(journal)
+    assert resumed.run_columns() == {'DATENUM': '20250112', 'DATE': '12-Jan-2025'}
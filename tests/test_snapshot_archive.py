@@ -0,0 +1,42 @@
+import os
+
+import pandas as pd
+import pytest
+
+from AdvancedInfoSchema import SCORE_VALUE_COLUMNS, LoadAdvancedInfoCsv
+from SnapshotArchive import ArchiveAdvancedInfoSnapshot, LoadSnapshotDataset
+from conftest import WriteSnapshot
+
+pytest.importorskip('pyarrow')
+
+
+def test_snapshot_is_written_next_to_the_csv_with_its_types(tmp_path, sample_rows):
+    csv_file_path = WriteSnapshot(tmp_path, 20250113, sample_rows[:20])
+
+    snapshot_file_path = ArchiveAdvancedInfoSnapshot(csv_file_path, 'parquet', str(tmp_path / 'dataset'))
+
+    assert snapshot_file_path == os.path.splitext(csv_file_path)[0] + '.parquet'
+    pd.testing.assert_frame_equal(pd.read_parquet(snapshot_file_path),
+                                  LoadAdvancedInfoCsv(csv_file_path, parse_scores=False), check_categorical=False)
+
+
+def test_dataset_is_partitioned_by_datenum(tmp_path, sample_rows):
+    dataset = str(tmp_path / 'dataset')
+    for datenum in (20250113, 20250114, 20250115):
+        ArchiveAdvancedInfoSnapshot(WriteSnapshot(tmp_path, datenum, sample_rows[:20]), 'feather', dataset)
+    # A later snapshot of a day replaces its partition.
+    ArchiveAdvancedInfoSnapshot(WriteSnapshot(tmp_path, 20250114, sample_rows[:5], suffix='-4.DLEVEL_ADVANCED_INFO.CSV'),
+                                'feather', dataset)
+
+    df = LoadSnapshotDataset(dataset, from_datenum=20250114)
+
+    assert df.groupby('DATENUM').size().to_dict() == {20250114: 5, 20250115: 20}
+    # The score values are parsed again when the dataset is loaded.
+    assert set(SCORE_VALUE_COLUMNS['QBS'] + SCORE_VALUE_COLUMNS['AGS']) <= set(df.columns)
+
+
+def test_disabled_format_writes_nothing(tmp_path, sample_rows):
+    csv_file_path = WriteSnapshot(tmp_path, 20250113, sample_rows[:5])
+
+    assert ArchiveAdvancedInfoSnapshot(csv_file_path, 'none', str(tmp_path / 'dataset')) is None
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(csv_file_path)]
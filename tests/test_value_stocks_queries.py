@@ -0,0 +1,68 @@
+import sqlite3
+import subprocess
+import sys
+
+from conftest import REPO_ROOT, WriteSnapshot
+from ImportValueStocksToSqlLite import OpenValueStocksDB, ImportValueStocksFiles
+from ValueStocksQueries import RebuildDailyChanges, GetDailyChanges
+
+FUNDAMENTALS = ['Great Financials', 'Good Financials', 'Moderate Financials', 'Poor Financials']
+
+
+def DailyChanges(conn):
+    return conn.execute("SELECT * FROM VS_DAILY_CHANGES ORDER BY IMPORT_DATE_ID, SYMBOL_ID").fetchall()
+
+
+def Shifted(rows, shift, every=1):
+    # Move the FUNDAMENTAL of every n-th row to the next grade, so consecutive days have transitions.
+    return [dict(row, FUNDAMENTAL=FUNDAMENTALS[(FUNDAMENTALS.index(row['FUNDAMENTAL']) + shift) % 4])
+            if index % every == 0 and row['FUNDAMENTAL'] in FUNDAMENTALS else row for index, row in enumerate(rows)]
+
+
+def ImportHistory(tmp_path, db_file_path, sample_rows):
+    rows = sample_rows[:30]
+    # Imported out of order: the oldest day is backfilled last, and the 16th is a delta holding only changed rows.
+    snapshots = [
+        WriteSnapshot(tmp_path, 20250114, rows),
+        WriteSnapshot(tmp_path, 20250115, Shifted(rows, 1, every=3)),
+        WriteSnapshot(tmp_path, 20250116, Shifted(rows, 2, every=5)[::5], suffix='-3.DLEVEL_ADVANCED_INFO_DELTA.CSV'),
+        WriteSnapshot(tmp_path, 20250113, Shifted(rows, 3, every=2)),
+    ]
+    conn, dimensionCache = OpenValueStocksDB(db_file_path)
+    for csv_file_path in snapshots:
+        ImportValueStocksFiles([csv_file_path], conn, dimensionCache)
+    return conn
+
+
+def test_incremental_refresh_matches_full_rebuild(tmp_path, value_stocks_db, sample_rows):
+    conn = ImportHistory(tmp_path, value_stocks_db, sample_rows)
+    try:
+        refreshed = DailyChanges(conn)
+        assert len(refreshed) > 0
+
+        RebuildDailyChanges(conn)
+        conn.commit()
+
+        assert DailyChanges(conn) == refreshed
+        assert {change['DATENUM'] for change in GetDailyChanges(conn)} == {20250114, 20250115, 20250116}
+    finally:
+        conn.close()
+
+
+def test_rebuild_changes_command_repairs_missing_transitions(tmp_path, value_stocks_db, sample_rows):
+    conn = ImportHistory(tmp_path, value_stocks_db, sample_rows)
+    try:
+        expected = DailyChanges(conn)
+        conn.execute("DELETE FROM VS_DAILY_CHANGES WHERE IMPORT_DATE_ID = (SELECT ID FROM VS_META_IMPORTDATE WHERE DATENUM = 20250115)")
+        conn.commit()
+    finally:
+        conn.close()
+
+    subprocess.run([sys.executable, 'ValueStocksQueries.py', '--db', value_stocks_db, 'rebuild-changes'],
+                   cwd=REPO_ROOT, check=True, capture_output=True)
+
+    conn = sqlite3.connect(value_stocks_db)
+    try:
+        assert DailyChanges(conn) == expected
+    finally:
+        conn.close()
@@ -0,0 +1,67 @@
+import pytest
+
+from AdvancedInfoSchema import LoadAdvancedInfoCsv
+from conftest import SAMPLE_SNAPSHOT
+from WatchlistScreens import DEFAULT_SCREENS, CompileScreen, EvaluateScreens, LoadWatchlistScreens, ScreenError
+
+
+@pytest.fixture(scope='module')
+def snapshot():
+    return LoadAdvancedInfoCsv(SAMPLE_SNAPSHOT)
+
+
+def Symbols(snapshot, mask):
+    return set(snapshot['SYMBOL'][mask].astype(str))
+
+
+def test_compile_screen():
+    assert CompileScreen("FUNDAMENTAL in (Great, 'Good') and not PLEDGE > 5 or mkcaptype != Micro Cap") == (
+        'or', (
+            ('and', (('predicate', 'FUNDAMENTAL', 'in', ('good', 'great')), ('not', ('predicate', 'PLEDGE', '>', ('5',))))),
+            ('not', ('predicate', 'MKCAPTYPE', 'in', ('micro cap',))),
+        ))
+    # == and in of a single value compile to the same predicate, so their masks are shared.
+    assert CompileScreen("VALUATION = Undervalued") == CompileScreen("valuation in ('Undervalued')")
+
+
+@pytest.mark.parametrize('expression', ["FUNDAMENTAL ==", "(PE > 5", "PE > 5 )", "PE 5", "FUNDAMENTAL in Great", "PE @ 5"])
+def test_invalid_screens_raise(expression):
+    with pytest.raises(ScreenError):
+        CompileScreen(expression)
+
+
+def test_default_watchlists_match_the_fundamental_column(snapshot):
+    masks = EvaluateScreens(snapshot, LoadWatchlistScreens(None))
+
+    assert list(masks) == list(DEFAULT_SCREENS)
+    fundamental = snapshot['FUNDAMENTAL'].astype(str)
+    for grade in ('Great', 'Good', 'Moderate', 'Poor'):
+        expected = set(snapshot['SYMBOL'][fundamental == grade + ' Financials'].astype(str))
+        assert expected and Symbols(snapshot, masks[grade + ' Fundamentals']) == expected
+    assert Symbols(snapshot, masks['Great and Good Fundamentals']) == (
+        Symbols(snapshot, masks['Great Fundamentals']) | Symbols(snapshot, masks['Good Fundamentals']))
+
+
+def test_numeric_and_text_predicates(snapshot):
+    masks = EvaluateScreens(snapshot, {
+        'Cheap': "PE > 0 and PE <= 10 and MKCAPTYPE != Micro Cap",
+        'Scored': "QBS_SCORE >= 8 and FUNDAMENTAL == great",
+    })
+
+    pe, cap = snapshot['PE'], snapshot['MKCAPTYPE'].astype(str)
+    assert Symbols(snapshot, masks['Cheap']) == set(snapshot['SYMBOL'][(pe > 0) & (pe <= 10) & (cap != 'Micro Cap')].astype(str))
+    scored = (snapshot['QBS_SCORE'] >= 8) & (snapshot['FUNDAMENTAL'].astype(str) == 'Great Financials')
+    assert Symbols(snapshot, masks['Scored']) == set(snapshot['SYMBOL'][scored].astype(str))
+
+
+def test_invalid_screens_are_skipped(snapshot):
+    masks = EvaluateScreens(snapshot, {'Unknown': "NOPE == 1", 'Text order': "SECTOR > Metals", 'Great': "FUNDAMENTAL == Great"})
+
+    assert list(masks) == ['Great']
+
+
+def test_screens_file(tmp_path):
+    screens_file = tmp_path / 'WatchlistScreens.txt'
+    screens_file.write_text("# Screens\n\nLow Pledge: PLEDGE < 1\nnot a screen\nGreat: FUNDAMENTAL == Great\n")
+
+    assert LoadWatchlistScreens(str(screens_file)) == {'Low Pledge': "PLEDGE < 1", 'Great': "FUNDAMENTAL == Great"}